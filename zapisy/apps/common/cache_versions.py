@@ -0,0 +1,35 @@
+"""Module cache_versions invalidates groups of cache entries together.
+
+The keys of the entries in a group contain its version, which is itself kept in
+the cache under a version key. Changing the version makes all the entries of
+the group unreachable at once. They are never deleted, but left to expire.
+"""
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def get(version_key: str) -> str:
+    """Returns the current version, setting it first if there is none."""
+    version = cache.get(version_key)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.add(version_key, version, None)
+        # Somebody else could have set it in the meantime.
+        version = cache.get(version_key, version)
+    return version
+
+
+def bump(*version_keys: str):
+    """Changes the versions, dropping the entries of their groups.
+
+    It is done right away and once again after the transaction commits, so
+    that nobody caches the old data in the meantime.
+    """
+    def set_versions():
+        cache.set_many({version_key: uuid.uuid4().hex for version_key in version_keys}, None)
+
+    if version_keys:
+        set_versions()
+        transaction.on_commit(set_versions)
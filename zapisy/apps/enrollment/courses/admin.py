@@ -60,7 +60,9 @@ class SemesterAdmin(admin.ModelAdmin):
             self.message_user(request, "Trzeba wybrać pojedynczy semestr!", level=messages.ERROR)
             return
         semester = queryset.get()
-        T0Times.populate_t0(semester)
+        # Only the changed T0's are written, the action may be used during the
+        # enrollment as well.
+        T0Times.populate_t0(semester, diff=True)
         GroupOpeningTimes.populate_opening_times(semester)
         self.message_user(request,
                           f"Obliczono czasy otwarcia zapisów dla semestru {semester}.",
@@ -0,0 +1,14 @@
+"""Django app config for enrollment.courses.
+
+(See https://docs.djangoproject.com/en/2.0/ref/applications/).
+"""
+
+from django.apps import AppConfig
+
+
+class CoursesConfig(AppConfig):
+    name = 'apps.enrollment.courses'
+
+    def ready(self):
+        from apps.enrollment.courses.models import catalog
+        catalog.connect_receivers()
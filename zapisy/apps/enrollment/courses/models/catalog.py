@@ -0,0 +1,99 @@
+"""Module catalog caches the course lists shown next to the timetables.
+
+The course pages and the prototype present all the courses of a semester
+together with the data for the course filter. Building it costs a `__json__()`
+per course and a few queries for the filter, while the data only changes when
+the staff edit the courses.
+
+The data of every semester is therefore kept in the cache, already serialized
+and compressed, together with an ETag computed from its content, so that the
+browser can revalidate its copy cheaply. The entries are invalidated together,
+by changing the version which is a part of their keys, whenever a course, a tag,
+an effect or a course type changes.
+"""
+import gzip
+import hashlib
+import json
+from typing import Callable, Dict, NamedTuple, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.urls import reverse
+
+from apps.common import cache_versions
+
+from .course_information import CourseInformation
+from .course_instance import CourseInstance
+from .course_type import Type
+from .effects import Effects
+from .tag import Tag
+
+VERSION_KEY = 'course-catalog-version'
+
+# The catalog of the course pages links the courses to their pages.
+COURSES = 'courses'
+# The catalog of the prototype links the courses to their groups' data.
+PROTOTYPE = 'prototype'
+
+COURSE_URLS: Dict[str, Callable[[CourseInstance], str]] = {
+    COURSES: lambda course: reverse('course-page', args=(course.slug,)),
+    PROTOTYPE: lambda course: reverse('prototype-get-course', args=(course.id,)),
+}
+
+
+class Catalog(NamedTuple):
+    etag: str
+    courses_json: str
+    filters_json: str
+    # Gzipped JSON object with keys `courses` and `filters`.
+    compressed: bytes
+
+
+def build_catalog(semester_id: Optional[int], kind: str) -> Catalog:
+    """Serializes the courses of the semester, bypassing the cache."""
+    qs = CourseInstance.objects.filter(semester_id=semester_id).order_by('name')
+    courses = []
+    for course in qs.prefetch_related('effects', 'tags'):
+        course_dict = course.__json__()
+        course_dict.update({
+            'url': COURSE_URLS[kind](course),
+        })
+        courses.append(course_dict)
+    courses_json = json.dumps(courses)
+    filters_json = json.dumps(CourseInstance.prepare_filter_data(qs))
+    body = f'{{"courses": {courses_json}, "filters": {filters_json}}}'.encode()
+    return Catalog(
+        etag=f'"{hashlib.sha1(body).hexdigest()}"',
+        courses_json=courses_json,
+        filters_json=filters_json,
+        compressed=gzip.compress(body),
+    )
+
+
+def get_catalog(semester_id: Optional[int], kind: str) -> Catalog:
+    """Returns the catalog of the semester from the cache or builds it."""
+    key = f'course-catalog:{kind}:{semester_id}:{cache_versions.get(VERSION_KEY)}'
+    catalog = cache.get(key)
+    if catalog is None:
+        catalog = build_catalog(semester_id, kind)
+        cache.set(key, tuple(catalog), settings.COURSE_CATALOG_CACHE_TIMEOUT)
+    return Catalog(*catalog)
+
+
+def invalidate(**kwargs):
+    """Drops the cached catalogs of all semesters."""
+    cache_versions.bump(VERSION_KEY)
+
+
+def connect_receivers():
+    """Invalidates the catalogs whenever their data changes.
+
+    Called when the app is ready (see `CoursesConfig`).
+    """
+    for model in (CourseInstance, Tag, Effects, Type):
+        post_save.connect(invalidate, sender=model, dispatch_uid=f'catalog-save-{model.__name__}')
+        post_delete.connect(invalidate, sender=model, dispatch_uid=f'catalog-delete-{model.__name__}')
+    m2m_changed.connect(invalidate, sender=CourseInformation.tags.through, dispatch_uid='catalog-tags')
+    m2m_changed.connect(
+        invalidate, sender=CourseInformation.effects.through, dispatch_uid='catalog-effects')
@@ -0,0 +1,57 @@
+import gzip
+import json
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from freezegun import freeze_time
+
+from apps.enrollment.courses.models import catalog
+from apps.enrollment.courses.models.tag import Tag
+from apps.enrollment.courses.tests.factories import CourseInstanceFactory
+from apps.users.tests.factories import StudentFactory
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CatalogTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cooking = CourseInstanceFactory(name="Gotowanie")
+        cls.semester = cls.cooking.semester
+        cls.student = StudentFactory()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cached_until_courses_change(self):
+        first = catalog.get_catalog(self.semester.pk, catalog.COURSES)
+        self.assertEqual([c['name'] for c in json.loads(first.courses_json)], ["Gotowanie"])
+        with self.assertNumQueries(0):
+            self.assertEqual(catalog.get_catalog(self.semester.pk, catalog.COURSES), first)
+
+        tag = Tag.objects.create(short_name="Kuch", full_name="Kuchnia")
+        self.cooking.tags.add(tag)
+        second = catalog.get_catalog(self.semester.pk, catalog.COURSES)
+        self.assertNotEqual(second.etag, first.etag)
+        self.assertEqual(json.loads(second.courses_json)[0]['tags'], [tag.pk])
+        self.assertEqual(json.loads(second.filters_json)['allTags'], {str(tag.pk): "Kuchnia"})
+
+    def test_endpoint_revalidates(self):
+        url = reverse('prototype-catalog')
+        with freeze_time(self.semester.records_opening):
+            # The session must not expire before the frozen date.
+            self.client.force_login(self.student.user)
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            data = json.loads(gzip.decompress(response.content))
+            self.assertEqual(data['courses'][0]['url'],
+                             reverse('prototype-get-course', args=(self.cooking.pk,)))
+
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+
+            # Without gzip support the payload is sent decompressed.
+            response = self.client.get(url)
+            self.assertEqual(json.loads(response.content), data)
@@ -1,13 +1,12 @@
 import csv
-import json
 from typing import Dict, Iterable, List, Optional, Tuple, TypedDict
 
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.http import Http404, HttpResponse
 from django.shortcuts import get_object_or_404, render
-from django.urls import reverse
 
+from apps.enrollment.courses.models import catalog
 from apps.enrollment.courses.models.course_instance import CourseInstance
 from apps.enrollment.courses.models.group import Group, GuaranteedSpots
 from apps.enrollment.courses.models.semester import Semester
@@ -26,21 +25,13 @@ class GroupData(TypedDict):
 
 def prepare_courses_list_data(semester: Optional[Semester]):
     """Returns a dict used by course list and filter in various views."""
-    qs = CourseInstance.objects.filter(semester=semester).order_by('name')
-    courses = []
-    for course in qs.prefetch_related('effects', 'tags'):
-        course_dict = course.__json__()
-        course_dict.update({
-            'url': reverse('course-page', args=(course.slug,)),
-        })
-        courses.append(course_dict)
-    filters_dict = CourseInstance.prepare_filter_data(qs)
+    courses = catalog.get_catalog(semester.pk if semester else None, catalog.COURSES)
     all_semesters = Semester.objects.filter(visible=True)
     return {
         'semester': semester,
         'all_semesters': all_semesters,
-        'courses_json': json.dumps(courses),
-        'filters_json': json.dumps(filters_dict),
+        'courses_json': courses.courses_json,
+        'filters_json': courses.filters_json,
     }
 
 
@@ -0,0 +1,224 @@
+"""Module admission protects the enrollment actions from overload.
+
+At the opening time every student clicks at once, and every enqueue and
+dequeue request goes straight to the database. Past some point the requests
+only compete for the database connections and all of them get slow. Instead,
+requests above the capacity are rejected early with a "busy, retry in N ms"
+response, which the timetable prototype honours by retrying later.
+
+Two limits are enforced by the `admission_control` view decorator:
+
+  * A global cap on the number of concurrently processed actions
+    (ADMISSION_MAX_CONCURRENT). A slot held by a process that died is freed
+    after SLOT_TIMEOUT.
+  * A token bucket per user: a burst of ADMISSION_BUCKET_SIZE actions is
+    allowed, and then ADMISSION_REFILL_RATE actions per second. The response
+    tells the user when the next token will be available.
+
+The slot is taken first, so that a user turned away because of the global cap
+does not lose a token.
+
+The same as with the queue index (see `queues.py`), when tasks run
+asynchronously (RUN_ASYNC) the state is stored in Redis, shared by all the web
+servers. Otherwise a local in-memory backend is used.
+"""
+import functools
+import math
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Tuple
+
+import django_rq
+from django.conf import settings
+from django.contrib import messages
+from django.http import JsonResponse
+from django.shortcuts import redirect
+
+from apps.enrollment.courses.models import Group
+
+# A slot not released for this long (in seconds) is considered abandoned.
+SLOT_TIMEOUT = 30
+
+
+class AdmissionBackend(ABC):
+
+    @abstractmethod
+    def take_token(self, user_id: int, now: float) -> float:
+        """Takes a token from the user's bucket.
+
+        Returns:
+            0 if the token has been taken. Otherwise the number of seconds
+            after which it will be available.
+        """
+        pass
+
+    @abstractmethod
+    def acquire_slot(self, now: float) -> Optional[str]:
+        """Takes one of the global slots. Returns None if all are taken."""
+        pass
+
+    @abstractmethod
+    def release_slot(self, slot: str) -> None:
+        pass
+
+
+class LocalAdmissionBackend(AdmissionBackend):
+    """Keeps the state in the memory of the process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # User id -> (tokens, time of the last update).
+        self._buckets: Dict[int, Tuple[float, float]] = {}
+        # Slot -> time of taking.
+        self._slots: Dict[str, float] = {}
+
+    def take_token(self, user_id: int, now: float) -> float:
+        capacity = settings.ADMISSION_BUCKET_SIZE
+        rate = settings.ADMISSION_REFILL_RATE
+        with self._lock:
+            tokens, updated = self._buckets.get(user_id, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                self._buckets[user_id] = (tokens - 1, now)
+                return 0
+            self._buckets[user_id] = (tokens, now)
+            return (1 - tokens) / rate
+
+    def acquire_slot(self, now: float) -> Optional[str]:
+        with self._lock:
+            for slot, taken in list(self._slots.items()):
+                if taken < now - SLOT_TIMEOUT:
+                    del self._slots[slot]
+            if len(self._slots) >= settings.ADMISSION_MAX_CONCURRENT:
+                return None
+            slot = uuid.uuid4().hex
+            self._slots[slot] = now
+            return slot
+
+    def release_slot(self, slot: str) -> None:
+        with self._lock:
+            self._slots.pop(slot, None)
+
+    def flush(self):
+        with self._lock:
+            self._buckets.clear()
+            self._slots.clear()
+
+
+class RedisAdmissionBackend(AdmissionBackend):
+    """Keeps the state in Redis, so it is shared by all the web servers.
+
+    Both operations are Lua scripts, so they are atomic.
+    """
+    SLOTS_KEY = 'enrollment:admission-slots'
+
+    TAKE_TOKEN_SCRIPT = """
+        local capacity = tonumber(ARGV[1])
+        local rate = tonumber(ARGV[2])
+        local now = tonumber(ARGV[3])
+        local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+        local tokens = tonumber(state[1]) or capacity
+        local updated = tonumber(state[2]) or now
+        tokens = math.min(capacity, tokens + (now - updated) * rate)
+        local wait = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+        else
+            wait = (1 - tokens) / rate
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+        redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+        return tostring(wait)
+    """
+
+    ACQUIRE_SLOT_SCRIPT = """
+        local capacity = tonumber(ARGV[1])
+        local now = tonumber(ARGV[2])
+        redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - tonumber(ARGV[3]))
+        if redis.call('ZCARD', KEYS[1]) >= capacity then
+            return 0
+        end
+        redis.call('ZADD', KEYS[1], now, ARGV[4])
+        return 1
+    """
+
+    def __init__(self, connection=None):
+        self.redis_client = connection or django_rq.get_connection()
+
+    @staticmethod
+    def _bucket_key(user_id: int) -> str:
+        return f'enrollment:admission-bucket#{user_id}'
+
+    def take_token(self, user_id: int, now: float) -> float:
+        wait = self.redis_client.eval(self.TAKE_TOKEN_SCRIPT, 1, self._bucket_key(user_id),
+                                      settings.ADMISSION_BUCKET_SIZE,
+                                      settings.ADMISSION_REFILL_RATE, now)
+        return float(wait)
+
+    def acquire_slot(self, now: float) -> Optional[str]:
+        slot = uuid.uuid4().hex
+        if self.redis_client.eval(self.ACQUIRE_SLOT_SCRIPT, 1, self.SLOTS_KEY,
+                                  settings.ADMISSION_MAX_CONCURRENT, now, SLOT_TIMEOUT, slot):
+            return slot
+        return None
+
+    def release_slot(self, slot: str) -> None:
+        self.redis_client.zrem(self.SLOTS_KEY, slot)
+
+
+_local_backend = LocalAdmissionBackend()
+
+
+def get_admission_backend() -> AdmissionBackend:
+    """Returns the backend appropriate for the current setting of RUN_ASYNC."""
+    if not settings.RUN_ASYNC:
+        return _local_backend
+    return RedisAdmissionBackend()
+
+
+def busy_response(request, retry_after: float):
+    """Asks the client to repeat the request after `retry_after` seconds.
+
+    The prototype sends JSON and gets back the status 429 with the delay in
+    milliseconds. Forms get redirected to the page of the group's course with a
+    message, as they are after the action.
+    """
+    retry_after_ms = max(1, math.ceil(retry_after * 1000))
+    if request.content_type != 'application/json':
+        messages.warning(request, "System jest w tej chwili przeciążony. "
+                         f"Spróbuj ponownie za {math.ceil(retry_after)} s.")
+        try:
+            slug = Group.objects.filter(pk=request.POST.get('group_id')).values_list(
+                'course__slug', flat=True).first()
+        except ValueError:
+            slug = None
+        if slug is None:
+            return redirect('course-list')
+        return redirect('course-page', slug=slug)
+    response = JsonResponse({'retry_after_ms': retry_after_ms}, status=429)
+    response['Retry-After'] = str(math.ceil(retry_after))
+    return response
+
+
+def admission_control(view):
+    """Rejects the request if the user or the whole system is over the limit.
+
+    The decorator must be applied after the authentication decorators.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        backend = get_admission_backend()
+        now = time.time()
+        slot = backend.acquire_slot(now)
+        if slot is None:
+            return busy_response(request, settings.ADMISSION_RETRY_MS / 1000)
+        try:
+            wait = backend.take_token(request.user.pk, now)
+            if wait > 0:
+                return busy_response(request, wait)
+            return view(request, *args, **kwargs)
+        finally:
+            backend.release_slot(slot)
+    return wrapper
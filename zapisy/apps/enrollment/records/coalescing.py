@@ -0,0 +1,116 @@
+"""Module coalescing merges repeated asynchronous jobs for the same object.
+
+During the enrollment opening the same group may change hundreds of times a
+minute. Every change used to put a separate job in the task queue, and the
+workers would then fight over the same row locks doing the same work. The
+coalescer keeps at most one pending or running job per key (i.e. group id).
+Triggers arriving in the meantime only mark the key as dirty. The running job
+will notice that and run once more, so no change is ever missed.
+
+The state is kept in Redis, which is shared by web servers and workers:
+
+  * `scheduled` key — set when the job is put into the task queue and deleted
+    when it finishes.
+  * `dirty` key — set by every trigger and cleared by the job right before it
+    starts the work.
+
+The counters (triggers, merged triggers, runs, re-runs) are kept in a Redis
+hash and can be displayed with `manage.py coalescing_stats`.
+"""
+from typing import Any, Callable, Dict
+
+import django_rq
+
+
+class JobCoalescer:
+    # Protects against a worker dying in the middle of the job. After that time
+    # a new job will be scheduled even if the old one has not finished.
+    SCHEDULED_TTL = 10 * 60
+
+    def __init__(self, name: str, connection=None):
+        self.name = name
+        self._connection = connection
+
+    @property
+    def redis_client(self):
+        # The connection is established lazily, so that the module can be
+        # imported without Redis.
+        if self._connection is None:
+            self._connection = django_rq.get_connection()
+        return self._connection
+
+    def _scheduled_key(self, key: int) -> str:
+        return f'coalescing:{self.name}:scheduled#{key}'
+
+    def _dirty_key(self, key: int) -> str:
+        return f'coalescing:{self.name}:dirty#{key}'
+
+    def _stats_key(self) -> str:
+        return f'coalescing:{self.name}:stats'
+
+    def _merged_by_key_key(self) -> str:
+        return f'coalescing:{self.name}:merged'
+
+    def trigger(self, key: int, enqueue: Callable[[], Any]) -> bool:
+        """Notes a change of the object and schedules the job if necessary.
+
+        Returns:
+            True if `enqueue` has been called. False means that the trigger has
+            been merged into a job already pending or running.
+        """
+        pipe = self.redis_client.pipeline()
+        pipe.set(self._dirty_key(key), 1, ex=self.SCHEDULED_TTL)
+        pipe.hincrby(self._stats_key(), 'triggers')
+        pipe.execute()
+        if self.redis_client.set(self._scheduled_key(key), 1, nx=True, ex=self.SCHEDULED_TTL):
+            enqueue()
+            return True
+        pipe = self.redis_client.pipeline()
+        pipe.hincrby(self._stats_key(), 'merged')
+        pipe.hincrby(self._merged_by_key_key(), str(key))
+        pipe.execute()
+        return False
+
+    def run(self, key: int, work: Callable[[], Any]):
+        """Runs the job's work as long as the object keeps changing.
+
+        Must be called by the job scheduled with `trigger`.
+        """
+        self.redis_client.hincrby(self._stats_key(), 'runs')
+        while True:
+            self.redis_client.delete(self._dirty_key(key))
+            try:
+                work()
+            except Exception:
+                self.redis_client.delete(self._scheduled_key(key))
+                raise
+            if self.redis_client.exists(self._dirty_key(key)):
+                self.redis_client.hincrby(self._stats_key(), 'reruns')
+                continue
+            self.redis_client.delete(self._scheduled_key(key))
+            # A trigger could have arrived after the check above, but before
+            # the job was marked finished. It has not scheduled a new job then,
+            # so we must take care of it ourselves (unless another trigger has
+            # already scheduled one).
+            if self.redis_client.exists(self._dirty_key(key)) and self.redis_client.set(
+                    self._scheduled_key(key), 1, nx=True, ex=self.SCHEDULED_TTL):
+                self.redis_client.hincrby(self._stats_key(), 'reruns')
+                continue
+            return
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the counters: triggers, merged, runs and reruns."""
+        stats = {'triggers': 0, 'merged': 0, 'runs': 0, 'reruns': 0}
+        for field, value in self.redis_client.hgetall(self._stats_key()).items():
+            stats[field.decode()] = int(value)
+        return stats
+
+    def merged_by_key(self) -> Dict[int, int]:
+        """Returns the number of merged triggers for every key."""
+        return {
+            int(key): int(value)
+            for key, value in self.redis_client.hgetall(self._merged_by_key_key()).items()
+        }
+
+    def reset_stats(self):
+        self.redis_client.delete(self._stats_key(), self._merged_by_key_key())
@@ -0,0 +1,161 @@
+"""Module locks serializes the changes of records with advisory locks.
+
+Pulling students into a group used to lock every non-removed record of the
+group, and then every record of the pulled student, with `SELECT ... FOR
+UPDATE`. Two pullers could then lock the same rows in a different order and
+deadlock, which Postgres resolves by killing one of the transactions.
+
+Instead, the changes are serialized with Postgres transaction-level advisory
+locks. They are held until the transaction ends:
+
+  * a group lock — taken by the function pulling students into the group (or
+    syncing an auto-enrollment group). Only one transaction may decide about
+    the group's free spots at a time;
+  * a student lock — taken before any record of the student changes status.
+    Only one transaction may decide about the student's enrollment (ECTS
+    limit, parallel groups) at a time.
+
+A transaction takes at most one group lock, and takes it before any student
+lock. Student locks are taken in the order of student ids: if a transaction
+already holds a lock of a student with a greater id, it may only try to take
+the lock without waiting. If that fails, the caller must commit what it has
+done so far and start over. The waits for advisory locks are therefore always
+in the same order. The row locks of the group counters, taken when the records
+change, are acquired in the order of group ids by a single
+`GroupRecordCounts.refresh` per change (see `Record.enroll_or_remove`), so they
+cannot deadlock either.
+
+Waiting for a lock is counted. The number of waits and the total wait time per
+group can be displayed with `manage.py lock_stats`. The counters are kept in
+Redis when tasks run asynchronously (RUN_ASYNC), and in memory otherwise.
+"""
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional, Set, Tuple
+
+import django_rq
+from django.conf import settings
+from django.db import connection
+
+# The first key of the two-key advisory locks, distinguishing them from locks
+# possibly taken by other applications sharing the database.
+GROUP_LOCK_NAMESPACE = 7301
+STUDENT_LOCK_NAMESPACE = 7302
+
+
+class LocalLockStats:
+    """Keeps the lock wait counters in memory of the process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waits: Counter = Counter()
+        self._wait_time: Counter = Counter()
+
+    def record(self, group_id: int, seconds: float):
+        with self._lock:
+            self._waits[group_id] += 1
+            self._wait_time[group_id] += seconds
+
+    def stats(self) -> Dict[int, Tuple[int, float]]:
+        """Returns the number of waits and the total wait time by group id."""
+        with self._lock:
+            return {
+                group_id: (waits, self._wait_time[group_id])
+                for group_id, waits in self._waits.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._waits.clear()
+            self._wait_time.clear()
+
+
+class RedisLockStats:
+    """Keeps the lock wait counters in Redis, shared by all the processes."""
+    WAITS_KEY = 'enrollment:lock-waits'
+    WAIT_TIME_KEY = 'enrollment:lock-wait-time'
+
+    def __init__(self, connection=None):
+        self.redis_client = connection or django_rq.get_connection()
+
+    def record(self, group_id: int, seconds: float):
+        pipe = self.redis_client.pipeline()
+        pipe.hincrby(self.WAITS_KEY, str(group_id))
+        pipe.hincrbyfloat(self.WAIT_TIME_KEY, str(group_id), seconds)
+        pipe.execute()
+
+    def stats(self) -> Dict[int, Tuple[int, float]]:
+        """Returns the number of waits and the total wait time by group id."""
+        wait_time = self.redis_client.hgetall(self.WAIT_TIME_KEY)
+        return {
+            int(group_id): (int(waits), float(wait_time.get(group_id, 0)))
+            for group_id, waits in self.redis_client.hgetall(self.WAITS_KEY).items()
+        }
+
+    def reset(self):
+        self.redis_client.delete(self.WAITS_KEY, self.WAIT_TIME_KEY)
+
+
+_local_stats = LocalLockStats()
+
+
+def get_lock_stats():
+    """Returns the counters appropriate for the current setting of RUN_ASYNC."""
+    if not settings.RUN_ASYNC:
+        return _local_stats
+    return RedisLockStats()
+
+
+class TransactionLocks:
+    """Advisory locks taken in the current transaction.
+
+    An instance must be created inside the transaction and must not outlive
+    it: the locks are released by Postgres when the transaction ends.
+    """
+
+    def __init__(self):
+        self.group_id: Optional[int] = None
+        self.student_ids: Set[int] = set()
+        # Set when a student lock could not be taken without risking a
+        # deadlock. The holder should then commit and start over.
+        self.conflict = False
+
+    def _acquire(self, namespace: int, key: int, wait: bool) -> bool:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_try_advisory_xact_lock(%s, %s)', [namespace, key])
+            if cursor.fetchone()[0]:
+                return True
+            if not wait:
+                return False
+            start = time.perf_counter()
+            cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [namespace, key])
+            get_lock_stats().record(self.group_id or 0, time.perf_counter() - start)
+            return True
+
+    def lock_group(self, group_id: int):
+        """Waits for the lock of the group.
+
+        It must be the first lock taken in the transaction.
+        """
+        if self.group_id == group_id:
+            return
+        assert self.group_id is None and not self.student_ids, "The group lock must go first."
+        self.group_id = group_id
+        self._acquire(GROUP_LOCK_NAMESPACE, group_id, wait=True)
+
+    def lock_student(self, student_id: int) -> bool:
+        """Takes the lock of the student.
+
+        Returns:
+            False if the lock is held by another transaction and waiting for it
+            could cause a deadlock. The `conflict` flag is then set.
+        """
+        if student_id in self.student_ids:
+            return True
+        wait = not self.student_ids or student_id > max(self.student_ids)
+        if not self._acquire(STUDENT_LOCK_NAMESPACE, student_id, wait=wait):
+            self.conflict = True
+            return False
+        self.student_ids.add(student_id)
+        return True
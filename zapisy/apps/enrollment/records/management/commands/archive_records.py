@@ -0,0 +1,30 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.enrollment.courses.models.semester import Semester
+from apps.enrollment.records.models import ArchivedRecord
+
+
+class Command(BaseCommand):
+    help = "Moves the REMOVED records of semesters with closed enrollment to the archive."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--semester", type=int,
+                            help="Semester id (all the closed semesters by default)")
+        parser.add_argument("--batch-size", type=int, default=ArchivedRecord.BATCH_SIZE)
+
+    def handle(self, *args, **kwargs):
+        if kwargs["semester"] is not None:
+            semesters = Semester.objects.filter(pk=kwargs["semester"])
+            if not semesters:
+                raise CommandError("Semester not found.")
+        else:
+            semesters = Semester.objects.filter(records_closing__lte=datetime.now())
+        for semester in semesters:
+            try:
+                num_archived = ArchivedRecord.archive_semester(
+                    semester, batch_size=kwargs["batch_size"])
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(f"Semester {semester}: {num_archived} records archived.")
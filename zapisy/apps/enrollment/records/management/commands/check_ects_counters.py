@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.enrollment.courses.models.semester import Semester
+from apps.enrollment.records.models import StudentSemesterPoints
+
+
+class Command(BaseCommand):
+    help = "Compares the materialized ECTS totals of students with their records."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--semester", type=int,
+                            help="Semester id (the upcoming semester by default)")
+        parser.add_argument("--fix", action="store_true", help="Recompute the wrong counters")
+
+    def handle(self, *args, **kwargs):
+        if kwargs["semester"] is not None:
+            semester = Semester.objects.filter(pk=kwargs["semester"]).first()
+        else:
+            semester = Semester.get_upcoming_semester()
+        if semester is None:
+            raise CommandError("Semester not found.")
+        stored = dict(
+            StudentSemesterPoints.objects.filter(semester=semester).values_list(
+                'student_id', 'points'))
+        # A missing counter is not an error, it will be computed when needed.
+        actual = StudentSemesterPoints.compute(stored.keys(), semester.pk)
+        wrong = sorted(
+            student_id for student_id, points in stored.items() if actual[student_id] != points)
+        for student_id in wrong:
+            self.stdout.write(
+                f"Student {student_id}: counter {stored[student_id]}, records {actual[student_id]}")
+        self.stdout.write(
+            f"Semester {semester}: {len(stored)} counters checked, {len(wrong)} inconsistent.")
+        if kwargs["fix"] and wrong:
+            StudentSemesterPoints.refresh(wrong, semester.pk)
+            self.stdout.write("Inconsistent counters recomputed.")
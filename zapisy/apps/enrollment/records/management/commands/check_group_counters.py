@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.enrollment.courses.models.semester import Semester
+from apps.enrollment.records.models import GroupRecordCounts
+
+
+class Command(BaseCommand):
+    help = "Compares the materialized numbers of students in groups with their records."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--semester", type=int,
+                            help="Semester id (the upcoming semester by default)")
+        parser.add_argument("--fix", action="store_true", help="Recompute the wrong counters")
+
+    def handle(self, *args, **kwargs):
+        if kwargs["semester"] is not None:
+            semester = Semester.objects.filter(pk=kwargs["semester"]).first()
+        else:
+            semester = Semester.get_upcoming_semester()
+        if semester is None:
+            raise CommandError("Semester not found.")
+        stored = {
+            group_id: {'num_enrolled': num_enrolled, 'num_enqueued': num_enqueued}
+            for group_id, num_enrolled, num_enqueued in GroupRecordCounts.objects.filter(
+                group__course__semester=semester).values_list(
+                    'group_id', 'num_enrolled', 'num_enqueued')
+        }
+        # A missing counter is not an error, it will be computed when needed.
+        actual = GroupRecordCounts.compute(stored.keys())
+        wrong = sorted(group_id for group_id, counts in stored.items() if actual[group_id] != counts)
+        for group_id in wrong:
+            self.stdout.write(
+                f"Group {group_id}: counter {stored[group_id]['num_enrolled']} enrolled, "
+                f"{stored[group_id]['num_enqueued']} enqueued; records "
+                f"{actual[group_id]['num_enrolled']} enrolled, "
+                f"{actual[group_id]['num_enqueued']} enqueued")
+        self.stdout.write(
+            f"Semester {semester}: {len(stored)} counters checked, {len(wrong)} inconsistent.")
+        if kwargs["fix"] and wrong:
+            GroupRecordCounts.refresh(wrong)
+            self.stdout.write("Inconsistent counters recomputed.")
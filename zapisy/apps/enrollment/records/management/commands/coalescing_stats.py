@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from apps.enrollment.records.tasks import group_changes
+
+
+class Command(BaseCommand):
+    help = "Shows how many group change triggers have been merged into running jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=10,
+                            help="Number of groups with most merged triggers to list")
+        parser.add_argument("--reset", action="store_true", help="Reset the counters")
+
+    def handle(self, *args, **kwargs):
+        stats = group_changes.stats()
+        self.stdout.write(
+            f"Triggers: {stats['triggers']}, merged: {stats['merged']}, "
+            f"jobs run: {stats['runs']}, re-runs: {stats['reruns']}")
+        merged_by_group = sorted(
+            group_changes.merged_by_key().items(), key=lambda item: item[1], reverse=True)
+        for group_id, merged in merged_by_group[:kwargs["top"]]:
+            self.stdout.write(f"   Group {group_id}: {merged} merged")
+        if kwargs["reset"]:
+            group_changes.reset_stats()
+            self.stdout.write("Counters reset.")
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.enrollment.courses.models.group import Group
+from apps.enrollment.courses.models.semester import Semester
+from apps.enrollment.records.models import RecordEvent
+
+# Upper bounds (in seconds) of the histogram buckets.
+BUCKETS = [1, 10, 60, 600, 3600, 6 * 3600, 24 * 3600, 7 * 24 * 3600]
+
+
+def bucket_label(upper: int) -> str:
+    for unit, seconds in [("d", 24 * 3600), ("h", 3600), ("min", 60)]:
+        if upper >= seconds:
+            return f"<{upper // seconds}{unit}"
+    return f"<{upper}s"
+
+
+class Command(BaseCommand):
+    help = "Shows histograms of the time from enqueuing to enrolling, per group."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--semester", type=int,
+                            help="Semester id (the upcoming semester by default)")
+        parser.add_argument("--group", type=int, action="append",
+                            help="Only this group (may be given many times)")
+
+    def handle(self, *args, **kwargs):
+        if kwargs["group"]:
+            group_ids = kwargs["group"]
+        else:
+            if kwargs["semester"] is not None:
+                semester = Semester.objects.filter(pk=kwargs["semester"]).first()
+            else:
+                semester = Semester.get_upcoming_semester()
+            if semester is None:
+                raise CommandError("Semester not found.")
+            group_ids = Group.objects.filter(course__semester=semester).values_list('pk', flat=True)
+        delays = RecordEvent.enrollment_delays(group_ids)
+        for group_id in sorted(delays):
+            group_delays = delays[group_id]
+            counts = [0] * (len(BUCKETS) + 1)
+            for delay in group_delays:
+                counts[next((i for i, upper in enumerate(BUCKETS) if delay < upper),
+                            len(BUCKETS))] += 1
+            histogram = ", ".join(
+                f"{label}: {count}" for label, count in zip(
+                    [bucket_label(upper) for upper in BUCKETS] + ["more"], counts) if count)
+            self.stdout.write(
+                f"Group {group_id}: {len(group_delays)} enrolled from the queue, "
+                f"median {sorted(group_delays)[len(group_delays) // 2]:.0f}s; {histogram}")
+        self.stdout.write(f"{len(delays)} groups with students enrolled from the queue.")
@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = ("Builds a synthetic semester and replays a storm of concurrent enrollment actions. "
+            "Reports throughput, latencies, transaction retries and the final invariants.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--students", type=int, default=2000)
+        parser.add_argument("--courses", type=int, default=100)
+        parser.add_argument("--groups-per-course", type=int, default=4)
+        parser.add_argument("--actions", type=int, default=5000,
+                            help="Number of enqueue/dequeue/priority requests to send")
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--keep", action="store_true",
+                            help="Do not remove the synthetic semester afterwards")
+        parser.add_argument("--cleanup", action="store_true",
+                            help="Only remove the data left by previous runs")
+        parser.add_argument("--force", action="store_true",
+                            help="Run even if DEBUG is off")
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options["force"]:
+            raise CommandError("The load test creates thousands of users. "
+                               "Run it on a development database or pass --force.")
+        # The harness is built on the test factories, which are only installed
+        # in development environments.
+        from apps.enrollment.records.tests import loadgen
+
+        if options["cleanup"]:
+            loadgen.cleanup()
+            self.stdout.write("Synthetic semesters removed.")
+            return
+
+        self.stdout.write("Generating the semester...")
+        synthetic = loadgen.generate_semester(
+            num_students=options["students"], num_courses=options["courses"],
+            groups_per_course=options["groups_per_course"], seed=options["seed"])
+        self.stdout.write(
+            f"Semester {synthetic.semester.pk}: {len(synthetic.students)} students, "
+            f"{len(synthetic.groups)} groups, {len(synthetic.auto_groups)} auto-enrollment groups.")
+        try:
+            report = loadgen.run_storm(synthetic, num_actions=options["actions"],
+                                       num_threads=options["threads"], seed=options["seed"])
+            for line in loadgen.format_report(report):
+                self.stdout.write(line)
+        finally:
+            if not options["keep"]:
+                loadgen.cleanup(synthetic.semester)
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from apps.enrollment.records.locks import get_lock_stats
+
+
+class Command(BaseCommand):
+    help = "Shows how often and how long the enrollment waited for the group and student locks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=10,
+                            help="Number of groups with the longest waits to list")
+        parser.add_argument("--reset", action="store_true", help="Reset the counters")
+
+    def handle(self, *args, **kwargs):
+        lock_stats = get_lock_stats()
+        stats = lock_stats.stats()
+        total_waits = sum(waits for waits, _ in stats.values())
+        total_time = sum(wait_time for _, wait_time in stats.values())
+        self.stdout.write(f"Lock waits: {total_waits}, total wait time: {total_time:.3f}s")
+        by_time = sorted(stats.items(), key=lambda item: item[1][1], reverse=True)
+        for group_id, (waits, wait_time) in by_time[:kwargs["top"]]:
+            # Waits outside of pulling into a group are counted under 0.
+            name = f"Group {group_id}" if group_id else "Outside of groups"
+            self.stdout.write(f"   {name}: {waits} waits, {wait_time:.3f}s")
+        if kwargs["reset"]:
+            lock_stats.reset()
+            self.stdout.write("Counters reset.")
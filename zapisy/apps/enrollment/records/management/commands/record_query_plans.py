@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = ("Builds a synthetic semester with many records and runs EXPLAIN ANALYZE on the "
+            "queries reading the records. Fails if any of them scans the whole table.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--students", type=int, default=5000)
+        parser.add_argument("--courses", type=int, default=100)
+        parser.add_argument("--groups-per-course", type=int, default=4)
+        parser.add_argument("--records-per-student", type=int, default=15)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--keep", action="store_true",
+                            help="Do not remove the synthetic semester afterwards")
+        parser.add_argument("--force", action="store_true",
+                            help="Run even if DEBUG is off")
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options["force"]:
+            raise CommandError("The benchmark creates thousands of users. "
+                               "Run it on a development database or pass --force.")
+        # The harness is built on the test factories, which are only installed
+        # in development environments.
+        from apps.enrollment.records.tests import loadgen, query_plans
+
+        self.stdout.write("Generating the semester...")
+        synthetic = loadgen.generate_semester(
+            num_students=options["students"], num_courses=options["courses"],
+            groups_per_course=options["groups_per_course"], seed=options["seed"])
+        try:
+            query_plans.generate_records(synthetic, per_student=options["records_per_student"],
+                                         seed=options["seed"])
+            report = query_plans.check_plans(synthetic, analyze=True)
+            for line in query_plans.format_report(report):
+                self.stdout.write(line)
+        finally:
+            if not options["keep"]:
+                loadgen.cleanup(synthetic.semester)
+        if report.regressions:
+            raise CommandError(f"{len(report.regressions)} queries scan the whole records table.")
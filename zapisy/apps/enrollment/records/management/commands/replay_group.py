@@ -0,0 +1,25 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.enrollment.records.models import RecordEvent
+
+
+class Command(BaseCommand):
+    help = "Reconstructs the students of a group at the given moment from the record event log."
+
+    def add_arguments(self, parser):
+        parser.add_argument("group", type=int, help="Group id")
+        parser.add_argument("--at", type=datetime.fromisoformat,
+                            help="Moment in ISO format, e.g. 2021-02-15T10:00:00 (now by default)")
+
+    def handle(self, *args, **kwargs):
+        time = kwargs["at"] or datetime.now()
+        if not RecordEvent.objects.filter(group_id=kwargs["group"]).exists():
+            raise CommandError("No events for this group.")
+        state = RecordEvent.replay_group(kwargs["group"], time)
+        self.stdout.write(f"Group {state.group_id} at {state.time}:")
+        self.stdout.write(f"   Enrolled ({len(state.enrolled)}): "
+                          f"{', '.join(str(s) for s in state.enrolled)}")
+        self.stdout.write(f"   Queued ({len(state.queued)}): "
+                          f"{', '.join(str(s) for s in state.queued)}")
@@ -0,0 +1,50 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.enrollment.courses.models.semester import Semester
+from apps.enrollment.records.models import QueueResolution
+
+
+class Command(BaseCommand):
+    help = "Schedules or runs the resolution of all the queues of a semester at once."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--semester", type=int,
+                            help="Semester id (the upcoming semester by default)")
+        parser.add_argument("--schedule", type=datetime.fromisoformat,
+                            help="Hold the pullers of the semester and resolve its queues at this "
+                                 "moment (ISO format, e.g. 2021-02-15T10:00:00)")
+        parser.add_argument("--now", action="store_true",
+                            help="Resolve the semester's queues now, even if scheduled later")
+
+    def handle(self, *args, **kwargs):
+        if kwargs["schedule"] is None and not kwargs["now"]:
+            # Meant to be run by cron every minute.
+            reports = QueueResolution.resolve_due()
+        else:
+            if kwargs["semester"] is not None:
+                semester = Semester.objects.filter(pk=kwargs["semester"]).first()
+            else:
+                semester = Semester.get_upcoming_semester()
+            if semester is None:
+                raise CommandError("Semester not found.")
+            if kwargs["schedule"] is not None:
+                QueueResolution.objects.update_or_create(
+                    semester=semester,
+                    defaults={'time': kwargs["schedule"], 'resolved_at': None})
+                self.stdout.write(f"Queues of {semester} will be resolved at {kwargs['schedule']}.")
+                return
+            resolution = QueueResolution.objects.filter(semester=semester).first()
+            if resolution is None:
+                resolution = QueueResolution.objects.create(semester=semester, time=datetime.now())
+            try:
+                reports = {semester: resolution.resolve()}
+            except ValueError as e:
+                raise CommandError(str(e))
+        for semester, report in reports.items():
+            self.stdout.write(
+                f"Semester {semester}: {report.num_enrolled} of {report.num_queued} queued records "
+                f"enrolled, {report.num_removed} removed from parallel groups, "
+                f"{report.num_over_limit} over the ECTS limit; {report.rounds} rounds, "
+                f"{report.seconds:.2f}s.")
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.enrollment.courses.models.group import Group
+from apps.enrollment.courses.models.semester import Semester
+from apps.enrollment.records.models import Record
+
+
+class Command(BaseCommand):
+    help = "Recomputes the records of all auto-enrollment groups of the semester."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--semester", type=int,
+                            help="Semester id (the upcoming semester by default)")
+
+    def handle(self, *args, **kwargs):
+        if kwargs["semester"] is not None:
+            semester = Semester.objects.filter(pk=kwargs["semester"]).first()
+        else:
+            semester = Semester.get_upcoming_semester()
+        if semester is None:
+            raise CommandError("Semester not found.")
+        # Changes of single students keep the groups in sync. This fixes the
+        # groups after any other changes (e.g. records edited by hand).
+        group_ids = Group.objects.filter(
+            course__semester=semester, auto_enrollment=True).values_list('pk', flat=True)
+        for group_id in group_ids:
+            Record.update_records_in_auto_enrollment_group(group_id)
+        self.stdout.write(f"Semester {semester}: {len(group_ids)} auto-enrollment groups synced.")
@@ -0,0 +1,157 @@
+"""Module matching assigns queued students to groups all at once.
+
+When the enrollment opens, the queues are normally emptied by independent
+pullers, one per group. The outcome then depends on the order in which the
+workers run, and students queued into parallel groups are moved back and forth
+between them. This module computes the whole assignment of a semester in
+memory instead (see `QueueResolution` for loading the data and applying the
+result).
+
+The assignment is computed with deferred acceptance (the Gale-Shapley
+algorithm). Every student applies separately for every slot: a group type of a
+course (e.g. the exercises of Cooking). The groups of a slot are tried in the
+order of the student's priorities (higher first), ties broken by the order of
+enqueuing. Every group tentatively holds the best applicants, in the order of
+its queue (`created`, then record id), as long as it has free spots. A student
+having a role of the group's guaranteed spots takes such a spot first, the same
+as the puller does. Applicants pushed out of a group apply for the next group
+on their list.
+
+The ECTS limit ties the slots of different courses together, so it is checked
+after the matching has settled. A student over the limit loses the places taken
+with the most recently created records (these records are removed, as the
+puller would remove them) and the matching is run again, until nobody is over
+the limit.
+"""
+from collections import defaultdict
+from datetime import datetime
+from typing import DefaultDict, Dict, FrozenSet, Iterable, List, NamedTuple, Set, Tuple
+
+from apps.enrollment.records import queues
+
+# A group type of a course: (course_id, group_type).
+Slot = Tuple[int, int]
+
+
+class QueuedRecord(NamedTuple):
+    id: int
+    student_id: int
+    group_id: int
+    priority: int
+    created: datetime
+
+
+class GroupInfo(NamedTuple):
+    slot: Slot
+    # Free spots by role, as returned by `Record.free_spots_by_role_in_groups`.
+    free_spots: Dict[str, int]
+    # The roles of the guaranteed spots, in the order of the rules.
+    roles: List[str]
+    points: int
+
+
+class Matching(NamedTuple):
+    # Records whose students get places in their groups.
+    enrolled: Set[int]
+    # Records removed, because the student would exceed the ECTS limit.
+    over_limit: Set[int]
+    # Number of times deferred acceptance has been run.
+    rounds: int
+
+
+def _queue_key(record: QueuedRecord):
+    return record.created, record.id
+
+
+def _accept(group: GroupInfo, applicants: List[QueuedRecord],
+            student_roles: Dict[int, FrozenSet[str]]) -> Tuple[List[QueuedRecord], List[QueuedRecord]]:
+    """Splits the applicants of the group into accepted and rejected ones."""
+    free_spots = dict(group.free_spots)
+    accepted = []
+    rejected = []
+    for record in sorted(applicants, key=_queue_key):
+        roles = student_roles.get(record.student_id, frozenset())
+        role_taken = next(
+            (r for r in group.roles if r in roles and free_spots.get(r, 0) > 0), queues.ALL)
+        if free_spots.get(role_taken, 0) > 0:
+            free_spots[role_taken] -= 1
+            accepted.append(record)
+        else:
+            rejected.append(record)
+    return accepted, rejected
+
+
+def _deferred_acceptance(preferences: Dict[Tuple[int, Slot], List[QueuedRecord]],
+                         groups: Dict[int, GroupInfo],
+                         student_roles: Dict[int, FrozenSet[str]]) -> Dict[int, QueuedRecord]:
+    """Runs the matching. Returns the accepted records by group."""
+    next_choice = {key: 0 for key in preferences}
+    held: DefaultDict[int, List[QueuedRecord]] = defaultdict(list)
+    pending = list(preferences)
+    while pending:
+        proposals: DefaultDict[int, List[QueuedRecord]] = defaultdict(list)
+        for key in pending:
+            choices = preferences[key]
+            if next_choice[key] < len(choices):
+                record = choices[next_choice[key]]
+                proposals[record.group_id].append(record)
+        pending = []
+        for group_id, new_applicants in proposals.items():
+            accepted, rejected = _accept(groups[group_id], held[group_id] + new_applicants,
+                                         student_roles)
+            held[group_id] = accepted
+            for record in rejected:
+                key = (record.student_id, groups[group_id].slot)
+                next_choice[key] += 1
+                pending.append(key)
+    return {record.id: record for accepted in held.values() for record in accepted}
+
+
+def match(records: Iterable[QueuedRecord], groups: Dict[int, GroupInfo],
+          student_roles: Dict[int, FrozenSet[str]], student_points: Dict[int, int],
+          counted_courses: Set[Tuple[int, int]], ects_limit: int) -> Matching:
+    """Computes the assignment of the queued records.
+
+    Args:
+        records: QUEUED records in the groups being resolved. Records of a
+            student who already applied for the group are skipped.
+        student_roles: The names of the students' roles (user groups).
+        student_points: The ECTS the students already have in the semester.
+        counted_courses: Pairs (student_id, course_id) of the courses already
+            counted in the students' points.
+    """
+    preferences: DefaultDict[Tuple[int, Slot], List[QueuedRecord]] = defaultdict(list)
+    for record in sorted(records, key=_queue_key):
+        key = (record.student_id, groups[record.group_id].slot)
+        if all(r.group_id != record.group_id for r in preferences[key]):
+            preferences[key].append(record)
+    for choices in preferences.values():
+        # The sort is stable, so the queue order breaks the ties.
+        choices.sort(key=lambda r: -r.priority)
+
+    over_limit: Set[int] = set()
+    rounds = 0
+    while True:
+        rounds += 1
+        enrolled = _deferred_acceptance(preferences, groups, student_roles)
+        new_courses: DefaultDict[int, Dict[int, QueuedRecord]] = defaultdict(dict)
+        for record in sorted(enrolled.values(), key=_queue_key):
+            course_id = groups[record.group_id].slot[0]
+            if (record.student_id, course_id) not in counted_courses:
+                new_courses[record.student_id].setdefault(course_id, record)
+        dropped = set()
+        for student_id, by_course in new_courses.items():
+            points = student_points.get(student_id, 0)
+            # The courses are kept in the order the student has enqueued into
+            # them, the same as the pullers would most likely enroll him.
+            for record in by_course.values():
+                course_points = groups[record.group_id].points
+                if points + course_points > ects_limit:
+                    dropped.add(record.id)
+                else:
+                    points += course_points
+        if not dropped:
+            return Matching(set(enrolled), over_limit, rounds)
+        over_limit |= dropped
+        for key, choices in preferences.items():
+            preferences[key] = [r for r in choices if r.id not in dropped]
@@ -0,0 +1,28 @@
+# Generated by Django 3.1.14 on 2026-10-18 09:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0036_auto_20211022_1641'),
+        ('users', '0024_auto_20201029_1347'),
+        ('records', '0011_auto_20201106_2029'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentSemesterPoints',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('points', models.PositiveSmallIntegerField(default=0)),
+                ('semester', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='courses.semester')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='users.student')),
+            ],
+            options={
+                'unique_together': {('student', 'semester')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.1.14 on 2026-10-18 09:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0036_auto_20211022_1641'),
+        ('records', '0012_studentsemesterpoints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='t0times',
+            name='modified',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.CreateModel(
+            name='OpeningTimesWatermark',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('computed_at', models.DateTimeField(null=True)),
+                ('semester', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='courses.semester')),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.1.14 on 2026-10-18 09:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0036_auto_20211022_1641'),
+        ('records', '0013_opening_times_watermark'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupRecordCounts',
+            fields=[
+                ('group', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='courses.group')),
+                ('num_enrolled', models.PositiveIntegerField(default=0)),
+                ('num_enqueued', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
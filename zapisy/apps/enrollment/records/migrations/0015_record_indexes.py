@@ -0,0 +1,29 @@
+# Generated by Django 3.1.14 on 2026-10-18 09:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0014_grouprecordcounts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='record',
+            index=models.Index(condition=models.Q(status=0), fields=['group', 'created', 'id'], name='record_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='record',
+            index=models.Index(condition=models.Q(status=1), fields=['group', 'student'], name='record_enrolled_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='record',
+            index=models.Index(fields=['student', 'status'], name='record_student_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='record',
+            index=models.Index(fields=['group', 'status'], name='record_group_status_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.1.14 on 2026-10-18 09:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0036_auto_20211022_1641'),
+        ('users', '0024_auto_20201029_1347'),
+        ('records', '0015_record_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedRecord',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('status', models.IntegerField()),
+                ('priority', models.IntegerField(verbose_name='priorytet')),
+                ('created', models.DateTimeField()),
+                ('modified', models.DateTimeField()),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='courses.group', verbose_name='grupa')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='users.student')),
+            ],
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.1.14 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0016_archivedrecord'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecordEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('time', models.DateTimeField()),
+                ('record_id', models.IntegerField()),
+                ('group_id', models.IntegerField()),
+                ('student_id', models.IntegerField()),
+                ('status', models.SmallIntegerField()),
+                ('priority', models.SmallIntegerField()),
+                ('source', models.SmallIntegerField(choices=[(0, 'Save'), (1, 'Pull'), (2, 'Priority'), (3, 'Auto Sync')])),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='recordevent',
+            index=models.Index(fields=['group_id', 'time'], name='recordevent_group_time_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-18 10:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0017_recordevent'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recordevent',
+            name='source',
+            field=models.SmallIntegerField(choices=[(0, 'Save'), (1, 'Pull'), (2, 'Priority'), (3, 'Auto Sync'), (4, 'Checkout')]),
+        ),
+    ]
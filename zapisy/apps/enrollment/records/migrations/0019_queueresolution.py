@@ -0,0 +1,29 @@
+# Generated by Django 3.1.14 on 2026-10-18 11:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0036_auto_20211022_1641'),
+        ('records', '0018_recordevent_checkout'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueueResolution',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('time', models.DateTimeField(verbose_name='czas rozstrzygnięcia kolejek')),
+                ('resolved_at', models.DateTimeField(blank=True, null=True)),
+                ('semester', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='courses.semester', verbose_name='semestr')),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='recordevent',
+            name='source',
+            field=models.SmallIntegerField(choices=[(0, 'Save'), (1, 'Pull'), (2, 'Priority'), (3, 'Auto Sync'), (4, 'Checkout'), (5, 'Resolution')]),
+        ),
+    ]
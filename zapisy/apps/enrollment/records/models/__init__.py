@@ -1,4 +1,14 @@
-from apps.enrollment.records.models.opening_times import GroupOpeningTimes, T0Times
+from apps.enrollment.records.models.archive import ArchivedRecord
+from apps.enrollment.records.models.events import EventSource, GroupState, RecordEvent
+from apps.enrollment.records.models.group_counts import GroupRecordCounts
+from apps.enrollment.records.models.opening_times import (GroupOpeningTimes, StudentOpeningTimes,
+                                                          T0Times)
+from apps.enrollment.records.models.points import StudentSemesterPoints
 from apps.enrollment.records.models.records import Record, RecordStatus
+from apps.enrollment.records.models.resolution import QueueResolution
 
-__all__ = ['Record', 'RecordStatus', 'T0Times', 'GroupOpeningTimes']
+__all__ = [
+    'Record', 'RecordStatus', 'T0Times', 'GroupOpeningTimes', 'StudentOpeningTimes',
+    'StudentSemesterPoints', 'GroupRecordCounts', 'ArchivedRecord', 'RecordEvent', 'EventSource',
+    'GroupState', 'QueueResolution'
+]
@@ -0,0 +1,77 @@
+"""Module archive moves dead records of closed semesters out of the way.
+
+Records are never deleted, so the `Record` table grows every semester. Most of
+its rows are REMOVED records, which every query has to skip. Once the
+enrollment in a semester is closed, its REMOVED records cannot change any
+more. They are then moved to `ArchivedRecord`, which has the same columns and
+keeps the original ids.
+
+ENROLLED and QUEUED records stay where they are. They are still read after the
+enrollment: by polls, student profiles, schedules and the API (see
+`RecordViewSet`). None of these reads REMOVED records, so the archival is
+transparent to them.
+
+The archival is run with `manage.py archive_records`.
+"""
+from typing import List
+
+from django.db import connection, models, transaction
+
+from apps.enrollment.courses.models import Group, Semester
+from apps.users.models import Student
+
+
+class ArchivedRecord(models.Model):
+    """A REMOVED record of a closed semester (see `Record`)."""
+    id = models.IntegerField(primary_key=True)
+    group = models.ForeignKey(Group, verbose_name='grupa', on_delete=models.CASCADE)
+    student = models.ForeignKey(Student, on_delete=models.CASCADE)
+    status = models.IntegerField()
+    priority = models.IntegerField(verbose_name='priorytet')
+    created = models.DateTimeField()
+    modified = models.DateTimeField()
+
+    BATCH_SIZE = 10000
+    COLUMNS = ('id', 'group_id', 'student_id', 'status', 'priority', 'created', 'modified')
+
+    @classmethod
+    def _move(cls, record_ids: List[int]) -> int:
+        from apps.enrollment.records.models.records import Record, RecordStatus
+        columns = ', '.join(cls.COLUMNS)
+        # The rows are moved with a single statement. Deleting them through
+        # the ORM would send signals for every record, which are pointless
+        # for REMOVED ones.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'WITH moved AS (DELETE FROM {Record._meta.db_table} '
+                f'WHERE id = ANY(%s) AND status = %s RETURNING {columns}) '
+                f'INSERT INTO {cls._meta.db_table} ({columns}) SELECT {columns} FROM moved',
+                [record_ids, RecordStatus.REMOVED])
+            return cursor.rowcount
+
+    @classmethod
+    def archive_semester(cls, semester: Semester, batch_size: int = None) -> int:
+        """Moves the REMOVED records of the semester to the archive.
+
+        The records are moved in batches, every one in its own transaction, so
+        the table is not locked for long.
+
+        Returns:
+            The number of archived records.
+
+        Raises:
+            ValueError: If the enrollment in the semester is not closed yet.
+        """
+        from apps.enrollment.records.models.records import Record, RecordStatus
+        if not semester.is_closed():
+            raise ValueError(f"The enrollment in {semester} is not closed yet.")
+        batch_size = batch_size or cls.BATCH_SIZE
+        removed = Record.objects.filter(
+            group__course__semester=semester, status=RecordStatus.REMOVED).order_by('pk')
+        num_archived = 0
+        while True:
+            with transaction.atomic():
+                record_ids = list(removed.values_list('pk', flat=True)[:batch_size])
+                if not record_ids:
+                    return num_archived
+                num_archived += cls._move(record_ids)
@@ -0,0 +1,147 @@
+"""Module events keeps the history of records.
+
+A record only remembers its current status and the time of its last change
+(`modified`). Every state a record goes through is therefore also appended to
+`RecordEvent`, in the same transaction as the change itself. The log is never
+updated, so the state of any group at any moment can be reconstructed from it
+(see `replay_group`), and it can be analysed after the enrollment (see
+`enrollment_delays`).
+
+Records saved individually are logged by a signal receiver. Functions changing
+records with bulk updates must call `log` themselves, the same as they refresh
+the counters. `log` copies the current state of the records with a single
+`INSERT ... SELECT`, so the overhead of a bulk update is one statement.
+
+An event does not reference the record, the group or the student with a
+foreign key. The log must outlive the archival of records (see `archive.py`)
+and must not slow down the inserts with constraint checks.
+
+The log can be inspected with `manage.py replay_group` and `manage.py
+enrollment_delays`.
+"""
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterable, List
+
+from django.db import connection, models
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+
+class EventSource(models.IntegerChoices):
+    """What caused the change of the record."""
+    # The record has been saved individually: created by enqueuing, removed by
+    # the student, pulled into the group one by one or edited by hand.
+    SAVE = 0
+    PULL = 1
+    PRIORITY = 2
+    AUTO_SYNC = 3
+    # Created by `Record.enqueue_student_into_groups`.
+    CHECKOUT = 4
+    # Changed by `QueueResolution.resolve`.
+    RESOLUTION = 5
+
+
+class RecordEvent(models.Model):
+    """The state of a record after one of its changes."""
+    id = models.BigAutoField(primary_key=True)
+    time = models.DateTimeField()
+    record_id = models.IntegerField()
+    group_id = models.IntegerField()
+    student_id = models.IntegerField()
+    status = models.SmallIntegerField()
+    priority = models.SmallIntegerField()
+    source = models.SmallIntegerField(choices=EventSource.choices)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['group_id', 'time'], name='recordevent_group_time_idx'),
+        ]
+
+    @classmethod
+    def log(cls, record_ids: Iterable[int], source: EventSource, time: datetime = None):
+        """Logs the current state of the records.
+
+        Must be called in the same transaction as the change, after it.
+        """
+        from apps.enrollment.records.models.records import Record
+        record_ids = list(record_ids)
+        if not record_ids:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {cls._meta.db_table} '
+                f'(time, record_id, group_id, student_id, status, priority, source) '
+                f'SELECT %s, id, group_id, student_id, status, priority, %s '
+                f'FROM {Record._meta.db_table} WHERE id = ANY(%s)',
+                [time or datetime.now(), source, record_ids])
+
+    @classmethod
+    def replay_group(cls, group_id: int, time: datetime) -> 'GroupState':
+        """Reconstructs the state of the group at the given time.
+
+        Records changed before the log was introduced are not known.
+        """
+        from apps.enrollment.records.models.records import RecordStatus
+        events = cls.objects.filter(group_id=group_id, time__lte=time).order_by('id').values_list(
+            'record_id', 'time', 'student_id', 'status')
+        # The queue is ordered by the time the records were created, which is
+        # the time of their first event.
+        first_seen: Dict[int, datetime] = {}
+        last_state: Dict[int, tuple] = {}
+        for record_id, event_time, student_id, status in events:
+            first_seen.setdefault(record_id, event_time)
+            last_state[record_id] = (student_id, status)
+        state = GroupState(group_id, time)
+        for record_id in sorted(last_state, key=lambda r: (first_seen[r], r)):
+            student_id, status = last_state[record_id]
+            if status == RecordStatus.ENROLLED:
+                state.enrolled.append(student_id)
+            elif status == RecordStatus.QUEUED:
+                state.queued.append(student_id)
+        return state
+
+    @classmethod
+    def enrollment_delays(cls, group_ids: Iterable[int]) -> Dict[int, List[float]]:
+        """Measures how long the students waited in the queues.
+
+        Returns:
+            For every group, the times (in seconds) from enqueuing to enrolling
+            of the records that have been enrolled from the queue. Records
+            created as ENROLLED are skipped.
+        """
+        from apps.enrollment.records.models.records import RecordStatus
+        events = cls.objects.filter(group_id__in=list(group_ids)).order_by('id').values_list(
+            'record_id', 'group_id', 'time', 'status')
+        enqueued: Dict[int, datetime] = {}
+        done = set()
+        delays: Dict[int, List[float]] = {}
+        for record_id, group_id, time, status in events:
+            if record_id in done:
+                continue
+            if status == RecordStatus.QUEUED:
+                enqueued.setdefault(record_id, time)
+                continue
+            done.add(record_id)
+            if status == RecordStatus.ENROLLED and record_id in enqueued:
+                delays.setdefault(group_id, []).append(
+                    (time - enqueued[record_id]).total_seconds())
+        return delays
+
+
+@dataclass
+class GroupState:
+    """Students of the group at some point in time, as replayed from the log."""
+    group_id: int
+    time: datetime
+    enrolled: List[int] = field(default_factory=list)
+    # In the order of the queue.
+    queued: List[int] = field(default_factory=list)
+
+
+@receiver(post_save, sender='records.Record')
+def log_record_save(sender, instance, **kwargs):
+    RecordEvent.objects.create(
+        time=instance.modified, record_id=instance.pk, group_id=instance.group_id,
+        student_id=instance.student_id, status=instance.status, priority=instance.priority,
+        source=EventSource.SAVE)
@@ -0,0 +1,180 @@
+"""Module group_counts keeps the numbers of enrolled and enqueued students.
+
+Every page showing how full the groups are used to aggregate the records of
+all the groups in view. The numbers are now materialized in `GroupRecordCounts`,
+one row per group, so reading them is a simple indexed lookup.
+
+When a single record is saved, its counter is updated with a delta computed
+from the record's old and new status (see `apply_change`). The update is a
+single statement, so concurrent changes of the group do not get lost, and the
+group's records are not counted again on every enqueue. Functions changing
+records with bulk updates must call `refresh` themselves, which recomputes the
+counters of the affected groups. The recomputation takes a lock on the row
+first, so concurrent changes are applied one after another and the last one
+sees all the others.
+
+A missing row means that the numbers are not known. They are computed when
+first needed.
+
+The consistency of the counters can be verified with `manage.py
+check_group_counters`.
+"""
+from typing import Dict, Iterable, List, Optional
+
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.enrollment.courses.models import Group
+from apps.enrollment.records import updates
+from apps.enrollment.records.models import waiting
+
+
+class GroupRecordCounts(models.Model):
+    """Numbers of ENROLLED and QUEUED records in the group."""
+    group = models.OneToOneField(Group, on_delete=models.CASCADE, primary_key=True)
+    num_enrolled = models.PositiveIntegerField(default=0)
+    num_enqueued = models.PositiveIntegerField(default=0)
+
+    @staticmethod
+    def compute(group_ids: Iterable[int]) -> Dict[int, Dict[str, int]]:
+        """Counts the records, bypassing the counters.
+
+        The result is a dict indexed by group id. Every entry is a dict with
+        fields 'num_enrolled' and 'num_enqueued'.
+        """
+        from apps.enrollment.records.models.records import Record, RecordStatus
+        group_ids = list(group_ids)
+        counts = {group_id: {'num_enrolled': 0, 'num_enqueued': 0} for group_id in group_ids}
+        enrolled_agg = models.Count('id', filter=models.Q(status=RecordStatus.ENROLLED))
+        enqueued_agg = models.Count('id', filter=models.Q(status=RecordStatus.QUEUED))
+        records = Record.objects.filter(group_id__in=group_ids).exclude(
+            status=RecordStatus.REMOVED).values('group_id').annotate(
+                num_enrolled=enrolled_agg, num_enqueued=enqueued_agg).order_by()
+        for rec in records:
+            counts[rec['group_id']]['num_enrolled'] = rec['num_enrolled']
+            counts[rec['group_id']]['num_enqueued'] = rec['num_enqueued']
+        return counts
+
+    @classmethod
+    def _ensure_exist(cls, group_ids: Iterable[int]):
+        group_ids = list(group_ids)
+        existing = set(cls.objects.filter(group_id__in=group_ids).values_list('group_id', flat=True))
+        missing = [g for g in group_ids if g not in existing]
+        if not missing:
+            return
+        # If someone else creates the row in the meantime, his value is at
+        # least as fresh as ours.
+        cls.objects.bulk_create([
+            cls(group_id=group_id, **counts) for group_id, counts in cls.compute(missing).items()
+        ], ignore_conflicts=True)
+
+    @classmethod
+    def get_counts(cls, group_ids: Iterable[int]) -> Dict[int, Dict[str, int]]:
+        """Returns the numbers of students in the groups reading their counters.
+
+        The result has the same format as the one of `compute`.
+        """
+        group_ids = list(group_ids)
+        counters = cls.objects.filter(group_id__in=group_ids).values_list(
+            'group_id', 'num_enrolled', 'num_enqueued')
+        counts = {
+            group_id: {'num_enrolled': num_enrolled, 'num_enqueued': num_enqueued}
+            for group_id, num_enrolled, num_enqueued in counters
+        }
+        missing = [g for g in group_ids if g not in counts]
+        if missing:
+            cls._ensure_exist(missing)
+            counts.update(cls.compute(missing))
+        return counts
+
+    @classmethod
+    def refresh(cls, group_ids: Iterable[int]):
+        """Recomputes the counters after the groups' records have changed.
+
+        Must be called in the same transaction as the change.
+        """
+        group_ids = sorted(set(group_ids))
+        if not group_ids:
+            return
+        with transaction.atomic():
+            cls._ensure_exist(group_ids)
+            # The locks are taken in a deterministic order to avoid deadlocks.
+            counters = list(
+                cls.objects.filter(group_id__in=group_ids).order_by('group_id').select_for_update())
+            counts = cls.compute(group_ids)
+            changed = []
+            for counter in counters:
+                new_counts = counts[counter.group_id]
+                if (counter.num_enrolled, counter.num_enqueued) != (new_counts['num_enrolled'],
+                                                                    new_counts['num_enqueued']):
+                    counter.num_enrolled = new_counts['num_enrolled']
+                    counter.num_enqueued = new_counts['num_enqueued']
+                    changed.append(counter)
+            cls.objects.bulk_update(changed, ['num_enrolled', 'num_enqueued'])
+            if changed:
+                cls._announce([counter.group_id for counter in changed])
+
+    @classmethod
+    def apply_change(cls, group_id: int, old_status: Optional[int], new_status: int):
+        """Updates the counter after a record of the group changed its status.
+
+        Args:
+            old_status: None for a new record.
+
+        Must be called in the same transaction as the change. A missing counter
+        is computed from the records, which already include the change.
+        """
+        from apps.enrollment.records.models.records import RecordStatus
+        delta_enrolled = (new_status == RecordStatus.ENROLLED) - (old_status == RecordStatus.ENROLLED)
+        delta_enqueued = (new_status == RecordStatus.QUEUED) - (old_status == RecordStatus.QUEUED)
+        if not delta_enrolled and not delta_enqueued:
+            return
+        with transaction.atomic():
+            updated = cls.objects.filter(group_id=group_id).update(
+                num_enrolled=models.F('num_enrolled') + delta_enrolled,
+                num_enqueued=models.F('num_enqueued') + delta_enqueued)
+            if not updated:
+                cls.refresh([group_id])
+                return
+            cls._announce([group_id])
+
+    @staticmethod
+    def _announce(group_ids: List[int]):
+        """Tells the others that the counters of the groups have changed."""
+        # Somebody might have stopped (or started) waiting.
+        waiting.invalidate(
+            Group.objects.filter(pk__in=group_ids).values_list(
+                'course__semester_id', flat=True).distinct())
+        updates.publish_groups(group_ids)
+
+    @classmethod
+    def invalidate(cls, group_ids: Iterable[int]):
+        """Drops the counters. They will be computed when next needed."""
+        cls.objects.filter(group_id__in=list(group_ids)).delete()
+
+
+@receiver(post_save, sender='records.Record')
+def refresh_on_record_save(sender, instance, created, raw, **kwargs):
+    if getattr(instance, '_defer_counts_refresh', False):
+        # The caller refreshes the counter together with the others it has
+        # changed, so that their locks are taken in order.
+        return
+    if raw:
+        # While fixtures are being loaded the group might not exist yet.
+        GroupRecordCounts.invalidate([instance.group_id])
+    elif created:
+        GroupRecordCounts.apply_change(instance.group_id, None, instance.status)
+    elif hasattr(instance, '_saved_status'):
+        # The status before the save is remembered by `Record`.
+        GroupRecordCounts.apply_change(instance.group_id, instance._saved_status, instance.status)
+    else:
+        GroupRecordCounts.refresh([instance.group_id])
+
+
+@receiver(post_delete, sender='records.Record')
+def invalidate_on_record_delete(sender, instance, **kwargs):
+    # Records are only deleted together with their group or student. The
+    # group's counter might be on its way out as well, so it must not be
+    # recreated here.
+    GroupRecordCounts.invalidate([instance.group_id])
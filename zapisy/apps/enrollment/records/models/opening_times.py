@@ -4,20 +4,90 @@ Every student has his T0 - the time, when his enrollment starts. For some
 courses he has a time advantage coming from his votes. Additionally, some groups
 will have their own opening time. Some groups will also provide a time advantage
 for a selected group of students (ex. ISIM students).
+
+Between the regenerations the opening times are static, so they are cached.
+For every student and semester the cache holds his T0 and all his group
+opening times in the semester (see `StudentOpeningTimes.get`). The entries of
+a semester are invalidated together by changing the semester's version, which
+is a part of their keys. This happens whenever the times are regenerated or
+edited.
 """
+import itertools
 from collections import defaultdict
 from datetime import datetime, timedelta
-from typing import Dict, List
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple, TypeVar
 
+import numpy as np
 from django.conf import settings
+from django.core.cache import cache
 from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 
+from apps.common import cache_versions
 from apps.enrollment.courses.models import CourseInstance, Group, Semester
 from apps.grade.ticket_create.models.student_graded import StudentGraded
 from apps.offer.vote.models.single_vote import SingleVote
 from apps.users.models import Student
 
 
+T = TypeVar('T')
+
+
+def chunked(iterable: Iterable[T], size: int) -> Iterator[List[T]]:
+    """Splits the iterable into lists of at most `size` elements."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class StudentOpeningTimes(NamedTuple):
+    """The opening times of a student in a semester."""
+    t0: Optional[datetime]
+    # Maps group ids to the opening times set in GroupOpeningTimes.
+    groups: Dict[int, datetime]
+
+    @staticmethod
+    def _version_key(semester_id: int) -> str:
+        return f'opening-times-version:{semester_id}'
+
+    @classmethod
+    def get(cls, student_id: int, semester_id: int) -> 'StudentOpeningTimes':
+        """Returns the opening times from the cache or loads them in one query."""
+        version = cache_versions.get(cls._version_key(semester_id))
+        key = f'opening-times:{semester_id}:{version}:{student_id}'
+        opening_times = cache.get(key)
+        if opening_times is not None:
+            return cls(*opening_times)
+        t0 = None
+        groups = {}
+        # T0 comes without a group id. Annotations always follow the fields in
+        # the query, hence the order of columns.
+        for time, group_id in T0Times.objects.filter(
+                student_id=student_id, semester_id=semester_id).annotate(
+                    group_id=models.Value(None, output_field=models.IntegerField())).values_list(
+                        'time', 'group_id').union(
+                            GroupOpeningTimes.objects.filter(
+                                student_id=student_id,
+                                group__course__semester_id=semester_id).values_list(
+                                    'time', 'group_id'),
+                            all=True):
+            if group_id is None:
+                t0 = time
+            else:
+                groups[group_id] = time
+        cache.set(key, (t0, groups), settings.OPENING_TIMES_CACHE_TIMEOUT)
+        return cls(t0, groups)
+
+    @classmethod
+    def invalidate(cls, semester_id: int):
+        """Drops the cached opening times of all students in the semester."""
+        cache_versions.bump(cls._version_key(semester_id))
+
+
 class T0Times(models.Model):
     """This model stores a T0 for a student.
 
@@ -27,6 +97,11 @@ class T0Times(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
     semester = models.ForeignKey(Semester, on_delete=models.CASCADE)
     time = models.DateTimeField()
+    # Used to find the T0's changed since opening times were last computed.
+    modified = models.DateTimeField(auto_now=True)
+
+    # Number of rows written with a single query.
+    BATCH_SIZE = 2000
 
     class Meta:
         unique_together = ("student", "semester")
@@ -44,63 +119,120 @@ class T0Times(models.Model):
         """
         if not student.is_active:
             return False
+        return cls._is_after(StudentOpeningTimes.get(student.pk, semester.pk).t0, semester, time)
+
+    @staticmethod
+    def _is_after(t0: Optional[datetime], semester: Semester, time: datetime) -> bool:
         if semester.records_closing is not None and time > semester.records_closing:
             return False
-        t0_record = None
-        try:
-            t0_record = cls.objects.get(student=student, semester=semester)
-        except cls.DoesNotExist:
+        if t0 is None:
             return False
-        if time < t0_record.time:
+        if time < t0:
             return False
         return True
 
     @classmethod
-    def populate_t0(cls, semester: Semester):
+    def compute_t0(cls, semester: Semester) -> Dict[int, datetime]:
         """Computes T0's for all active students.
 
         The times are based on their ECTS points and their participation in
         courses grading. The additional administrative bonus is also taken into
-        account.
+        account. The computation is done on NumPy arrays for all the students
+        at once.
+
+        Returns:
+          A dictionary mapping student ids to their T0's.
+        """
+        students = np.array(
+            list(Student.get_active_students().order_by('id').values_list(
+                'id', 'ects', 'records_opening_bonus_minutes')),
+            dtype=np.int64).reshape(-1, 3)
+        student_ids, ects, bonus_minutes = students.T
+        # For each student_id we want to know, how many times he has
+        # generated grading tickets in the last two semesters.
+        generated_tickets = np.array(
+            list(StudentGraded.objects.filter(semester_id__in=[
+                semester.first_grade_semester_id, semester.second_grade_semester_id
+            ]).values("student_id").annotate(num_tickets=models.Count("id")).values_list(
+                "student_id", "num_tickets")),
+            dtype=np.int64).reshape(-1, 2)
+        tickets = np.zeros_like(student_ids)
+        positions = np.searchsorted(student_ids, generated_tickets[:, 0])
+        # Inactive students may have generated tickets as well.
+        known = positions < len(student_ids)
+        known[known] = student_ids[positions[known]] == generated_tickets[known, 0]
+        tickets[positions[known]] = generated_tickets[known, 1]
+
+        # Every ECTS gives ECTS_BONUS minutes bonus, but with logic splitting
+        # that over nighttime. 720 minutes is equal to 12 hours. If
+        # ((student.ects * ECTS_BONUS) // 12 hours) is odd, we subtract
+        # additional 12 hours from T0. This way T0's are separated by ECTS_BONUS
+        # minutes per point, but never fall in the nighttime.
+        minutes = ((ects * settings.ECTS_BONUS) // 720) * 720
+        minutes += ects * settings.ECTS_BONUS
+        # Every participation in classes grading gives a day worth advantage.
+        minutes += tickets * 24 * 60
+        # We may add some bonus by hand.
+        minutes += bonus_minutes
+        # Finally, everyone gets 2 hours. This way, nighttime pause is shifted
+        # from 00:00-12:00 to 22:00-10:00.
+        minutes += 2 * 60
+        times = np.datetime64(semester.records_opening, 'us') - minutes.astype('timedelta64[m]')
+        return dict(zip(student_ids.tolist(), times.tolist()))
+
+    @classmethod
+    def populate_t0(cls, semester: Semester, diff: bool = False) -> int:
+        """Computes and saves T0's for all active students (see `compute_t0`).
+
+        By default all the T0's in the semester are replaced. In the diff mode
+        only the T0's that have actually changed are written, and those of the
+        students no longer active are deleted. This way the T0's may be
+        regenerated during the enrollment without rewriting the whole table.
+        Either way the rows are written in chunks of BATCH_SIZE.
+
+        Returns:
+          The number of T0's created, changed or deleted.
 
         The function will throw a DatabaseError if something goes wrong.
         """
         with transaction.atomic():
-            # First we delete all T0 records in current semester.
-            cls.objects.filter(semester=semester).delete()
-
-            created: List[cls] = []
-            # For each student_id we want to know, how many times he has
-            # generated grading tickets in the last two semesters.
-            generated_tickets: Dict[int, int] = dict(
-                StudentGraded.objects.filter(semester_id__in=[
-                    semester.first_grade_semester_id, semester.second_grade_semester_id
-                ]).values("student_id").annotate(num_tickets=models.Count("id")).values_list(
-                    "student_id", "num_tickets"))
-
-            student: Student
-            for student in Student.get_active_students():
-                record = cls(student=student, semester=semester)
-                record.time = semester.records_opening
-                # Every ECTS gives 5 minutes bonus, but with logic splitting
-                # that over nighttime. 720 minutes is equal to12 hours. If
-                # ((student.ects * ECTS_BONUS) // 12 hours) is odd, we subtract
-                # additional 12 hours from T0. This way T0's are separated by
-                # ECTS_BONUS minutes per point, but never fall in the nighttime.
-                record.time -= timedelta(
-                    minutes=((student.ects * settings.ECTS_BONUS) // 720) * 720)
-                record.time -= timedelta(minutes=settings.ECTS_BONUS) * student.ects
-                # Every participation in classes grading gives a day worth
-                # advantage.
-                student_generated_tickets = generated_tickets.get(student.pk, 0)
-                record.time -= timedelta(days=1) * student_generated_tickets
-                # We may add some bonus by hand.
-                record.time -= timedelta(minutes=1) * student.records_opening_bonus_minutes
-                # Finally, everyone gets 2 hours. This way, nighttime pause is
-                # shifted from 00:00-12:00 to 22:00-10:00.
-                record.time -= timedelta(hours=2)
-                created.append(record)
-            cls.objects.bulk_create(created)
+            t0_times = cls.compute_t0(semester)
+            if not diff:
+                # First we delete all T0 records in current semester.
+                cls.objects.filter(semester=semester).delete()
+                to_create = t0_times
+                num_changed = len(t0_times)
+            else:
+                existing: Dict[int, Tuple[int, datetime]] = {
+                    student_id: (pk, time)
+                    for pk, student_id, time in cls.objects.filter(semester=semester).values_list(
+                        'pk', 'student_id', 'time')
+                }
+                to_delete = [pk for student_id, (pk, _) in existing.items()
+                             if student_id not in t0_times]
+                now = datetime.now()
+                to_update = [
+                    cls(pk=existing[student_id][0], student_id=student_id,
+                        semester_id=semester.pk, time=time, modified=now)
+                    for student_id, time in t0_times.items()
+                    if student_id in existing and existing[student_id][1] != time
+                ]
+                to_create = {
+                    student_id: time
+                    for student_id, time in t0_times.items() if student_id not in existing
+                }
+                for chunk in chunked(to_delete, cls.BATCH_SIZE):
+                    cls.objects.filter(pk__in=chunk).delete()
+                cls.objects.bulk_update(to_update, ['time', 'modified'], batch_size=cls.BATCH_SIZE)
+                num_changed = len(to_delete) + len(to_update) + len(to_create)
+            for chunk in chunked(to_create.items(), cls.BATCH_SIZE):
+                cls.objects.bulk_create([
+                    cls(student_id=student_id, semester_id=semester.pk, time=time)
+                    for student_id, time in chunk
+                ])
+            if num_changed:
+                StudentOpeningTimes.invalidate(semester.pk)
+            return num_changed
 
 
 class GroupOpeningTimes(models.Model):
@@ -115,6 +247,9 @@ class GroupOpeningTimes(models.Model):
     group = models.ForeignKey(Group, on_delete=models.CASCADE)
     time = models.DateTimeField()
 
+    # Number of opening times written with a single query.
+    BATCH_SIZE = 5000
+
     class Meta:
         unique_together = ("student", "group")
         indexes = [
@@ -143,38 +278,75 @@ class GroupOpeningTimes(models.Model):
         """
         if not groups:
             return {}
-        # We assume all the groups are in the same semester.
+        # We assume all the groups are in the same semester. The opening times
+        # come from the cache, so usually no query is made.
         is_after_t0 = T0Times.is_after_t0(student, groups[0].course.semester, time)
+        opening_times = StudentOpeningTimes.get(student.pk, groups[0].course.semester_id)
 
         groups: Dict[int, Group] = {g.id: g for g in groups}
 
         for k in groups:
-            groups[k].opening_time_for_student = None
-        for rec in cls.objects.filter(student=student, group__in=groups):
-            groups[rec.group_id].opening_time_for_student = rec.time
-
-        ret: Dict[int, bool] = {}
-        for k, group in groups.items():
-            # Precedence of opening times rules:
-            # 1) Course-specific opening time; 2) Opening time from voting;
-            # 3) T0 time.
-            after_opening_time: bool = True
-            if group.course.records_start is not None:
-                after_opening_time = group.course.records_start <= time
-            elif group.opening_time_for_student is not None:
-                after_opening_time = group.opening_time_for_student <= time
-            elif not is_after_t0:
-                after_opening_time = False
-            # Precedence of closing times rules:
-            # 1) Course-specific closing time; 2) semester-set enrollment
-            # closing time (if records_closing is None, enrollment is closed).
-            before_closing_time: bool = False
-            if group.course.records_end is not None:
-                before_closing_time = time <= group.course.records_end
-            elif group.course.semester.records_closing is not None:
-                before_closing_time = time <= group.course.semester.records_closing
-            ret[k] = after_opening_time and before_closing_time
-        return ret
+            groups[k].opening_time_for_student = opening_times.groups.get(k)
+
+        return {
+            k: cls._is_open(group, group.opening_time_for_student, is_after_t0, time)
+            for k, group in groups.items()
+        }
+
+    @classmethod
+    def open_for_students(cls, students: Dict[int, Student], groups: Dict[int, Group],
+                          pairs: Iterable[Tuple[int, int]], time: datetime) -> Set[Tuple[int, int]]:
+        """Finds the pairs (student id, group id) where the group is open for the student.
+
+        Does the same as `are_groups_open_for_student` for many students at
+        once, like `Record.can_enqueue_groups` (inactive students get no open
+        groups), but the opening times of all the students are loaded in two
+        queries, bypassing the cache. All the groups must be in the same
+        semester and come with their courses and semesters.
+        """
+        pairs = list(pairs)
+        if not pairs:
+            return set()
+        student_ids = {student_id for student_id, _ in pairs}
+        semester = next(iter(groups.values())).course.semester
+        t0s: Dict[int, datetime] = dict(
+            T0Times.objects.filter(semester_id=semester.pk, student_id__in=student_ids).values_list(
+                'student_id', 'time'))
+        group_times: Dict[Tuple[int, int], datetime] = {
+            (student_id, group_id): time
+            for student_id, group_id, time in cls.objects.filter(
+                student_id__in=student_ids, group_id__in=groups).values_list(
+                    'student_id', 'group_id', 'time')
+        }
+        return {
+            (student_id, group_id) for student_id, group_id in pairs
+            if students[student_id].is_active and cls._is_open(
+                groups[group_id], group_times.get((student_id, group_id)),
+                T0Times._is_after(t0s.get(student_id), semester, time), time)
+        }
+
+    @staticmethod
+    def _is_open(group: Group, opening_time_for_student: Optional[datetime], is_after_t0: bool,
+                 time: datetime) -> bool:
+        # Precedence of opening times rules:
+        # 1) Course-specific opening time; 2) Opening time from voting;
+        # 3) T0 time.
+        after_opening_time: bool = True
+        if group.course.records_start is not None:
+            after_opening_time = group.course.records_start <= time
+        elif opening_time_for_student is not None:
+            after_opening_time = opening_time_for_student <= time
+        elif not is_after_t0:
+            after_opening_time = False
+        # Precedence of closing times rules:
+        # 1) Course-specific closing time; 2) semester-set enrollment
+        # closing time (if records_closing is None, enrollment is closed).
+        before_closing_time: bool = False
+        if group.course.records_end is not None:
+            before_closing_time = time <= group.course.records_end
+        elif group.course.semester.records_closing is not None:
+            before_closing_time = time <= group.course.semester.records_closing
+        return after_opening_time and before_closing_time
 
     @classmethod
     def is_enrollment_open(cls, course: CourseInstance, time: datetime):
@@ -190,41 +362,24 @@ class GroupOpeningTimes(models.Model):
         return is_course_open or is_semester_open
 
     @classmethod
-    @transaction.atomic
-    def populate_opening_times(cls, semester: Semester):
-        """Computes opening times (bonuses) for students that cast votes.
-
-        Voting for a course results in a quicker enrollment. The function will
-        throw a DatabaseError if operation is unsuccessful.
+    def _generate(cls, semester: Semester, votes: Iterable[Tuple[int, int, int]],
+                  groups_by_proposal: Dict[int, List[Group]]) -> Iterator['GroupOpeningTimes']:
+        """Yields the opening times resulting from the votes.
+
+        Args:
+            votes: Tuples (student_id, proposal_id, value).
+            groups_by_proposal: Groups of the semester by their course's
+              proposal. The groups should come with their courses.
         """
-        # First make sure, that all SingleVotes have their course field
-        # populated.
-        # First delete all already existing records for this semester.
-        cls.objects.filter(group__course__semester_id=semester.id).delete()
         # We need T0 of each student.
         t0times: Dict[int, datetime] = dict(
-            T0Times.objects.filter(semester_id=semester.id).values_list("student_id", "time")
-        )
-
-        opening_time_objects: List['GroupOpeningTimes'] = []
-        votes = SingleVote.objects.meaningful().in_semester(semester=semester)
-        groups = Group.objects.filter(course__semester=semester).select_related('course')
-
-        votes_by_proposal: Dict[int, List[SingleVote]] = defaultdict(list)
-        for vote in votes:
-            votes_by_proposal[vote.proposal_id].append(vote)
-
-        groups_by_proposal: Dict[int, List[Group]] = defaultdict(list)
-        for group in groups:
-            groups_by_proposal[group.course.offer_id].append(group)
-
-        for proposal_id, groups in groups_by_proposal.items():
-            single_vote: SingleVote
-            for single_vote in votes_by_proposal[proposal_id]:
-                # Every point gives a day worth of bonus.
-                for group in groups:
-                    bonus_obj = cls(student_id=single_vote.student_id, group_id=group.pk)
-                    bonus_obj.time = max(
+            T0Times.objects.filter(semester_id=semester.id).values_list("student_id", "time"))
+        for student_id, proposal_id, value in votes:
+            # Every point gives a day worth of bonus.
+            for group in groups_by_proposal.get(proposal_id, []):
+                yield cls(
+                    student_id=student_id, group_id=group.pk,
+                    time=max(
                         filter(
                             None,
                             (
@@ -234,13 +389,95 @@ class GroupOpeningTimes(models.Model):
                                 # If the student does not have T0, we use
                                 # the general records opening time in the
                                 # semester.
-                                t0times.get(single_vote.student_id, semester.records_opening) -
-                                timedelta(days=single_vote.val),
+                                t0times.get(student_id, semester.records_opening) -
+                                timedelta(days=value),
                             )
                         )
-                    )
-                    opening_time_objects.append(bonus_obj)
-        cls.objects.bulk_create(opening_time_objects)
+                    ))
+
+    @classmethod
+    def _save_in_chunks(cls, opening_times: Iterable['GroupOpeningTimes']) -> int:
+        """Writes the opening times with at most BATCH_SIZE rows in memory."""
+        num_written = 0
+        for chunk in chunked(opening_times, cls.BATCH_SIZE):
+            cls.objects.bulk_create(chunk)
+            num_written += len(chunk)
+        return num_written
+
+    @staticmethod
+    def _votes(semester: Semester) -> models.QuerySet:
+        """Meaningful votes in the semester as (student_id, proposal_id, value)."""
+        return SingleVote.objects.meaningful().in_semester(semester=semester).true_val().order_by(
+        ).values_list('student_id', 'proposal_id', 'true_val')
+
+    @classmethod
+    def _students_changed_since(cls, semester: Semester, time: datetime) -> List[int]:
+        """Finds students whose opening times might have changed since time.
+
+        These are the ones whose votes or T0 have been modified. The students
+        that have lost their T0 (having been deactivated) are included as well.
+        """
+        students = set(
+            SingleVote.objects.in_semester(semester=semester).filter(
+                modified__gt=time).values_list('student_id', flat=True))
+        students.update(
+            T0Times.objects.filter(semester=semester, modified__gt=time).values_list(
+                'student_id', flat=True))
+        students.update(
+            cls.objects.filter(group__course__semester=semester).exclude(
+                student__t0times__semester=semester).values_list('student_id', flat=True))
+        return sorted(students)
+
+    @classmethod
+    @transaction.atomic
+    def populate_opening_times(cls, semester: Semester, incremental: bool = False) -> int:
+        """Computes opening times (bonuses) for students that cast votes.
+
+        Voting for a course results in a quicker enrollment. The votes are
+        streamed from the database and the opening times are written in chunks
+        of BATCH_SIZE, so the memory use does not depend on the size of the
+        semester.
+
+        Every run records a watermark (see `OpeningTimesWatermark`). In the
+        incremental mode, only the opening times of students whose votes or T0
+        have changed since the last run are recomputed. Changes in the courses
+        (like `records_start`) are not followed, they need a full run. Without
+        a watermark the run is always full.
+
+        Returns:
+          The number of opening times written.
+
+        The function will throw a DatabaseError if operation is unsuccessful.
+        """
+        started = datetime.now()
+        # The lock on the watermark prevents concurrent runs in the semester.
+        watermark, _ = OpeningTimesWatermark.objects.get_or_create(semester=semester)
+        watermark = OpeningTimesWatermark.objects.select_for_update().get(pk=watermark.pk)
+        groups_by_proposal: Dict[int, List[Group]] = defaultdict(list)
+        for group in Group.objects.filter(course__semester=semester).select_related('course'):
+            groups_by_proposal[group.course.offer_id].append(group)
+
+        if incremental and watermark.computed_at is not None:
+            students = cls._students_changed_since(semester, watermark.computed_at)
+            num_written = 0
+            for students_chunk in chunked(students, T0Times.BATCH_SIZE):
+                cls.objects.filter(group__course__semester_id=semester.id,
+                                   student_id__in=students_chunk).delete()
+                votes = cls._votes(semester).filter(student_id__in=students_chunk)
+                num_written += cls._save_in_chunks(
+                    cls._generate(semester, votes.iterator(chunk_size=cls.BATCH_SIZE),
+                                  groups_by_proposal))
+        else:
+            # First delete all already existing records for this semester.
+            cls.objects.filter(group__course__semester_id=semester.id).delete()
+            votes = cls._votes(semester)
+            num_written = cls._save_in_chunks(
+                cls._generate(semester, votes.iterator(chunk_size=cls.BATCH_SIZE),
+                              groups_by_proposal))
+        watermark.computed_at = started
+        watermark.save()
+        StudentOpeningTimes.invalidate(semester.pk)
+        return num_written
 
     @classmethod
     @transaction.atomic
@@ -252,30 +489,35 @@ class GroupOpeningTimes(models.Model):
         """
         # First delete all already existing records for this group.
         cls.objects.filter(group=group).delete()
-        # We need T0 of each student.
-        t0times: Dict[int, datetime] = dict(
-            T0Times.objects.filter(semester_id=group.course.semester_id).values_list(
-                "student_id", "time"))
         # We also need votes for the course.
-        votes = SingleVote.objects.meaningful().in_semester(semester=group.course.semester).filter(
-            proposal=group.course.offer)
-        opening_time_objects: List['GroupOpeningTimes'] = []
-        single_vote: SingleVote
-        for single_vote in votes:
-            # Every point gives a day worth of bonus.
-            bonus_obj = cls(student=single_vote.student, group=group)
-            bonus_obj.time = max(
-                filter(
-                    None,
-                    [
-                        # The opening cannot be earlier than the group is opened
-                        # (if that is specified).
-                        group.course.records_start,
-                        # If the student does not have T0, we use
-                        # the general records opening time in the
-                        # semester.
-                        t0times.get(single_vote.student_id, group.course.semester.records_opening) -
-                        timedelta(days=single_vote.val),
-                    ]))
-            opening_time_objects.append(bonus_obj)
-        cls.objects.bulk_create(opening_time_objects)
+        votes = cls._votes(group.course.semester).filter(proposal=group.course.offer)
+        cls._save_in_chunks(
+            cls._generate(group.course.semester, votes.iterator(chunk_size=cls.BATCH_SIZE),
+                          {group.course.offer_id: [group]}))
+        StudentOpeningTimes.invalidate(group.course.semester_id)
+
+
+class OpeningTimesWatermark(models.Model):
+    """Remembers when the opening times in the semester were computed.
+
+    Used by the incremental mode of `GroupOpeningTimes.populate_opening_times`.
+    """
+    semester = models.OneToOneField(Semester, on_delete=models.CASCADE)
+    # The time the last computation started at. Changes made after that time
+    # have not necessarily been taken into account.
+    computed_at = models.DateTimeField(null=True)
+
+
+@receiver(post_save, sender=T0Times)
+@receiver(post_delete, sender=T0Times)
+def invalidate_on_t0_change(sender, instance, **kwargs):
+    StudentOpeningTimes.invalidate(instance.semester_id)
+
+
+@receiver(post_save, sender=GroupOpeningTimes)
+@receiver(post_delete, sender=GroupOpeningTimes)
+def invalidate_on_group_opening_time_change(sender, instance, **kwargs):
+    semester_id = Group.objects.filter(pk=instance.group_id).values_list(
+        'course__semester_id', flat=True).first()
+    if semester_id is not None:
+        StudentOpeningTimes.invalidate(semester_id)
@@ -0,0 +1,144 @@
+"""Module points keeps the total ECTS of courses students are enrolled into.
+
+Checking the ECTS limit used to sum the points of all the student's enrolled
+courses every time he was to be pulled into a group. The totals are now
+materialized in `StudentSemesterPoints`, one row per student and semester.
+
+A course counts once, no matter how many of its groups the student is
+enrolled into. The rows are therefore not updated with deltas, but recomputed
+for the affected students whenever any of their records changes between
+ENROLLED and another status. Saving a record in any other way (e.g. changing
+its priority) leaves the counters alone. The recomputation takes a lock on the row first,
+so concurrent changes are applied one after another and the last one sees all
+the others.
+
+A missing row means that the total is not known. It is computed when first
+needed. This is how the counters are invalidated when something changes that
+is hard to follow precisely (a course's points, records loaded from fixtures).
+
+The consistency of the counters can be verified with `manage.py
+check_ects_counters`.
+"""
+from typing import Dict, Iterable
+
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.enrollment.courses.models import CourseInstance, Group, Semester
+from apps.users.models import Student
+
+
+class StudentSemesterPoints(models.Model):
+    """Total ECTS of the courses the student is enrolled into in the semester."""
+    student = models.ForeignKey(Student, on_delete=models.CASCADE)
+    semester = models.ForeignKey(Semester, on_delete=models.CASCADE)
+    points = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("student", "semester")
+
+    @staticmethod
+    def compute(student_ids: Iterable[int], semester_id: int) -> Dict[int, int]:
+        """Sums up the points from the records, bypassing the counters."""
+        from apps.enrollment.records.models.records import Record, RecordStatus
+        student_ids = list(student_ids)
+        totals = {student_id: 0 for student_id in student_ids}
+        courses = Record.objects.filter(
+            student_id__in=student_ids, group__course__semester_id=semester_id,
+            status=RecordStatus.ENROLLED).values_list(
+                'student_id', 'group__course_id', 'group__course__points').distinct()
+        for student_id, _, points in courses:
+            totals[student_id] += points
+        return totals
+
+    @classmethod
+    def _ensure_exist(cls, student_ids: Iterable[int], semester_id: int):
+        existing = set(
+            cls.objects.filter(student_id__in=student_ids,
+                               semester_id=semester_id).values_list('student_id', flat=True))
+        missing = [s for s in student_ids if s not in existing]
+        if not missing:
+            return
+        # If someone else creates the row in the meantime, his value is at
+        # least as fresh as ours.
+        cls.objects.bulk_create([
+            cls(student_id=student_id, semester_id=semester_id, points=points)
+            for student_id, points in cls.compute(missing, semester_id).items()
+        ], ignore_conflicts=True)
+
+    @classmethod
+    def get_points(cls, student_id: int, semester_id: int) -> int:
+        """Returns the student's total in the semester reading a single row."""
+        try:
+            return cls.objects.get(student_id=student_id, semester_id=semester_id).points
+        except cls.DoesNotExist:
+            cls._ensure_exist([student_id], semester_id)
+            return cls.objects.get(student_id=student_id, semester_id=semester_id).points
+
+    @classmethod
+    def refresh(cls, student_ids: Iterable[int], semester_id: int):
+        """Recomputes the counters after the students' records have changed.
+
+        Must be called in the same transaction as the change.
+        """
+        student_ids = sorted(set(student_ids))
+        if not student_ids:
+            return
+        with transaction.atomic():
+            cls._ensure_exist(student_ids, semester_id)
+            # The locks are taken in a deterministic order to avoid deadlocks.
+            counters = list(
+                cls.objects.filter(student_id__in=student_ids,
+                                   semester_id=semester_id).order_by('student_id').select_for_update())
+            totals = cls.compute(student_ids, semester_id)
+            changed = []
+            for counter in counters:
+                if counter.points != totals[counter.student_id]:
+                    counter.points = totals[counter.student_id]
+                    changed.append(counter)
+            cls.objects.bulk_update(changed, ['points'])
+
+    @classmethod
+    def invalidate(cls, student_ids: Iterable[int], semester_id: int):
+        """Drops the counters. They will be computed when next needed."""
+        cls.objects.filter(student_id__in=list(student_ids), semester_id=semester_id).delete()
+
+
+@receiver(post_save, sender='records.Record')
+def refresh_on_record_save(sender, instance, created, raw, **kwargs):
+    from apps.enrollment.records.models.records import RecordStatus
+    # The status before the save is remembered by `Record`. It is not known if
+    # the instance was neither loaded nor saved before. New records have none.
+    if not raw and (created or hasattr(instance, '_saved_status')):
+        previous = None if created else instance._saved_status
+        if (previous == RecordStatus.ENROLLED) == (instance.status == RecordStatus.ENROLLED):
+            return
+    semester_id = Group.objects.filter(pk=instance.group_id).values_list(
+        'course__semester_id', flat=True).first()
+    if semester_id is None:
+        # While fixtures are being loaded the group might not exist yet.
+        StudentSemesterPoints.objects.filter(student_id=instance.student_id).delete()
+    elif raw:
+        StudentSemesterPoints.invalidate([instance.student_id], semester_id)
+    else:
+        StudentSemesterPoints.refresh([instance.student_id], semester_id)
+
+
+@receiver(post_delete, sender='records.Record')
+def refresh_on_record_delete(sender, instance, **kwargs):
+    semester_id = Group.objects.filter(pk=instance.group_id).values_list(
+        'course__semester_id', flat=True).first()
+    if semester_id is not None:
+        StudentSemesterPoints.refresh([instance.student_id], semester_id)
+
+
+@receiver(post_save, sender=CourseInstance)
+def invalidate_on_course_save(sender, instance, created, **kwargs):
+    # The course's points might have changed.
+    if created:
+        return
+    from apps.enrollment.records.models.records import Record, RecordStatus
+    student_ids = Record.objects.filter(
+        group__course=instance, status=RecordStatus.ENROLLED).values_list('student_id', flat=True)
+    StudentSemesterPoints.invalidate(student_ids, instance.semester_id)
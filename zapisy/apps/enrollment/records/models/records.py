@@ -20,10 +20,14 @@ Record Lifetime:
 
   fill_group(group_id): The asynchronous task runs this function. It is a loop
     calling `pull_record_into_group` as long as it returns True, which means
-    that there still place in the group and students in the queue.
+    that there still place in the group and students in the queue. By default
+    the batched `pull_records_into_group` is used instead, filling all the
+    vacancies in one transaction.
 
   pull_record_into_group(group_id): Picks the first student in the group's queue
-    and tries to enroll him in the group using `enroll_or_remove`.
+    and tries to enroll him in the group using `enroll_or_remove`. The first
+    student is found in the queue index kept by `queues.py`, so the group's
+    queue does not have to be read from the database every time.
 
   enroll_or_remove(record): Takes the record and tries to change its status from
     QUEUED to ENROLLED. This operation will be unsuccessful if the function
@@ -43,16 +47,24 @@ from collections import defaultdict
 import copy
 from datetime import datetime
 from enum import Enum
-from typing import DefaultDict, Dict, Iterable, List, Optional, Set
+from typing import Any, DefaultDict, Dict, FrozenSet, Iterable, Iterator, List, Optional, Set, Tuple
 
 from django.contrib.auth.models import User
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import DatabaseError, models, transaction
+from django.db.models.functions import Coalesce
 
 from apps.enrollment.courses.models import CourseInstance, Group, Semester
 from apps.enrollment.courses.models.group import GuaranteedSpots
+from apps.enrollment.records import locks, queues, updates
+from apps.enrollment.records.models import waiting
+from apps.enrollment.records.models.events import EventSource, RecordEvent
+from apps.enrollment.records.models.group_counts import GroupRecordCounts
 from apps.enrollment.records.models.opening_times import GroupOpeningTimes
-from apps.enrollment.records.signals import GROUP_CHANGE_SIGNAL
+from apps.enrollment.records.models.points import StudentSemesterPoints
+from apps.enrollment.records.models.resolution import QueueResolution
+from apps.enrollment.records.signals import (GROUP_CHANGE_SIGNAL, GROUP_FILL_RETRY_SIGNAL,
+                                             STUDENTS_CHANGE_SIGNAL)
 from apps.notifications.custom_signals import student_not_pulled, student_pulled
 from apps.users.models import Student
 
@@ -81,7 +93,8 @@ class Record(models.Model):
 
     Once the student signs up for the course or its queue, the record is
     created. It must not be ever removed. When the student is removed from the
-    group or its queue, the record status should be changed.
+    group or its queue, the record status should be changed. After the
+    enrollment is closed, REMOVED records are moved to `ArchivedRecord`.
     """
     group = models.ForeignKey(Group, verbose_name='grupa', on_delete=models.CASCADE)
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
@@ -93,6 +106,42 @@ class Record(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     modified = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # The hot queries must not scan the whole table. See
+        # `apps/enrollment/records/tests/query_plans.py`.
+        indexes = [
+            # Queue heads and positions, in the order of the queue.
+            models.Index(fields=['group', 'created', 'id'],
+                         condition=models.Q(status=RecordStatus.QUEUED),
+                         name='record_queue_idx'),
+            # Enrolled students counted by group (free spots, statistics).
+            models.Index(fields=['group', 'student'],
+                         condition=models.Q(status=RecordStatus.ENROLLED),
+                         name='record_enrolled_idx'),
+            # The student's records locked in `enroll_or_remove`.
+            models.Index(fields=['student', 'status'], name='record_student_status_idx'),
+            models.Index(fields=['group', 'status'], name='record_group_status_idx'),
+        ]
+
+    # The receivers of `post_save` compare the status with the one the record
+    # had in the database (see `points.py` and `group_counts.py`). It is
+    # remembered when the record is loaded or saved.
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        record = super().from_db(db, field_names, values)
+        if 'status' in field_names:
+            record._saved_status = record.status
+        return record
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using, fields)
+        if fields is None or 'status' in fields:
+            self._saved_status = self.status
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._saved_status = self.status
+
     @staticmethod
     def can_enqueue(student: Optional[Student], group: Group, time: datetime = None) -> bool:
         """Checks if the student can join the queue of the group.
@@ -143,9 +192,14 @@ class Record(models.Model):
         # Check if enrolling would not make the student exceed the current ECTS
         # limit.
         semester: Semester = group.course.semester
-        points = cls.student_points_in_semester(student, semester, [group.course])
-        if points > semester.get_current_limit(time):
-            return CanEnroll.ECTS_LIMIT
+        limit = semester.get_current_limit(time)
+        points = StudentSemesterPoints.get_points(student.pk, semester.pk)
+        # Only if the course would not fit, we need to know whether it is
+        # already counted in.
+        if points + group.course.points > limit:
+            points = cls.student_points_in_semester(student, semester, [group.course])
+            if points > limit:
+                return CanEnroll.ECTS_LIMIT
         return CanEnroll.OK
 
     @classmethod
@@ -153,17 +207,22 @@ class Record(models.Model):
                                    additional_courses: Iterable[CourseInstance] = []) -> int:
         """Returns total points the student has accumulated in semester.
 
+        The total is read from the counter maintained in
+        `StudentSemesterPoints`.
+
         Args:
             additional_courses is a list of potential courses a student might
             also want to enroll into.
         """
-        records = cls.objects.filter(
-            student=student,
-            group__course__semester=semester, status=RecordStatus.ENROLLED).select_related(
-                'group', 'group__course')
-        courses = set(r.group.course for r in records)
-        courses.update(additional_courses)
-        return sum(c.points for c in courses)
+        points = StudentSemesterPoints.get_points(student.pk, semester.pk)
+        additional_courses = {c.pk: c for c in additional_courses}
+        if additional_courses:
+            counted = set(
+                cls.objects.filter(student=student, group__course__in=list(additional_courses),
+                                   status=RecordStatus.ENROLLED).values_list(
+                                       'group__course_id', flat=True))
+            points += sum(c.points for pk, c in additional_courses.items() if pk not in counted)
+        return points
 
     @staticmethod
     def can_dequeue(student: Optional[Student], group: Group, time: datetime = None) -> bool:
@@ -215,23 +274,15 @@ class Record(models.Model):
         Returned students aren't enrolled in any group of given type within
         given course, but they are enqueued into at least one.
 
+        The numbers are counted in a single query (see `waiting.py`). For all
+        the courses of a semester `waiting.get_semester_counts` should be used,
+        which caches them.
+
         Returns:
             A dict indexed by a course_id. Every entry is a dict mapping
             group_type to a number of waiting students.
         """
-        queued = Record.objects.filter(
-            status=RecordStatus.QUEUED, group__course__in=courses).values(
-                'group__course', 'group__type', 'student__user',
-                'student__user__first_name', 'student__user__last_name')
-        enrolled = Record.objects.filter(
-            status=RecordStatus.ENROLLED, group__course__in=courses).values(
-                'group__course', 'group__type', 'student__user', 'student__user__first_name',
-                'student__user__last_name')
-        waiting = queued.difference(enrolled)
-        ret = defaultdict(lambda: defaultdict(int))
-        for w in waiting:
-            ret[w['group__course']][w['group__type']] += 1
-        return ret
+        return waiting.count_waiting_students(courses)
 
     @classmethod
     def is_enrolled(cls, student: Student, group: Group) -> bool:
@@ -278,25 +329,68 @@ class Record(models.Model):
 
         The data will be returned in the form of a dict indexed by group id.
         Every entry will be a dict with fields 'num_enrolled' and
-        'num_enqueued'.
+        'num_enqueued'. The numbers are read from the counters kept in
+        `GroupRecordCounts`.
+        """
+        return GroupRecordCounts.get_counts(g.pk for g in groups)
+
+    @classmethod
+    def queue_positions(cls, student: Student,
+                        semester: Semester) -> Dict[int, Dict[str, Any]]:
+        """Tells where the student stands in the queues of the semester.
+
+        The data is returned in the form of a dict indexed by the ids of the
+        groups the student is enqueued into. Every entry is a dict with fields:
+          'position': The student's place in the queue, counting from 1. The
+            queue is ordered the way the puller follows it (see `queues.py`).
+          'free_spots': The number of spots in the group not guaranteed to any
+            role, that are still free.
+          'roles': For every guaranteed-spots role of the group that the
+            student has, a dict with the 'position' among the students with
+            the role and the number of 'free_spots' guaranteed to the role.
+
+        The positions are counted in the database, using the index on the
+        group's QUEUED records, with one query for the whole semester and one
+        for every guaranteed-spots role the student has.
         """
-        enrolled_agg = models.Count('id', filter=models.Q(status=RecordStatus.ENROLLED))
-        enqueued_agg = models.Count('id', filter=models.Q(status=RecordStatus.QUEUED))
-        records = cls.objects.filter(group__in=groups).exclude(
-            status=RecordStatus.REMOVED).values('group_id').annotate(
-                num_enrolled=enrolled_agg, num_enqueued=enqueued_agg).values(
-                    'group_id', 'num_enrolled', 'num_enqueued')
-        ret_dict: Dict[int, Dict[str, int]] = {
-            g.pk: {
-                'num_enrolled': 0,
-                'num_enqueued': 0
+        queued = cls.objects.filter(status=RecordStatus.QUEUED)
+
+        def ahead_of(created, pk):
+            return models.Q(created__lt=created) | models.Q(created=created, pk__lt=pk)
+
+        num_ahead = queued.filter(group_id=models.OuterRef('group_id')).filter(
+            ahead_of(models.OuterRef('created'), models.OuterRef('pk'))).order_by().values(
+                'group_id').annotate(num=models.Count('id')).values('num')
+        # In case of duplicate records, the earliest one counts.
+        records = {}
+        for pk, group_id, created, ahead in queued.filter(
+                student=student, group__course__semester=semester).annotate(
+                    ahead=Coalesce(models.Subquery(num_ahead), 0)).order_by(
+                        '-created', '-pk').values_list('pk', 'group_id', 'created', 'ahead'):
+            records[group_id] = (pk, created, ahead)
+        if not records:
+            return {}
+        groups = Group.objects.filter(pk__in=records.keys())
+        free_spots = cls.free_spots_by_role_in_groups(groups)
+        ret: Dict[int, Dict[str, Any]] = {
+            group_id: {
+                'position': ahead + 1,
+                'free_spots': free_spots[group_id][queues.ALL],
+                'roles': {},
             }
-            for g in groups
+            for group_id, (_, _, ahead) in records.items()
         }
-        for rec in records:
-            ret_dict[rec['group_id']]['num_enrolled'] = rec['num_enrolled']
-            ret_dict[rec['group_id']]['num_enqueued'] = rec['num_enqueued']
-        return ret_dict
+        for group_id, role in GuaranteedSpots.objects.filter(
+                group_id__in=records.keys(), role__user=student.user).values_list(
+                    'group_id', 'role__name'):
+            pk, created, _ = records[group_id]
+            ahead = queued.filter(group_id=group_id, student__user__groups__name=role).filter(
+                ahead_of(created, pk)).count()
+            ret[group_id]['roles'][role] = {
+                'position': ahead + 1,
+                'free_spots': free_spots[group_id][role],
+            }
+        return ret
 
     @classmethod
     def free_spots_by_role(cls, group: Group) -> Dict[str, int]:
@@ -305,30 +399,64 @@ class Record(models.Model):
         The purpose of this is to establish if the group has free place in it at
         all and how many students are enrolled according to which
         GuaranteedSpots rule. Note, that this function will only work
-        deterministically and sanely, if the roles defined in GuaranteedSpots
-        rules are distinct for this groups.
+        sanely, if the roles defined in GuaranteedSpots rules are distinct for
+        this groups.
 
         The number of students not matched to any GuaranteedSpots rule will be
         indexed with '-'.
         """
-        ret: Dict[str, int] = {}
-        guaranteed_spots_rules = GuaranteedSpots.objects.filter(group=group)
-        all_enrolled_records = cls.objects.filter(
-            group=group, status=RecordStatus.ENROLLED).select_related(
-                'student', 'student__user').prefetch_related('student__user__groups')
-        all_enrolled_students = set(r.student.user for r in all_enrolled_records)
-
-        for gsr in guaranteed_spots_rules:
-            role = gsr.role
-            counter = 0
-            for user in all_enrolled_students.copy():
-                if role in user.groups.all():
-                    all_enrolled_students.remove(user)
-                    counter += 1
+        return cls.free_spots_by_role_in_groups([group])[group.pk]
+
+    @classmethod
+    def free_spots_by_role_in_groups(cls, groups: Iterable[Group]) -> Dict[int, Dict[str, int]]:
+        """Counts the free spots by role (see `free_spots_by_role`) in groups.
+
+        The counting is done in the database with three queries, regardless of
+        the number of groups. Only the enrolled students having one of the
+        guaranteed-spots roles are fetched, to be assigned to the rules. The
+        rules are considered in order of creation, and every one takes its
+        students in order of their ids, until its limit is reached.
+
+        Returns:
+          A dictionary mapping the group id to its free spots by role.
+        """
+        groups = list(groups)
+        group_ids = [g.pk for g in groups]
+        rules_by_group: DefaultDict[int, List[GuaranteedSpots]] = defaultdict(list)
+        for gsr in GuaranteedSpots.objects.filter(group_id__in=group_ids).select_related(
+                'role').order_by('pk'):
+            rules_by_group[gsr.group_id].append(gsr)
+        num_enrolled: Dict[int, int] = dict(
+            cls.objects.filter(group_id__in=group_ids, status=RecordStatus.ENROLLED).values(
+                'group_id').annotate(num=models.Count('student_id', distinct=True)).values_list(
+                    'group_id', 'num'))
+        # The students having the role of a rule defined in their group. The
+        # conditions must be in a single `filter` call to concern the same
+        # record.
+        role_holders: DefaultDict[Tuple[int, int], List[int]] = defaultdict(list)
+        for group_id, role_id, student_id in GuaranteedSpots.objects.filter(
+                group_id__in=rules_by_group.keys()).filter(
+                    group__record__status=RecordStatus.ENROLLED,
+                    group__record__student__user__groups=models.F('role')).values_list(
+                        'group_id', 'role_id', 'group__record__student_id').distinct().order_by(
+                            'group__record__student_id'):
+            role_holders[(group_id, role_id)].append(student_id)
+
+        ret: Dict[int, Dict[str, int]] = {}
+        for group in groups:
+            free_spots: Dict[str, int] = {}
+            taken: Set[int] = set()
+            for gsr in rules_by_group[group.pk]:
+                counter = 0
+                for student_id in role_holders[(group.pk, gsr.role_id)]:
                     if counter == gsr.limit:
                         break
-            ret[gsr.role.name] = gsr.limit - counter
-        ret['-'] = group.limit - len(all_enrolled_students)
+                    if student_id not in taken:
+                        taken.add(student_id)
+                        counter += 1
+                free_spots[gsr.role.name] = gsr.limit - counter
+            free_spots['-'] = group.limit - (num_enrolled.get(group.pk, 0) - len(taken))
+            ret[group.pk] = free_spots
         return ret
 
     @classmethod
@@ -378,8 +506,63 @@ class Record(models.Model):
             group=group, student=student, status=RecordStatus.QUEUED, created=cur_time)
         LOGGER.info('User %s is enqueued into group %s', student, group)
         GROUP_CHANGE_SIGNAL.send(None, group_id=group.id)
+        STUDENTS_CHANGE_SIGNAL.send(None, group_id=group.id, student_ids=[student.pk])
         return True
 
+    @classmethod
+    def enqueue_student_into_groups(cls, student: Student, groups: List[Group],
+                                    priorities: Optional[Dict[int, int]] = None) -> Dict[int, bool]:
+        """Puts the student in the queues of many groups at once.
+
+        It does for every group what `enqueue_student` does, but the checks are
+        made for all the groups together and the records are created with a
+        single insert. Groups the student is already recorded in are left
+        untouched.
+
+        Args:
+            priorities: Queue priorities by group id. Groups missing here get
+                the default priority.
+
+        Returns:
+            For every group id, whether the student could be enqueued (the same
+            as `enqueue_student` would return).
+        """
+        priorities = priorities or {}
+        cur_time = datetime.now()
+        can_enqueue_dict = cls.can_enqueue_groups(student, groups, cur_time)
+        result = {group.pk: can_enqueue_dict.get(group.pk, False) for group in groups}
+        to_create = [
+            group for group in cls.is_recorded_in_groups(student, groups)
+            if result[group.pk] and not getattr(group, 'is_enqueued', False) and
+            not getattr(group, 'is_enrolled', False)
+        ]
+        if not to_create:
+            return result
+        default_priority = cls._meta.get_field('priority').default
+        with transaction.atomic():
+            created = cls.objects.bulk_create([
+                Record(group_id=group.pk, student=student, status=RecordStatus.QUEUED,
+                       priority=priorities.get(group.pk, default_priority))
+                for group in to_create
+            ])
+            # The bulk insert does not send signals, so the queue index, the
+            # counters and the event log must be updated by hand. They must use
+            # the `created` times set by the insert, which decide the order of
+            # the queues.
+            GroupRecordCounts.refresh([record.group_id for record in created])
+            RecordEvent.log([record.pk for record in created], EventSource.CHECKOUT,
+                            max(record.created for record in created))
+            queues.add_records(
+                (record.pk, record.group_id, student.pk, record.created) for record in created)
+        LOGGER.info('User %s is enqueued into groups %s', student,
+                    ', '.join(str(group) for group in to_create))
+        # Every group has its own queue, so every one of them must be filled.
+        # Triggers for the same group are coalesced anyway (see `tasks.py`).
+        for group in to_create:
+            GROUP_CHANGE_SIGNAL.send(None, group_id=group.pk)
+            STUDENTS_CHANGE_SIGNAL.send(None, group_id=group.pk, student_ids=[student.pk])
+        return result
+
     @classmethod
     def remove_from_group(cls, student: Student, group: Group) -> bool:
         """Removes the student from the group.
@@ -396,15 +579,19 @@ class Record(models.Model):
         record = None
         if not cls.can_dequeue(student, group):
             return False
-        try:
-            record = Record.objects.filter(
-                student=student, group=group).exclude(status=RecordStatus.REMOVED).get()
-        except cls.DoesNotExist:
-            return False
-        record.status = RecordStatus.REMOVED
-        record.save()
+        with transaction.atomic():
+            # Pullers must not decide about the student in the meantime.
+            locks.TransactionLocks().lock_student(student.pk)
+            try:
+                record = Record.objects.filter(
+                    student=student, group=group).exclude(status=RecordStatus.REMOVED).get()
+            except cls.DoesNotExist:
+                return False
+            record.status = RecordStatus.REMOVED
+            record.save()
         LOGGER.info('User %s removed from group %s', student, group)
         GROUP_CHANGE_SIGNAL.send(None, group_id=record.group_id)
+        STUDENTS_CHANGE_SIGNAL.send(None, group_id=record.group_id, student_ids=[student.pk])
         return True
 
     @classmethod
@@ -413,8 +600,10 @@ class Record(models.Model):
 
         Returns true if the priority is changed.
         """
-        num = cls.objects.filter(
-            student=student, group=group, status=RecordStatus.QUEUED).update(priority=priority)
+        with transaction.atomic():
+            queued = cls.objects.filter(student=student, group=group, status=RecordStatus.QUEUED)
+            num = queued.update(priority=priority)
+            RecordEvent.log(queued.values_list('pk', flat=True), EventSource.PRIORITY)
         return num == 1
 
     @classmethod
@@ -434,23 +623,28 @@ class Record(models.Model):
         Concurrency:
           This function may be run concurrently. A data race could potentially
           lead to number of students enrolled exceeding the limit. It therefore
-          needs to be atomic. A lock is hence obtained on all the records in the
-          same group. This way only one instance of this function can operate on
-          the same group at the same time (the second instance will have to wait
-          for the lock to be released). We optimistically assume that the group
-          limit is not going to change while the function is executing and do
-          not obtain a lock on the group in the database.
+          needs to be atomic. An advisory lock of the group is hence obtained
+          (see `apps/enrollment/records/locks.py`). This way only one instance
+          of this function can operate on the same group at the same time (the
+          second instance will have to wait for the lock to be released). We
+          optimistically assume that the group limit is not going to change
+          while the function is executing and do not lock the group's row.
         """
         group = Group.objects.select_related('course', 'course__semester').get(id=group_id)
         if not GroupOpeningTimes.is_enrollment_open(group.course, datetime.now()):
             return False
+        if QueueResolution.is_pending(group.course.semester_id):
+            # The queues will be resolved all at once (see `resolution.py`).
+            return False
         # Groups that will need to be pulled into afterwards.
         trigger_groups = []
+        # Students whose records have changed.
+        changed_students: List[int] = []
 
         with transaction.atomic():
-            # We obtain a lock on the records in this group.
-            records = cls.objects.filter(group_id=group_id).exclude(
-                status=RecordStatus.REMOVED).select_for_update()
+            held_locks = locks.TransactionLocks()
+            held_locks.lock_group(group_id)
+            records = cls.objects.filter(group_id=group_id).exclude(status=RecordStatus.REMOVED)
             free_spots_by_role = cls.free_spots_by_role(group)
             no_one_waiting = True
             # We rely here on the fact, that '-' will be in the order before all
@@ -458,15 +652,16 @@ class Record(models.Model):
             for role in sorted(free_spots_by_role):
                 if free_spots_by_role[role] <= 0:
                     continue
-                try:
-                    queue_query = records.filter(status=RecordStatus.QUEUED)
-                    if role != '-':
-                        queue_query = queue_query.filter(student__user__groups__name=role)
-                    first_in_line = queue_query.earliest('created')
+                first_in_line = cls._first_in_line(records, group_id, role, held_locks)
+                if held_locks.conflict:
+                    # The student will be pulled in the next run.
                     no_one_waiting = False
-                    trigger_groups = first_in_line.enroll_or_remove(group)
-                except cls.DoesNotExist:
-                    pass
+                    break
+                if first_in_line is None:
+                    continue
+                no_one_waiting = False
+                trigger_groups += first_in_line.enroll_or_remove(group, held_locks)
+                changed_students.append(first_in_line.student_id)
 
             if no_one_waiting:
                 return False
@@ -474,20 +669,221 @@ class Record(models.Model):
         # The tasks should be triggered outside of the transaction
         for trigger_group_id in trigger_groups:
             GROUP_CHANGE_SIGNAL.send(None, group_id=trigger_group_id)
+        STUDENTS_CHANGE_SIGNAL.send(None, group_id=group_id, student_ids=changed_students)
         return True
 
     @classmethod
-    def fill_group(cls, group_id: int):
+    def pull_records_into_group(cls, group_id: int) -> bool:
+        """Fills all the vacancies in the group in a single transaction.
+
+        This is a batched version of `pull_record_into_group`. The free spots
+        are counted once, and then the queue is followed until they are all
+        taken or the queue is exhausted. Every student is checked with
+        `can_enroll` as he would be when pulled individually, and removed from
+        the queue if he is not eligible. The status changes are then applied
+        with a few bulk updates. Notifications are sent per student.
+
+        Returns:
+          True if any record has been pulled (or removed) from the queue, which
+          means it is worth running the function again in case the situation
+          has changed in the meantime. The function may throw DatabaseError if
+          transaction fails.
+
+        Concurrency:
+          The same considerations as for `pull_record_into_group` apply. The
+          students are locked as they are taken from the queue. If one of them
+          cannot be locked without the risk of a deadlock, the function stops
+          there and returns True, so the rest is done in the next run.
+        """
+        group = Group.objects.select_related('course', 'course__semester').get(id=group_id)
+        if not GroupOpeningTimes.is_enrollment_open(group.course, datetime.now()):
+            return False
+        if QueueResolution.is_pending(group.course.semester_id):
+            # The queues will be resolved all at once (see `resolution.py`).
+            return False
+        # Groups that will need to be pulled into afterwards.
+        trigger_groups: List[int] = []
+        # Students whose records have changed.
+        changed_students: List[int] = []
+
+        with transaction.atomic():
+            held_locks = locks.TransactionLocks()
+            held_locks.lock_group(group_id)
+            records = cls.objects.filter(group_id=group_id).exclude(status=RecordStatus.REMOVED)
+            free_spots_by_role = cls.free_spots_by_role(group)
+            # The order of rules must be the same as in `free_spots_by_role`.
+            rule_roles = [
+                gsr.role.name for gsr in GuaranteedSpots.objects.filter(group=group).order_by('pk')
+            ]
+            to_enroll: List[Record] = []
+            to_remove: List[Tuple[Record, CanEnroll]] = []
+            processed: Set[int] = set()
+            students: Set[int] = set()
+            for role in sorted(free_spots_by_role):
+                if free_spots_by_role[role] <= 0 or held_locks.conflict:
+                    continue
+                for record, roles in cls._queued_in_line(records, group_id, role, held_locks):
+                    if record.pk in processed:
+                        continue
+                    processed.add(record.pk)
+                    if record.student_id in students:
+                        # A duplicate record (see `enqueue_student`). It will be
+                        # removed together with the parallel groups.
+                        continue
+                    can_enroll = cls.can_enroll(record.student, group)
+                    if not can_enroll:
+                        to_remove.append((record, can_enroll))
+                        continue
+                    to_enroll.append(record)
+                    students.add(record.student_id)
+                    # Count the spot the same way `free_spots_by_role` would
+                    # count it after the student is enrolled: guaranteed spots
+                    # are taken first.
+                    if role == queues.ALL:
+                        role_taken = next(
+                            (r for r in rule_roles if r in roles and free_spots_by_role[r] > 0),
+                            queues.ALL)
+                    else:
+                        role_taken = role
+                    free_spots_by_role[role_taken] -= 1
+                    if free_spots_by_role[role] <= 0:
+                        break
+
+            if not to_enroll and not to_remove:
+                # On a conflict the student first in line is still waiting.
+                return held_locks.conflict
+            trigger_groups = cls._apply_pulled_records(group, to_enroll, to_remove)
+            changed_students = [r.student_id for r in to_enroll] + [
+                r.student_id for r, _ in to_remove
+            ]
+
+        # The tasks should be triggered outside of the transaction
+        for trigger_group_id in trigger_groups:
+            GROUP_CHANGE_SIGNAL.send(None, group_id=trigger_group_id)
+        STUDENTS_CHANGE_SIGNAL.send(None, group_id=group_id, student_ids=changed_students)
+        return True
+
+    @classmethod
+    def _apply_pulled_records(cls, group: Group, to_enroll: List['Record'],
+                              to_remove: List[Tuple['Record', CanEnroll]]) -> List[int]:
+        """Applies the decisions of `pull_records_into_group` in bulk.
+
+        It does for all the records what `enroll_or_remove` does for a single
+        one. Returns the list of group ids that need to be triggered.
+        """
+        now = datetime.now()
+        enrolled_ids = [r.pk for r in to_enroll]
+        # Remove the enrolled students from all parallel groups (and queues of
+        # lower priority). Their duplicate records in this group go as well.
+        parallel_condition = models.Q(status=RecordStatus.ENROLLED) | models.Q(group_id=group.pk)
+        for record in to_enroll:
+            parallel_condition |= models.Q(student_id=record.student_id,
+                                           priority__lt=record.priority)
+        other_groups_query = cls.objects.filter(
+            student_id__in=[r.student_id for r in to_enroll],
+            group__course__id=group.course_id,
+            group__type=group.type).exclude(status=RecordStatus.REMOVED).exclude(
+                id__in=enrolled_ids).filter(parallel_condition)
+        other_records = list(other_groups_query.values_list('id', 'group_id', 'status'))
+        other_groups_query.update(status=RecordStatus.REMOVED, modified=now)
+        cls.objects.filter(id__in=enrolled_ids).update(status=RecordStatus.ENROLLED, modified=now)
+        cls.objects.filter(id__in=[r.pk for r, _ in to_remove]).update(
+            status=RecordStatus.REMOVED, modified=now)
+        StudentSemesterPoints.refresh([r.student_id for r in to_enroll], group.course.semester_id)
+        GroupRecordCounts.refresh([group.pk] + [other_group_id for _, other_group_id, _ in other_records])
+        RecordEvent.log(
+            enrolled_ids + [r.pk for r, _ in to_remove] + [record_id for record_id, _, _ in other_records],
+            EventSource.PULL, now)
+
+        # The bulk updates do not send signals, so the queue index must be
+        # updated by hand.
+        queues.discard_records(group.pk, enrolled_ids + [r.pk for r, _ in to_remove])
+        for record_id, other_group_id, status in other_records:
+            if status == RecordStatus.QUEUED:
+                queues.discard_records(other_group_id, [record_id])
+
+        # Send notifications.
+        for record, can_enroll in to_remove:
+            record.status = RecordStatus.REMOVED
+            student_not_pulled.send_robust(
+                sender=cls, instance=group, user=record.student.user, reason=can_enroll.value)
+        for record in to_enroll:
+            record.status = RecordStatus.ENROLLED
+            student_pulled.send_robust(sender=cls, instance=group, user=record.student.user)
+        return list({
+            other_group_id
+            for _, other_group_id, status in other_records
+            if status == RecordStatus.ENROLLED and other_group_id != group.pk
+        })
+
+    @classmethod
+    def _queued_in_line(cls, records: models.QuerySet, group_id: int, role: str,
+                        held_locks: locks.TransactionLocks
+                        ) -> Iterator[Tuple['Record', FrozenSet[str]]]:
+        """Yields QUEUED records of the role in the group's queue in order.
+
+        The candidates come from the queue index (see
+        `apps/enrollment/records/queues.py`). They are verified against the
+        database in batches, and the stale ones are discarded from the index.
+        The students of the yielded records are locked (see `locks.py`). If a
+        student cannot be locked, the iteration stops and `held_locks.conflict`
+        is set. Every record comes with the names of the group's
+        guaranteed-spots roles its student has.
+        """
+        queue_query = records.filter(status=RecordStatus.QUEUED)
+        if role != queues.ALL:
+            queue_query = queue_query.filter(student__user__groups__name=role)
+        group_roles = GuaranteedSpots.objects.filter(group_id=group_id).values_list(
+            'role__name', flat=True)
+        for batch in queues.candidates(group_id, role):
+            valid = dict(queue_query.filter(pk__in=batch).values_list('pk', 'student_id'))
+            stale = [record_id for record_id in batch if record_id not in valid]
+            queues.discard_records(group_id, stale, role=None if role == queues.ALL else role)
+            roles_by_record: DefaultDict[int, Set[str]] = defaultdict(set)
+            for record_id, role_name in cls.objects.filter(
+                    pk__in=valid, student__user__groups__name__in=group_roles).values_list(
+                        'pk', 'student__user__groups__name'):
+                roles_by_record[record_id].add(role_name)
+            for record_id in batch:
+                if record_id not in valid:
+                    continue
+                if not held_locks.lock_student(valid[record_id]):
+                    return
+                # The record might have left the queue in the meantime.
+                record = queue_query.filter(pk=record_id).select_related(
+                    'student', 'student__user').first()
+                if record is not None:
+                    yield record, frozenset(roles_by_record[record_id])
+
+    @classmethod
+    def _first_in_line(cls, records: models.QuerySet, group_id: int, role: str,
+                       held_locks: locks.TransactionLocks) -> Optional['Record']:
+        """Finds the earliest QUEUED record of the role in the group's queue.
+
+        The record's student is locked. None is returned if the queue is empty
+        or the student could not be locked (see `_queued_in_line`).
+        """
+        for record, _ in cls._queued_in_line(records, group_id, role, held_locks):
+            return record
+        return None
+
+    @classmethod
+    def fill_group(cls, group_id: int, batch: bool = True):
         """Pulls records from the queue into the group as long as possible.
 
+        In the batch mode (default) all the vacancies are filled in a single
+        transaction with `pull_records_into_group`. Otherwise the students are
+        pulled one by one with `pull_record_into_group`.
+
         This function may raise a DatabaseError when too many transaction errors
         occur.
         """
+        pull = cls.pull_records_into_group if batch else cls.pull_record_into_group
         num_transaction_errors = 0
         still_free = True
         while still_free:
             try:
-                still_free = cls.pull_record_into_group(group_id)
+                still_free = pull(group_id)
             except DatabaseError:
                 # Transaction failure probably means that Postgres decided to
                 # terminate the transaction in order to eliminate a deadlock. We
@@ -496,6 +892,7 @@ class Record(models.Model):
                 num_transaction_errors += 1
                 if num_transaction_errors == 3:
                     raise
+                GROUP_FILL_RETRY_SIGNAL.send(None, group_id=group_id)
 
     @classmethod
     def update_records_in_auto_enrollment_group(cls, group_id: int):
@@ -509,37 +906,158 @@ class Record(models.Model):
 
         Args:
             group_id: Must be an id of a auto-enrollment group.
+
+        Concurrency:
+            Two syncs of the same group running at the same time would both
+            create records for the missing students. The advisory lock of the
+            group makes them run one after another.
+        """
+        with transaction.atomic():
+            locks.TransactionLocks().lock_group(group_id)
+            semester_id = Group.objects.values_list('course__semester_id', flat=True).get(pk=group_id)
+            other_groups = Group.objects.filter(course__groups=group_id, auto_enrollment=False)
+
+            def get_all_students(**kwargs):
+                qs = cls.objects.filter(**kwargs)
+                return set(qs.values_list('student_id', flat=True).distinct())
+
+            enrolled_other = get_all_students(group__in=other_groups, status=RecordStatus.ENROLLED)
+            queued_other = get_all_students(group__in=other_groups, status=RecordStatus.QUEUED)
+            enrolled_in_group = get_all_students(group=group_id, status=RecordStatus.ENROLLED)
+            queued_in_group = get_all_students(group=group_id, status=RecordStatus.QUEUED)
+            # First we enqueue people who are in some groups but are completely
+            # absent in our group.
+            missing_students = (enrolled_other | queued_other) - (enrolled_in_group | queued_in_group)
+            created = cls.objects.bulk_create([
+                Record(student_id=s, group_id=group_id, status=RecordStatus.QUEUED)
+                for s in missing_students
+            ])
+            changed_ids = [record.pk for record in created]
+
+            def update_status(query: models.QuerySet, status: RecordStatus):
+                # The ids are needed for the event log.
+                ids = list(query.values_list('pk', flat=True))
+                cls.objects.filter(pk__in=ids).update(status=status, modified=datetime.now())
+                changed_ids.extend(ids)
+
+            # We change the status from queued to enrolled for those, who should be enrolled.
+            update_status(
+                cls.objects.filter(group=group_id, status=RecordStatus.QUEUED,
+                                   student_id__in=enrolled_other), RecordStatus.ENROLLED)
+            # We change the status from enrolled to queued for those who should be queued.
+            update_status(
+                cls.objects.filter(group=group_id, status=RecordStatus.ENROLLED,
+                                   student_id__in=(queued_other - enrolled_other)),
+                RecordStatus.QUEUED)
+            # Drop records of people not in the group.
+            update_status(
+                cls.objects.filter(group_id=group_id).exclude(status=RecordStatus.REMOVED).exclude(
+                    student_id__in=(enrolled_other | queued_other)), RecordStatus.REMOVED)
+            RecordEvent.log(changed_ids, EventSource.AUTO_SYNC)
+            # The bulk updates do not send signals. Students enrolled into the
+            # group or removed from it need their ECTS counters recomputed.
+            StudentSemesterPoints.refresh(enrolled_other ^ enrolled_in_group, semester_id)
+            GroupRecordCounts.refresh([group_id])
+        # Bulk operations do not send signals. Records could have been queued
+        # above, so the queue index must be merged with the database again.
+        # Stale entries will be discarded by the puller.
+        queues.unload_groups([group_id])
+
+    @classmethod
+    def update_students_in_auto_enrollment_groups(cls, group_id: int, student_ids: Iterable[int]):
+        """Syncs the records of the students in the course's auto-enrollment groups.
+
+        This is the incremental version of
+        `update_records_in_auto_enrollment_group`. Only the records of the given
+        students are read and changed, so a change of a single student does not
+        cost a scan of the whole course. The full sync is still run
+        periodically (`manage.py sync_auto_enrollment`) to fix any drift.
+
+        Args:
+            group_id: The group the students' records have changed in. The
+                auto-enrollment groups of its course are synced.
+            student_ids: The students whose records have changed.
+
+        Concurrency:
+            Takes the same advisory lock of the auto-enrollment group as the
+            full sync, so the two never create duplicate records. Then it locks
+            the students in the order of their ids, as the pullers do (see
+            `locks.py`), so that their records do not change in the meantime.
         """
-        other_groups = Group.objects.filter(course__groups=group_id, auto_enrollment=False)
-
-        def get_all_students(**kwargs):
-            qs = cls.objects.filter(**kwargs)
-            return set(qs.values_list('student_id', flat=True).distinct())
-
-        enrolled_other = get_all_students(group__in=other_groups, status=RecordStatus.ENROLLED)
-        queued_other = get_all_students(group__in=other_groups, status=RecordStatus.QUEUED)
-        enrolled_in_group = get_all_students(group=group_id, status=RecordStatus.ENROLLED)
-        queued_in_group = get_all_students(group=group_id, status=RecordStatus.QUEUED)
-        # First we enqueue people who are in some groups but are completely absent in our group.
-        missing_students = (enrolled_other | queued_other) - (enrolled_in_group | queued_in_group)
-        cls.objects.bulk_create([
-            Record(student_id=s, group_id=group_id, status=RecordStatus.QUEUED)
-            for s in missing_students
-        ])
-        # We change the status from queued to enrolled for those, who should be enrolled.
-        cls.objects.filter(group=group_id,
-                           status=RecordStatus.QUEUED,
-                           student_id__in=enrolled_other).update(status=RecordStatus.ENROLLED)
-        # We change the status from enrolled to queued for those who should be queued.
-        cls.objects.filter(
-            group=group_id,
-            status=RecordStatus.ENROLLED,
-            student_id__in=(queued_other - enrolled_other)).update(status=RecordStatus.QUEUED)
-        # Drop records of people not in the group.
-        cls.objects.filter(group_id=group_id).exclude(status=RecordStatus.REMOVED).exclude(
-            student_id__in=(enrolled_other | queued_other)).update(status=RecordStatus.REMOVED)
-
-    def enroll_or_remove(self, group: Group) -> List[int]:
+        student_ids = set(student_ids)
+        if not student_ids:
+            return
+        course_id, semester_id = Group.objects.values_list(
+            'course_id', 'course__semester_id').get(pk=group_id)
+        auto_group_ids = list(
+            Group.objects.filter(course_id=course_id, auto_enrollment=True).values_list(
+                'pk', flat=True))
+        for auto_group_id in auto_group_ids:
+            with transaction.atomic():
+                held_locks = locks.TransactionLocks()
+                held_locks.lock_group(auto_group_id)
+                # No other student is locked yet, so waiting in this order
+                # never conflicts.
+                for student_id in sorted(student_ids):
+                    held_locks.lock_student(student_id)
+                records = cls.objects.filter(
+                    student_id__in=student_ids, group__course_id=course_id,
+                    group__auto_enrollment=False).exclude(
+                        status=RecordStatus.REMOVED).values_list('student_id', 'status')
+                # The status the student should have in the auto-enrollment
+                # group. Students absent here should be out of it.
+                wanted: Dict[int, RecordStatus] = {}
+                for student_id, status in records:
+                    if status == RecordStatus.ENROLLED or student_id not in wanted:
+                        wanted[student_id] = status
+                present = cls.objects.filter(
+                    group_id=auto_group_id, student_id__in=student_ids).exclude(
+                        status=RecordStatus.REMOVED).values_list('id', 'student_id', 'status')
+                now = datetime.now()
+                created = cls.objects.bulk_create([
+                    Record(student_id=s, group_id=auto_group_id, status=wanted[s], created=now)
+                    for s in wanted.keys() - {student_id for _, student_id, _ in present}
+                ])
+                to_update: DefaultDict[int, List[int]] = defaultdict(list)
+                # Students who join or leave the auto-enrollment group, whose
+                # ECTS counters change.
+                points_changed = {
+                    record.student_id for record in created
+                    if record.status == RecordStatus.ENROLLED
+                }
+                changed_students = {record.student_id for record in created}
+                for record_id, student_id, status in present:
+                    new_status = wanted.get(student_id, RecordStatus.REMOVED)
+                    if new_status == status:
+                        continue
+                    to_update[new_status].append(record_id)
+                    changed_students.add(student_id)
+                    if RecordStatus.ENROLLED in (status, new_status):
+                        points_changed.add(student_id)
+                if not created and not to_update:
+                    continue
+                for status, ids in to_update.items():
+                    cls.objects.filter(pk__in=ids).update(status=status, modified=now)
+                RecordEvent.log(
+                    [record.pk for record in created] +
+                    [record_id for ids in to_update.values() for record_id in ids],
+                    EventSource.AUTO_SYNC, now)
+                # The bulk operations do not send signals, so the counters and
+                # the queue index must be updated by hand.
+                StudentSemesterPoints.refresh(points_changed, semester_id)
+                GroupRecordCounts.refresh([auto_group_id])
+                updates.publish_students(changed_students)
+                queues.discard_records(
+                    auto_group_id,
+                    to_update[RecordStatus.ENROLLED] + to_update[RecordStatus.REMOVED])
+                queues.add_records(
+                    (record_id, auto_group_id, student_id, created_time)
+                    for record_id, student_id, created_time in cls.objects.filter(
+                        pk__in=[record.pk for record in created] + to_update[RecordStatus.QUEUED],
+                        status=RecordStatus.QUEUED).values_list('id', 'student_id', 'created'))
+
+    def enroll_or_remove(self, group: Group,
+                         held_locks: Optional[locks.TransactionLocks] = None) -> List[int]:
         """Tries to change a single QUEUED record status to ENROLLED.
 
         The operation might fail under certain circumstances (enrolling would
@@ -552,14 +1070,19 @@ class Record(models.Model):
 
         Concurrency:
             The function may be run concurrently. A data race might potentially
-            lead to a student breaching ECTS limit. To prevent that a lock is
-            obtained on all records of this student. This way, no other instance
-            of this function will try to pull him into another group at the same
-            time.
+            lead to a student breaching ECTS limit. To prevent that an advisory
+            lock of the student is obtained (see `locks.py`), unless the caller
+            passes the locks it already holds, including the student's one.
+            This way, no other instance of this function will try to pull him
+            into another group at the same time, and his points are read after
+            the other pulls are done.
         """
         with transaction.atomic():
+            if held_locks is None:
+                held_locks = locks.TransactionLocks()
+                held_locks.lock_student(self.student_id)
             records = Record.objects.filter(student_id=self.student_id).exclude(
-                status=RecordStatus.REMOVED).select_for_update()
+                status=RecordStatus.REMOVED)
 
             # Check if he can be enrolled at all.
             can_enroll = self.can_enroll(self.student, group)
@@ -585,12 +1108,30 @@ class Record(models.Model):
             # The list of groups to trigger must be computed now, after the
             # update it would be empty. Note that this list should have at most
             # one element.
-            other_groups_query_list = list(
-                other_groups_query.filter(status=RecordStatus.ENROLLED).values_list(
-                    'group_id', flat=True))
+            other_records = list(other_groups_query.values_list('id', 'group_id', 'status'))
+            other_groups_query_list = [
+                other_group_id for _, other_group_id, status in other_records
+                if status == RecordStatus.ENROLLED
+            ]
             other_groups_query.update(status=RecordStatus.REMOVED)
+            # The bulk update does not send signals, so the queue index, the
+            # counters and the event log must be updated by hand.
+            for record_id, other_group_id, status in other_records:
+                if status == RecordStatus.QUEUED:
+                    queues.discard_records(other_group_id, [record_id])
+            RecordEvent.log((record_id for record_id, _, _ in other_records), EventSource.PULL)
             self.status = RecordStatus.ENROLLED
-            self.save()
+            # The counters of the group and of the parallel groups are
+            # refreshed with a single call, which locks them in the order of
+            # group ids. Locking the group's counter on save separately could
+            # deadlock with a puller of a parallel group.
+            self._defer_counts_refresh = True
+            try:
+                self.save()
+            finally:
+                del self._defer_counts_refresh
+            GroupRecordCounts.refresh(
+                [self.group_id] + [other_group_id for _, other_group_id, _ in other_records])
             # Send notification to user
             student_pulled.send_robust(
                 sender=self.__class__, instance=self.group, user=self.student.user)
@@ -0,0 +1,191 @@
+"""Module resolution empties all the queues of a semester in one pass.
+
+Normally every change of a group triggers its puller (see `tasks.py`), which
+enrolls the students first in line one group at a time. When the enrollment
+opens, thousands of such pulls race each other, and the result depends on the
+order in which the workers happen to run.
+
+A `QueueResolution` of a semester changes that. While it is pending, the
+pullers of the semester do nothing, so the students only build up the queues.
+At the configured time `manage.py resolve_queues` (run e.g. by cron every
+minute) loads all the queues of the semester, computes the assignment with
+`matching.match` and applies it in a single transaction. Afterwards the pullers
+work as usual, starting with a pull of every group to fill the spots left free.
+"""
+import logging
+import time as time_module
+from collections import defaultdict
+from datetime import datetime
+from typing import DefaultDict, Dict, List, NamedTuple, Set, Tuple
+
+from django.db import models, transaction
+
+from apps.enrollment.courses.models import Group, Semester
+from apps.enrollment.courses.models.group import GuaranteedSpots
+from apps.enrollment.records import matching, queues, updates
+from apps.enrollment.records.models.events import EventSource, RecordEvent
+from apps.enrollment.records.models.group_counts import GroupRecordCounts
+from apps.enrollment.records.models.opening_times import GroupOpeningTimes
+from apps.enrollment.records.models.points import StudentSemesterPoints
+from apps.enrollment.records.signals import GROUP_CHANGE_SIGNAL
+from apps.notifications.custom_signals import student_not_pulled, student_pulled
+from apps.users.models import Student
+
+LOGGER = logging.getLogger(__name__)
+
+
+class ResolutionReport(NamedTuple):
+    num_queued: int
+    num_enrolled: int
+    # Records removed from parallel groups and lower priority queues.
+    num_removed: int
+    num_over_limit: int
+    rounds: int
+    seconds: float
+
+
+class QueueResolution(models.Model):
+    """Holds the pullers of the semester until its queues are resolved at once."""
+    semester = models.OneToOneField(Semester, on_delete=models.CASCADE, verbose_name='semestr')
+    time = models.DateTimeField(verbose_name='czas rozstrzygnięcia kolejek')
+    resolved_at = models.DateTimeField(null=True, blank=True)
+
+    @classmethod
+    def is_pending(cls, semester_id: int) -> bool:
+        """Tells if the pullers of the semester must wait for the resolution."""
+        return cls.objects.filter(semester_id=semester_id, resolved_at__isnull=True).exists()
+
+    @classmethod
+    def resolve_due(cls, time: datetime = None) -> Dict[Semester, ResolutionReport]:
+        """Resolves the pending resolutions whose time has come."""
+        time = time or datetime.now()
+        due = cls.objects.filter(resolved_at__isnull=True, time__lte=time).select_related('semester')
+        return {resolution.semester: resolution.resolve(time) for resolution in due}
+
+    def resolve(self, time: datetime = None) -> ResolutionReport:
+        """Enrolls the queued students of the semester all at once.
+
+        Raises:
+            ValueError: If the semester has already been resolved.
+        """
+        from apps.enrollment.records.models.records import CanEnroll, Record, RecordStatus
+        start = time_module.perf_counter()
+        time = time or datetime.now()
+        semester = self.semester
+        with transaction.atomic():
+            # A concurrent resolution of the semester waits here and fails.
+            if QueueResolution.objects.select_for_update().get(pk=self.pk).resolved_at:
+                raise ValueError(f"The queues of {semester} have already been resolved.")
+            groups = {
+                group.pk: group
+                for group in Group.objects.filter(
+                    course__semester=semester, auto_enrollment=False).select_related(
+                        'course', 'course__semester')
+                if GroupOpeningTimes.is_enrollment_open(group.course, time)
+            }
+            # The records are locked, so that nobody dequeues in the meantime.
+            queued = [
+                matching.QueuedRecord(*row) for row in Record.objects.filter(
+                    group_id__in=groups, status=RecordStatus.QUEUED).select_for_update(
+                        of=('self',)).values_list('id', 'student_id', 'group_id', 'priority', 'created')
+            ]
+            student_ids = {record.student_id for record in queued}
+            students = Student.objects.filter(pk__in=student_ids).select_related('user').in_bulk()
+
+            # Students who cannot enroll into a group yet are left in its queue
+            # for the puller to decide.
+            eligible = GroupOpeningTimes.open_for_students(
+                students, groups, {(r.student_id, r.group_id) for r in queued}, time)
+            candidates = [r for r in queued if (r.student_id, r.group_id) in eligible]
+
+            free_spots = Record.free_spots_by_role_in_groups(groups.values())
+            rule_roles: DefaultDict[int, List[str]] = defaultdict(list)
+            for group_id, role_name in GuaranteedSpots.objects.filter(
+                    group_id__in=groups).order_by('pk').values_list('group_id', 'role__name'):
+                rule_roles[group_id].append(role_name)
+            group_info = {
+                group.pk: matching.GroupInfo((group.course_id, group.type), free_spots[group.pk],
+                                             rule_roles[group.pk], group.course.points)
+                for group in groups.values()
+            }
+            student_roles: DefaultDict[int, Set[str]] = defaultdict(set)
+            for student_id, role_name in Student.objects.filter(
+                    pk__in=student_ids,
+                    user__groups__name__in={r for roles in rule_roles.values() for r in roles}
+            ).values_list('pk', 'user__groups__name'):
+                student_roles[student_id].add(role_name)
+
+            # The students' current groups give their ECTS and the parallel
+            # groups to leave.
+            enrolled = list(
+                Record.objects.filter(
+                    student_id__in=student_ids, group__course__semester=semester,
+                    status=RecordStatus.ENROLLED).select_for_update(of=('self',)).values_list(
+                        'id', 'student_id', 'group_id', 'group__course_id', 'group__type',
+                        'group__course__points'))
+            counted_courses = {(student_id, course_id) for _, student_id, _, course_id, _, _ in enrolled}
+            points: DefaultDict[int, int] = defaultdict(int)
+            for student_id, _, course_points in {(s, c, p) for _, s, _, c, _, p in enrolled}:
+                points[student_id] += course_points
+
+            result = matching.match(
+                candidates, group_info,
+                {student_id: frozenset(roles) for student_id, roles in student_roles.items()},
+                points, counted_courses, semester.get_current_limit(time))
+
+            # The enrolled students leave their parallel groups and the queues
+            # of lower priority (see `Record.enroll_or_remove`).
+            taken: Dict[Tuple[int, matching.Slot], matching.QueuedRecord] = {
+                (r.student_id, group_info[r.group_id].slot): r
+                for r in candidates if r.id in result.enrolled
+            }
+            to_remove = set(result.over_limit)
+            for r in queued:
+                place = taken.get((r.student_id, group_info[r.group_id].slot))
+                if place is not None and r.id != place.id and (
+                        r.priority < place.priority or r.group_id == place.group_id):
+                    to_remove.add(r.id)
+            changed_groups = {r.group_id for r in queued if r.id in result.enrolled | to_remove}
+            for record_id, student_id, group_id, course_id, group_type, _ in enrolled:
+                place = taken.get((student_id, (course_id, group_type)))
+                if place is not None and place.group_id != group_id:
+                    to_remove.add(record_id)
+                    changed_groups.add(group_id)
+
+            now = datetime.now()
+            Record.objects.filter(pk__in=result.enrolled).update(
+                status=RecordStatus.ENROLLED, modified=now)
+            Record.objects.filter(pk__in=to_remove).update(status=RecordStatus.REMOVED, modified=now)
+            # The bulk updates do not send signals, so the counters, the event
+            # log and the queue index must be updated by hand.
+            StudentSemesterPoints.refresh({r.student_id for r in taken.values()}, semester.pk)
+            GroupRecordCounts.refresh(changed_groups)
+            RecordEvent.log(result.enrolled | to_remove, EventSource.RESOLUTION, now)
+            queues.unload_groups(changed_groups)
+            updates.publish_students(
+                {r.student_id for r in queued if r.id in result.enrolled | to_remove})
+            QueueResolution.objects.filter(pk=self.pk).update(resolved_at=now)
+            self.resolved_at = now
+
+        for r in candidates:
+            if r.id in result.enrolled:
+                student_pulled.send_robust(
+                    sender=Record, instance=groups[r.group_id], user=students[r.student_id].user)
+            elif r.id in result.over_limit:
+                student_not_pulled.send_robust(
+                    sender=Record, instance=groups[r.group_id], user=students[r.student_id].user,
+                    reason=CanEnroll.ECTS_LIMIT.value)
+        for auto_group_id in Group.objects.filter(
+                course__semester=semester, auto_enrollment=True).values_list('pk', flat=True):
+            Record.update_records_in_auto_enrollment_group(auto_group_id)
+        # The pullers fill the spots vacated by the students who moved and
+        # decide about the students left in the queues.
+        for group_id in groups:
+            GROUP_CHANGE_SIGNAL.send(None, group_id=group_id)
+        report = ResolutionReport(
+            num_queued=len(queued), num_enrolled=len(result.enrolled),
+            num_removed=len(to_remove) - len(result.over_limit),
+            num_over_limit=len(result.over_limit), rounds=result.rounds,
+            seconds=time_module.perf_counter() - start)
+        LOGGER.info('Queues of %s resolved: %s', semester, report)
+        return report
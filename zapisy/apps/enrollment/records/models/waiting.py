@@ -0,0 +1,96 @@
+"""Module waiting finds the students waiting for a place in a course.
+
+A student is waiting for a group type of a course (e.g. the exercises of
+Cooking) when he is enqueued into some group of that type, but is not enrolled
+into any. Staff use these numbers to decide which groups to open.
+
+The students are found with a single query: the QUEUED records of the courses,
+anti-joined (`NOT EXISTS`) with the ENROLLED records of the same student, course
+and group type. The anti-join is answered by the index on the records'
+students.
+
+The numbers of a whole semester, shown in the groups statistics, are cached.
+Every change of a record's status changes the counters of its group, so
+`GroupRecordCounts.refresh` invalidates the numbers of the semesters whose
+counters it updates. Every semester has its own version, which is a part of
+the key, so that the changes in one semester leave the numbers of the others
+in the cache. During the enrollment the numbers hardly stay in the cache at
+all, so the course page, which needs a single course, counts them directly.
+"""
+from collections import defaultdict
+from typing import DefaultDict, Dict, Iterable, List
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models
+
+from apps.common import cache_versions
+from apps.enrollment.courses.models import CourseInstance
+from apps.users.models import Student
+
+
+def _waiting_records(courses: Iterable[CourseInstance]) -> models.QuerySet:
+    """QUEUED records of students not enrolled into any group of the type."""
+    from apps.enrollment.records.models.records import Record, RecordStatus
+    enrolled = Record.objects.filter(
+        status=RecordStatus.ENROLLED, student_id=models.OuterRef('student_id'),
+        group__course_id=models.OuterRef('group__course_id'),
+        group__type=models.OuterRef('group__type'))
+    return Record.objects.filter(
+        status=RecordStatus.QUEUED, group__course__in=courses).filter(~models.Exists(enrolled))
+
+
+def count_waiting_students(
+        courses: Iterable[CourseInstance]) -> DefaultDict[int, DefaultDict[int, int]]:
+    """Counts the waiting students by course and group type, bypassing the cache."""
+    counts = _waiting_records(courses).values('group__course_id', 'group__type').annotate(
+        num_waiting=models.Count('student_id', distinct=True)).order_by()
+    ret = defaultdict(lambda: defaultdict(int))
+    for row in counts:
+        ret[row['group__course_id']][row['group__type']] = row['num_waiting']
+    return ret
+
+
+def _version_key(semester_id: int) -> str:
+    return f'waiting-students-version:{semester_id}'
+
+
+def get_semester_counts(semester_id: int) -> Dict[int, Dict[int, int]]:
+    """Returns the numbers of waiting students of the semester's courses.
+
+    The result is a dict indexed by course id. Every entry is a dict mapping
+    group type to the number of waiting students. It is read from the cache or
+    computed in one query.
+    """
+    key = f'waiting-students:{semester_id}:{cache_versions.get(_version_key(semester_id))}'
+    counts = cache.get(key)
+    if counts is None:
+        computed = count_waiting_students(CourseInstance.objects.filter(semester_id=semester_id))
+        counts = {course_id: dict(by_type) for course_id, by_type in computed.items()}
+        cache.set(key, counts, settings.WAITING_STUDENTS_CACHE_TIMEOUT)
+    return counts
+
+
+def waiting_students_by_type(
+        courses: Iterable[CourseInstance]) -> Dict[int, Dict[int, List[Student]]]:
+    """Lists the waiting students by course and group type.
+
+    The students (with their users) are ordered by name. This is not cached, it
+    is meant for a few courses at a time.
+    """
+    rows = list(_waiting_records(courses).values_list(
+        'group__course_id', 'group__type', 'student_id').distinct())
+    students = Student.objects.filter(
+        pk__in={student_id for _, _, student_id in rows}).select_related('user').in_bulk()
+    ret = defaultdict(lambda: defaultdict(list))
+    for course_id, group_type, student_id in rows:
+        ret[course_id][group_type].append(students[student_id])
+    for by_type in ret.values():
+        for waiting in by_type.values():
+            waiting.sort(key=lambda s: (s.user.last_name, s.user.first_name))
+    return {course_id: dict(by_type) for course_id, by_type in ret.items()}
+
+
+def invalidate(semester_ids: Iterable[int]):
+    """Drops the cached numbers of the semesters."""
+    cache_versions.bump(*{_version_key(semester_id) for semester_id in semester_ids})
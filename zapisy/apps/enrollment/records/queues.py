@@ -0,0 +1,406 @@
+"""Module queues keeps an ordered index of every group's queue.
+
+Deciding who is the next student to be pulled into a group used to require
+reading all the group's QUEUED records from the database. Instead, we keep
+every group's queue in a compact ordered structure: one ordered sequence of
+record ids per guaranteed-spots role (plus the general sequence indexed with
+'-', holding everyone). The first element of a sequence can be then found in
+logarithmic time.
+
+The index is not the source of truth, the `Record` table is. The index is kept
+as a superset of the QUEUED records in the group:
+
+  * A record is added to the index as soon as it becomes QUEUED (even before
+    the transaction commits).
+  * A record is discarded from the index only after the transaction changing
+    its status commits.
+  * The puller verifies every candidate picked from the index against the
+    database. Candidates that are no longer QUEUED (or no longer belong to
+    the role) are discarded on the way.
+
+This way a lost update or a rolled-back transaction may only leave a stale
+entry in the index, which is harmless, but never hide a waiting student.
+
+Two backends are provided. When tasks run asynchronously (RUN_ASYNC), web
+servers and workers are separate processes, so the index is stored in Redis
+(sorted sets). Otherwise (in development and tests) a local in-memory backend
+is used.
+"""
+import bisect
+import threading
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import (DefaultDict, Dict, FrozenSet, Iterable, Iterator, List, NamedTuple, Optional, Set,
+                    Tuple)
+
+import django_rq
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from apps.enrollment.courses.models.group import GuaranteedSpots
+
+# The sequence holding all the queued records of the group regardless of their
+# roles. It is the same key that `Record.free_spots_by_role` uses for spots not
+# guaranteed to any role.
+ALL = '-'
+
+
+class QueueEntry(NamedTuple):
+    """Describes a single QUEUED record in the index."""
+    record_id: int
+    created: datetime
+    # Names of the group's guaranteed-spots roles that the student has.
+    roles: FrozenSet[str] = frozenset()
+
+
+class QueueBackend(ABC):
+    """Storage of the ordered queues.
+
+    The entries are ordered by their creation time (ties broken by the record
+    id). Every entry is present in the sequence '-' and in the sequences of
+    all its roles.
+    """
+
+    @abstractmethod
+    def is_loaded(self, group_id: int) -> bool:
+        """Tells if the group's queue has been read from the database."""
+        pass
+
+    @abstractmethod
+    def load(self, group_id: int, entries: Iterable[QueueEntry]) -> None:
+        """Merges the entries into the group's queue and marks it loaded."""
+        pass
+
+    @abstractmethod
+    def add(self, group_id: int, entry: QueueEntry) -> None:
+        pass
+
+    @abstractmethod
+    def discard(self, group_id: int, record_ids: Iterable[int], role: Optional[str] = None) -> None:
+        """Removes the entries from the group's queue.
+
+        If the role is specified, the entries are only removed from the
+        sequence of that role.
+        """
+        pass
+
+    @abstractmethod
+    def head(self, group_id: int, role: str = ALL, start: int = 0, num: int = 1) -> List[int]:
+        """Returns ids of at most `num` records in the role's sequence.
+
+        The records are returned in order, starting from position `start`.
+        """
+        pass
+
+    @abstractmethod
+    def unload(self, group_id: int) -> None:
+        """Marks the queue not loaded, so it is merged with the database again."""
+        pass
+
+    @abstractmethod
+    def flush(self) -> None:
+        pass
+
+
+class LocalQueueBackend(QueueBackend):
+    """Keeps the queues in the memory of the current process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loaded: Set[int] = set()
+        # For every group and role a sorted list of (created, record_id).
+        self.queues: DefaultDict[int, DefaultDict[str, List[Tuple[datetime, int]]]] = defaultdict(
+            lambda: defaultdict(list))
+        # For every group maps record_id to its sort key.
+        self.keys: DefaultDict[int, Dict[int, Tuple[datetime, int]]] = defaultdict(dict)
+
+    def is_loaded(self, group_id: int) -> bool:
+        return group_id in self.loaded
+
+    def load(self, group_id: int, entries: Iterable[QueueEntry]) -> None:
+        with self.lock:
+            for entry in entries:
+                self._add(group_id, entry)
+            self.loaded.add(group_id)
+
+    def add(self, group_id: int, entry: QueueEntry) -> None:
+        with self.lock:
+            self._add(group_id, entry)
+
+    def _add(self, group_id: int, entry: QueueEntry):
+        key = (entry.created, entry.record_id)
+        self.keys[group_id][entry.record_id] = key
+        for role in {ALL, *entry.roles}:
+            sequence = self.queues[group_id][role]
+            pos = bisect.bisect_left(sequence, key)
+            if pos == len(sequence) or sequence[pos] != key:
+                sequence.insert(pos, key)
+
+    def discard(self, group_id: int, record_ids: Iterable[int], role: Optional[str] = None) -> None:
+        with self.lock:
+            keys = self.keys[group_id]
+            for record_id in record_ids:
+                key = keys.get(record_id)
+                if key is None:
+                    continue
+                roles = list(self.queues[group_id]) if role is None else [role]
+                for r in roles:
+                    sequence = self.queues[group_id][r]
+                    pos = bisect.bisect_left(sequence, key)
+                    if pos < len(sequence) and sequence[pos] == key:
+                        del sequence[pos]
+                if role is None:
+                    del keys[record_id]
+
+    def head(self, group_id: int, role: str = ALL, start: int = 0, num: int = 1) -> List[int]:
+        with self.lock:
+            sequence = self.queues[group_id].get(role, [])
+            return [record_id for _, record_id in sequence[start:start + num]]
+
+    def unload(self, group_id: int) -> None:
+        with self.lock:
+            self.loaded.discard(group_id)
+
+    def flush(self) -> None:
+        with self.lock:
+            self.loaded.clear()
+            self.queues.clear()
+            self.keys.clear()
+
+
+class RedisQueueBackend(QueueBackend):
+    """Keeps the queues in Redis sorted sets, shared by all the processes.
+
+    Every (group, role) sequence is a sorted set scored with the creation time
+    in whole microseconds (see `_score`). Members are zero-padded record ids,
+    so that ties are broken by the id.
+    """
+    # The queues of groups no one touches for a week will simply disappear.
+    TTL = 7 * 24 * 60 * 60
+    # A part of the keys. It changes with the format of the scores, so that
+    # the queues are loaded again rather than mixed with the old ones.
+    VERSION = 2
+
+    def __init__(self, connection=None):
+        self.redis_client = connection or django_rq.get_connection()
+
+    @staticmethod
+    def _queue_key(group_id: int, role: str) -> str:
+        return f'enrollment:queue:v{RedisQueueBackend.VERSION}#{group_id}:{role}'
+
+    @staticmethod
+    def _roles_key(group_id: int) -> str:
+        return f'enrollment:queue-roles:v{RedisQueueBackend.VERSION}#{group_id}'
+
+    @staticmethod
+    def _loaded_key(group_id: int) -> str:
+        return f'enrollment:queue-loaded:v{RedisQueueBackend.VERSION}#{group_id}'
+
+    @staticmethod
+    def _member(record_id: int) -> str:
+        return f'{record_id:012d}'
+
+    @staticmethod
+    def _score(created: datetime) -> int:
+        """Counts the microseconds since the epoch.
+
+        A float timestamp keeps only a fraction of a microsecond and may give
+        equal scores to distinct times. These integers are represented exactly.
+        The time is not converted, so that the order is the same as in the
+        database, even when the clocks are turned back.
+        """
+        epoch = datetime(1970, 1, 1) if created.tzinfo is None else datetime(
+            1970, 1, 1, tzinfo=timezone.utc)
+        return (created - epoch) // timedelta(microseconds=1)
+
+    def _add(self, pipe, group_id: int, entry: QueueEntry):
+        score = self._score(entry.created)
+        for role in {ALL, *entry.roles}:
+            key = self._queue_key(group_id, role)
+            pipe.zadd(key, {self._member(entry.record_id): score})
+            pipe.expire(key, self.TTL)
+            pipe.sadd(self._roles_key(group_id), role)
+        pipe.expire(self._roles_key(group_id), self.TTL)
+
+    def is_loaded(self, group_id: int) -> bool:
+        return bool(self.redis_client.exists(self._loaded_key(group_id)))
+
+    def load(self, group_id: int, entries: Iterable[QueueEntry]) -> None:
+        pipe = self.redis_client.pipeline()
+        for entry in entries:
+            self._add(pipe, group_id, entry)
+        pipe.set(self._loaded_key(group_id), 1, ex=self.TTL)
+        pipe.execute()
+
+    def add(self, group_id: int, entry: QueueEntry) -> None:
+        pipe = self.redis_client.pipeline()
+        self._add(pipe, group_id, entry)
+        pipe.execute()
+
+    def discard(self, group_id: int, record_ids: Iterable[int], role: Optional[str] = None) -> None:
+        members = [self._member(record_id) for record_id in record_ids]
+        if not members:
+            return
+        if role is None:
+            roles = [r.decode() for r in self.redis_client.smembers(self._roles_key(group_id))]
+        else:
+            roles = [role]
+        pipe = self.redis_client.pipeline()
+        for r in roles:
+            pipe.zrem(self._queue_key(group_id, r), *members)
+        pipe.execute()
+
+    def head(self, group_id: int, role: str = ALL, start: int = 0, num: int = 1) -> List[int]:
+        members = self.redis_client.zrange(self._queue_key(group_id, role), start,
+                                           start + num - 1)
+        return [int(m) for m in members]
+
+    def unload(self, group_id: int) -> None:
+        self.redis_client.delete(self._loaded_key(group_id))
+
+    def flush(self) -> None:
+        # The keys of all the versions.
+        for key in self.redis_client.scan_iter('enrollment:queue*'):
+            self.redis_client.delete(key)
+
+
+_local_backend = LocalQueueBackend()
+
+
+def get_queue_backend() -> QueueBackend:
+    """Returns the backend appropriate for the current setting of RUN_ASYNC.
+
+    Client code should always call this function instead of instantiating the
+    backends directly.
+    """
+    if not settings.RUN_ASYNC:
+        return _local_backend
+    return RedisQueueBackend()
+
+
+def student_roles_in_group(student_id: int, group_id: int) -> FrozenSet[str]:
+    """Returns names of the group's guaranteed-spots roles the student has."""
+    return frozenset(
+        GuaranteedSpots.objects.filter(group_id=group_id, role__user__student=student_id).values_list(
+            'role__name', flat=True))
+
+
+def ensure_loaded(group_id: int, backend: Optional[QueueBackend] = None) -> QueueBackend:
+    """Makes sure the group's queue is present in the index.
+
+    The queue is read from the database with two queries: one for the queued
+    records and one for their guaranteed-spots roles.
+    """
+    from apps.enrollment.records.models.records import Record, RecordStatus
+    backend = backend or get_queue_backend()
+    if backend.is_loaded(group_id):
+        return backend
+    queued = Record.objects.filter(group_id=group_id, status=RecordStatus.QUEUED)
+    group_roles = GuaranteedSpots.objects.filter(group_id=group_id).values_list('role__name',
+                                                                                flat=True)
+    roles_by_record: DefaultDict[int, Set[str]] = defaultdict(set)
+    for record_id, role in queued.filter(student__user__groups__name__in=group_roles).values_list(
+            'id', 'student__user__groups__name'):
+        roles_by_record[record_id].add(role)
+    backend.load(group_id, (QueueEntry(record_id, created, frozenset(roles_by_record[record_id]))
+                            for record_id, created in queued.values_list('id', 'created')))
+    return backend
+
+
+def candidates(group_id: int, role: str = ALL, batch_size: int = 16) -> Iterator[List[int]]:
+    """Yields consecutive batches of candidates from the group's queue for the role.
+
+    The candidates must still be verified against the database. The generator
+    stops when the queue is exhausted.
+    """
+    backend = ensure_loaded(group_id)
+    start = 0
+    while True:
+        batch = backend.head(group_id, role, start, batch_size)
+        if not batch:
+            return
+        yield batch
+        start += len(batch)
+
+
+def add_records(records: Iterable[Tuple[int, int, int, datetime]]):
+    """Puts newly QUEUED records into the index.
+
+    Args:
+        records: tuples (record_id, group_id, student_id, created).
+    """
+    backend = get_queue_backend()
+    for record_id, group_id, student_id, created in records:
+        backend.add(group_id, QueueEntry(record_id, created,
+                                         student_roles_in_group(student_id, group_id)))
+
+
+def discard_records(group_id: int, record_ids: Iterable[int], role: Optional[str] = None,
+                    on_commit: bool = True):
+    """Removes records that are no longer QUEUED from the index.
+
+    By default the removal is deferred until the current transaction commits.
+    If it is rolled back, the records stay in the index.
+    """
+    record_ids = list(record_ids)
+    if not record_ids:
+        return
+
+    def discard():
+        get_queue_backend().discard(group_id, record_ids, role)
+
+    if on_commit:
+        transaction.on_commit(discard)
+    else:
+        discard()
+
+
+def unload_groups(group_ids: Iterable[int]):
+    """Forces the queues to be merged with the database on the next access."""
+    backend = get_queue_backend()
+    for group_id in group_ids:
+        backend.unload(group_id)
+
+
+@receiver(post_save, sender='records.Record')
+def record_save_signal_receiver(sender, instance, created, raw, **kwargs):
+    """Keeps the index in sync with records saved individually.
+
+    Bulk updates do not send this signal, so their callers must update the
+    index themselves.
+    """
+    from apps.enrollment.records.models.records import RecordStatus
+    if raw:
+        unload_groups([instance.group_id])
+        return
+    if instance.status == RecordStatus.QUEUED:
+        add_records([(instance.pk, instance.group_id, instance.student_id, instance.created)])
+    else:
+        discard_records(instance.group_id, [instance.pk])
+
+
+@receiver(post_save, sender=GuaranteedSpots)
+@receiver(post_delete, sender=GuaranteedSpots)
+def guaranteed_spots_change_signal_receiver(sender, instance, **kwargs):
+    """Role sequences must be rebuilt when the rules change."""
+    unload_groups([instance.group_id])
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def user_roles_change_signal_receiver(sender, instance, action, reverse, pk_set, **kwargs):
+    """Role sequences must be rebuilt when a student gains a role."""
+    from apps.enrollment.records.models.records import Record, RecordStatus
+    # A student losing a role leaves a stale entry, which is harmless.
+    if action != 'post_add':
+        return
+    queued = Record.objects.filter(status=RecordStatus.QUEUED)
+    if reverse:
+        # The users are added to an auth.Group (`instance`).
+        queued = queued.filter(student__user__in=pk_set)
+    else:
+        queued = queued.filter(student__user=instance)
+    unload_groups(set(queued.values_list('group_id', flat=True)))
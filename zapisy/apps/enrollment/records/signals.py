@@ -8,3 +8,12 @@ from django.dispatch import Signal
 
 # Signal senders must provide a `group_id` argument.
 GROUP_CHANGE_SIGNAL = Signal()
+
+# Sent by `Record.fill_group` every time it has to retry after a transaction
+# failure. Senders provide a `group_id` argument. Used by the load tests.
+GROUP_FILL_RETRY_SIGNAL = Signal()
+
+# Sent when the records of some students in a group change. Senders provide a
+# `group_id` and `student_ids` arguments. Used to keep the auto-enrollment
+# groups of the course in sync.
+STUDENTS_CHANGE_SIGNAL = Signal()
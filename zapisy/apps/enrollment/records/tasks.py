@@ -5,15 +5,21 @@ threads. A typical example is, when a student decides to leave a group, we
 should not make him wait for another student being pulled from the queue to take
 place he leaves vacant.
 """
+from typing import List
+
 from django.conf import settings
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django_rq import job
 
 from apps.enrollment.courses.models import Group
+from apps.enrollment.records.coalescing import JobCoalescer
 from apps.enrollment.records.models.opening_times import GroupOpeningTimes
 from apps.enrollment.records.models.records import Record
-from apps.enrollment.records.signals import GROUP_CHANGE_SIGNAL
+from apps.enrollment.records.signals import GROUP_CHANGE_SIGNAL, STUDENTS_CHANGE_SIGNAL
+
+# Keeps at most one `process_group_change` job pending or running per group.
+group_changes = JobCoalescer('group-change')
 
 
 @job
@@ -27,12 +33,44 @@ def update_auto_enrollment_groups(group_id: int):
     """Updates all auto-enrollment groups that must reflect the given group's state.
 
     All groups with automatic enrollment in the same course as given group must
-    have a state of enrollment reflecting the overall state of the course.
+    have a state of enrollment reflecting the overall state of the course. This
+    recomputes the whole course, so it is only run when a group is saved and
+    periodically (`manage.py sync_auto_enrollment`). Changes of single students
+    are handled by `update_students_in_auto_enrollment_groups`.
     """
     for group in Group.objects.filter(course__groups=group_id, auto_enrollment=True):
         Record.update_records_in_auto_enrollment_group(group.id)
 
 
+@job
+def update_students_in_auto_enrollment_groups(group_id: int, student_ids: List[int]):
+    """Syncs only the given students in the auto-enrollment groups of the course."""
+    Record.update_students_in_auto_enrollment_groups(group_id, student_ids)
+
+
+@job
+def process_group_change(group_id: int):
+    """Pulls students into the group, as long as the group changes.
+
+    The job is scheduled through `group_changes`, so there is at most one such
+    job pending or running for a single group.
+    """
+    group_changes.run(group_id, lambda: pull_from_queue(group_id))
+
+
+def schedule_group_change(group_id: int):
+    """Makes sure that the group will be filled.
+
+    Depending on RUN_ASYNC setting it will either run the task eagerly or
+    schedule it asynchronously. In the latter case, the triggers for the same
+    group are coalesced.
+    """
+    if not settings.RUN_ASYNC:
+        pull_from_queue(group_id)
+    else:
+        group_changes.trigger(group_id, lambda: process_group_change.delay(group_id))
+
+
 @receiver(GROUP_CHANGE_SIGNAL)
 def pull_from_queue_signal_receiver(sender, **kwargs):
     """Receives the signal call and runs pull_from_queue.
@@ -40,12 +78,25 @@ def pull_from_queue_signal_receiver(sender, **kwargs):
     Depending on RQ_QUEUES setting it will either run eagerly or asynchronously.
     """
     group_id = kwargs.get('group_id')
+    schedule_group_change(group_id)
+
+
+@receiver(STUDENTS_CHANGE_SIGNAL)
+def students_change_signal_receiver(sender, **kwargs):
+    """Syncs the auto-enrollment groups for the students whose records changed.
+
+    Depending on RUN_ASYNC setting it will either run eagerly or asynchronously.
+    The sync only reads the current state of the records, so the jobs need not
+    be coalesced or run in order.
+    """
+    group_id = kwargs.get('group_id')
+    student_ids = list(kwargs.get('student_ids'))
+    if not student_ids:
+        return
     if not settings.RUN_ASYNC:
-        pull_from_queue(group_id)
-        update_auto_enrollment_groups(group_id)
+        update_students_in_auto_enrollment_groups(group_id, student_ids)
     else:
-        pull_from_queue.delay(group_id)
-        update_auto_enrollment_groups.delay(group_id)
+        update_students_in_auto_enrollment_groups.delay(group_id, student_ids)
 
 
 @receiver(post_save, sender=Group)
@@ -72,9 +123,10 @@ def group_save_signal_receiver(sender, instance, created, raw, using, **kwargs):
         GroupOpeningTimes.populate_single_group_opening_times(instance)
         # Do not trigger pulling for new groups.
         return
-    if not settings.RUN_ASYNC:
-        pull_from_queue(group_id)
-        update_auto_enrollment_groups(group_id)
-    else:
-        pull_from_queue.delay(group_id)
-        update_auto_enrollment_groups.delay(group_id)
+    schedule_group_change(group_id)
+    if instance.auto_enrollment:
+        # The group might have just become an auto-enrollment group.
+        if not settings.RUN_ASYNC:
+            update_auto_enrollment_groups(group_id)
+        else:
+            update_auto_enrollment_groups.delay(group_id)
@@ -0,0 +1,339 @@
+"""Load-test harness for the enrollment opening.
+
+`generate_semester` builds a synthetic semester with the factories used by the
+tests: thousands of students with their T0 and group opening times, hundreds
+of groups (some with guaranteed spots) and an auto-enrollment lecture group in
+every course. `run_storm` then replays a burst of concurrent enrollment
+actions performed by these students through the same views the timetable
+prototype uses, and `check_invariants` verifies the final state.
+
+The harness is driven by `manage.py enrollment_load_test` and, at a small
+scale, by `test_load.py`. Group filling runs synchronously within the
+requests (`RUN_ASYNC=False`), so latencies include pulling students from the
+queue, which is the worst case for the web servers.
+"""
+import json
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from django.contrib.auth.models import Group as AuthGroup
+from django.db import connection
+from django.db.models import Sum
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from apps.enrollment.courses.models.course_instance import CourseInstance
+from apps.enrollment.courses.models.course_type import Type as CourseType
+from apps.enrollment.courses.models.group import Group, GroupType, GuaranteedSpots
+from apps.enrollment.courses.models.semester import Semester
+from apps.enrollment.courses.tests.factories import (CourseInstanceFactory, CourseTypeFactory,
+                                                     GroupFactory, SemesterFactory)
+from apps.enrollment.records import locks
+from apps.enrollment.records.models import (GroupOpeningTimes, GroupRecordCounts, Record,
+                                            RecordStatus, StudentOpeningTimes, T0Times)
+from apps.enrollment.records.signals import GROUP_FILL_RETRY_SIGNAL
+from apps.users.models import Student, User
+from apps.users.tests.factories import EmployeeFactory, StudentFactory
+
+# All the users created by the harness share this prefix, so they can be
+# cleaned up afterwards.
+USERNAME_PREFIX = 'loadtest_'
+ROLE_NAME = 'loadtest_isim'
+COURSE_TYPE_NAME = 'loadtest'
+
+ENQUEUE = 'enqueue'
+DEQUEUE = 'dequeue'
+SET_PRIORITY = 'set-priority'
+
+
+@dataclass
+class SyntheticSemester:
+    semester: Semester
+    students: List[Student]
+    # Groups students may enqueue into, i.e. not auto-enrollment ones.
+    groups: List[Group]
+    auto_groups: List[Group]
+
+
+@dataclass
+class StormReport:
+    num_requests: int = 0
+    duration: float = 0.0
+    latencies: List[float] = field(default_factory=list)
+    status_codes: Counter = field(default_factory=Counter)
+    transaction_retries: int = 0
+    lock_waits: int = 0
+    lock_wait_time: float = 0.0
+    violations: List[str] = field(default_factory=list)
+
+    @property
+    def throughput(self) -> float:
+        """Requests per second."""
+        return self.num_requests / self.duration if self.duration else 0.0
+
+    def percentile(self, p: float) -> float:
+        """Returns the p-th percentile of request latencies in seconds."""
+        if not self.latencies:
+            return 0.0
+        latencies = sorted(self.latencies)
+        index = min(len(latencies) - 1, int(p / 100 * len(latencies)))
+        return latencies[index]
+
+
+def generate_semester(num_students: int = 2000, num_courses: int = 100,
+                      groups_per_course: int = 4, seed: int = 0) -> SyntheticSemester:
+    """Creates a synthetic semester with the enrollment open right now.
+
+    About 5% of the students belong to a role with guaranteed spots, which are
+    offered in every fifth group. Every tenth student has earlier opening
+    times in the groups of a few courses (as if they voted for them). Group
+    limits are deliberately low to make the students compete for places.
+    """
+    rng = random.Random(seed)
+    now = datetime.now()
+    # Hashing a password for thousands of users would take most of the time.
+    with override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher']):
+        semester = SemesterFactory(
+            records_opening=now - timedelta(days=1),
+            records_closing=now + timedelta(days=7),
+            records_ects_limit_abolition=now + timedelta(days=3),
+            semester_beginning=now.date() + timedelta(days=14),
+            semester_ending=now.date() + timedelta(days=120),
+            lectures_beginning=now.date() + timedelta(days=14),
+            lectures_ending=now.date() + timedelta(days=100),
+        )
+        teachers = [
+            EmployeeFactory(user__pref_username=f'{USERNAME_PREFIX}{semester.pk}_teacher_{i}')
+            for i in range(max(1, num_courses // 10))
+        ]
+        students = [
+            StudentFactory(user__pref_username=f'{USERNAME_PREFIX}{semester.pk}_{i}',
+                           ects=rng.randrange(0, 240),
+                           records_opening_bonus_minutes=rng.choice([0, 0, 0, 10, 60]))
+            for i in range(num_students)
+        ]
+    role, _ = AuthGroup.objects.get_or_create(name=ROLE_NAME)
+    role.user_set.add(*(s.user for s in students if rng.random() < 0.05))
+
+    course_type = CourseTypeFactory(name=COURSE_TYPE_NAME)
+    groups = []
+    auto_groups = []
+    guaranteed_spots = []
+    for i in range(num_courses):
+        teacher = rng.choice(teachers)
+        course = CourseInstanceFactory(
+            semester=semester, name=f'Przedmiot {semester.pk}-{i}', owner=teacher,
+            course_type=course_type, points=rng.choice([2, 3, 4, 5, 6, 6, 8, 10]))
+        auto_groups.append(GroupFactory(
+            course=course, type=GroupType.LECTURE, teacher=teacher, limit=num_students,
+            auto_enrollment=True))
+        for _ in range(groups_per_course):
+            group = GroupFactory(course=course, teacher=rng.choice(teachers),
+                                 limit=rng.randrange(5, 25))
+            if len(groups) % 5 == 0:
+                guaranteed_spots.append(GuaranteedSpots(group=group, role=role, limit=2))
+            groups.append(group)
+    GuaranteedSpots.objects.bulk_create(guaranteed_spots)
+
+    T0Times.populate_t0(semester)
+    courses_groups: Dict[int, List[Group]] = {}
+    for group in groups + auto_groups:
+        courses_groups.setdefault(group.course_id, []).append(group)
+    t0_times = dict(T0Times.objects.filter(semester=semester).values_list('student_id', 'time'))
+    GroupOpeningTimes.objects.bulk_create([
+        GroupOpeningTimes(student=student, group=group,
+                          time=t0_times[student.pk] - timedelta(days=1))
+        for student in students[::10]
+        for course_groups in rng.sample(list(courses_groups.values()), min(3, num_courses))
+        for group in course_groups
+    ], ignore_conflicts=True)
+    StudentOpeningTimes.invalidate(semester.pk)
+    return SyntheticSemester(semester, students, groups, auto_groups)
+
+
+def _plan_actions(synthetic: SyntheticSemester, num_actions: int,
+                  rng: random.Random) -> List[Tuple[Student, Group, str]]:
+    """Draws the actions to perform.
+
+    Group popularity is skewed: a few groups attract most of the students,
+    like the ones with the best teachers do.
+    """
+    weights = [1 / (rank + 1) for rank in range(len(synthetic.groups))]
+    actions = []
+    enqueued: List[Tuple[Student, Group]] = []
+    for _ in range(num_actions):
+        kind = rng.choices([ENQUEUE, DEQUEUE, SET_PRIORITY], weights=[70, 15, 15])[0]
+        if kind == ENQUEUE or not enqueued:
+            student = rng.choice(synthetic.students)
+            group = rng.choices(synthetic.groups, weights=weights)[0]
+            enqueued.append((student, group))
+            actions.append((student, group, ENQUEUE))
+        else:
+            student, group = rng.choice(enqueued)
+            actions.append((student, group, kind))
+    return actions
+
+
+def _perform(client: Client, group: Group, kind: str, rng: random.Random) -> int:
+    if kind == SET_PRIORITY:
+        # The prototype has no priorities, so the records view is used here.
+        response = client.post(reverse('records-set-priority'), {
+            'group_id': group.pk,
+            'priority': rng.randrange(1, 11),
+        })
+    else:
+        response = client.post(
+            reverse('prototype-action', args=(group.pk,)),
+            json.dumps({'action': kind}), content_type='application/json')
+    return response.status_code
+
+
+def run_storm(synthetic: SyntheticSemester, num_actions: int = 5000, num_threads: int = 8,
+              seed: int = 0) -> StormReport:
+    """Replays concurrent enrollment actions and measures the system.
+
+    Every thread uses its own database connection, which is closed when the
+    thread finishes.
+    """
+    rng = random.Random(seed)
+    actions = _plan_actions(synthetic, num_actions, rng)
+    report = StormReport(num_requests=len(actions))
+    lock = threading.Lock()
+
+    def count_retry(sender, **kwargs):
+        with lock:
+            report.transaction_retries += 1
+
+    def worker(thread_num: int):
+        thread_rng = random.Random(seed * 1000 + thread_num)
+        clients: Dict[int, Client] = {}
+        latencies = []
+        status_codes: Counter = Counter()
+        try:
+            for student, group, kind in actions[thread_num::num_threads]:
+                client = clients.get(student.pk)
+                if client is None:
+                    client = Client(raise_request_exception=False)
+                    client.force_login(student.user)
+                    clients[student.pk] = client
+                start = time.perf_counter()
+                status_codes[_perform(client, group, kind, thread_rng)] += 1
+                latencies.append(time.perf_counter() - start)
+        finally:
+            connection.close()
+        with lock:
+            report.latencies.extend(latencies)
+            report.status_codes.update(status_codes)
+
+    GROUP_FILL_RETRY_SIGNAL.connect(count_retry, weak=False)
+    try:
+        with override_settings(RUN_ASYNC=False):
+            lock_stats = locks.get_lock_stats()
+            lock_stats.reset()
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=num_threads) as executor:
+                list(executor.map(worker, range(num_threads)))
+            report.duration = time.perf_counter() - start
+            for waits, wait_time in lock_stats.stats().values():
+                report.lock_waits += waits
+                report.lock_wait_time += wait_time
+    finally:
+        GROUP_FILL_RETRY_SIGNAL.disconnect(count_retry)
+    report.violations = check_invariants(synthetic)
+    return report
+
+
+def check_invariants(synthetic: SyntheticSemester) -> List[str]:
+    """Verifies the state of the records after the storm.
+
+    Returns:
+        A list of human-readable descriptions of the violations found: groups
+        over their limits, inconsistent group counters, students enrolled into
+        more than one group of the same type in a course and students over the
+        ECTS limit.
+    """
+    violations = []
+    semester = synthetic.semester
+    groups = Group.objects.filter(course__semester=semester).annotate(
+        guaranteed=Sum('guaranteed_spots__limit'))
+    enrolled = Counter(
+        Record.objects.filter(group__course__semester=semester,
+                              status=RecordStatus.ENROLLED).values_list('group_id', flat=True))
+    for group in groups:
+        capacity = group.limit + (group.guaranteed or 0)
+        if enrolled[group.pk] > capacity:
+            violations.append(
+                f"Group {group.pk} has {enrolled[group.pk]} students enrolled, capacity {capacity}.")
+
+    # The materialized counters must agree with the records.
+    stored = GroupRecordCounts.objects.filter(group__in=groups).values_list(
+        'group_id', 'num_enrolled', 'num_enqueued')
+    actual = GroupRecordCounts.compute(group.pk for group in groups)
+    for group_id, num_enrolled, num_enqueued in stored:
+        if actual[group_id] != {'num_enrolled': num_enrolled, 'num_enqueued': num_enqueued}:
+            violations.append(f"Group {group_id} has inconsistent counters.")
+
+    parallel = Counter(
+        Record.objects.filter(group__course__semester=semester,
+                              status=RecordStatus.ENROLLED).values_list(
+                                  'student_id', 'group__course_id', 'group__type'))
+    for (student_id, course_id, group_type), count in parallel.items():
+        if count > 1:
+            violations.append(
+                f"Student {student_id} is enrolled into {count} groups of type {group_type} "
+                f"in course {course_id}.")
+
+    limit = semester.get_current_limit()
+    points = Counter()
+    for student_id, course_id, course_points in Record.objects.filter(
+            group__course__semester=semester, status=RecordStatus.ENROLLED).values_list(
+                'student_id', 'group__course_id', 'group__course__points').distinct():
+        points[student_id] += course_points
+    for student_id, total in points.items():
+        if total > limit:
+            violations.append(f"Student {student_id} has {total} ECTS, the limit is {limit}.")
+    return violations
+
+
+def cleanup(semester: Optional[Semester] = None):
+    """Removes the data created by the harness.
+
+    If the semester is not given, all the synthetic semesters are removed.
+    Groups, records and opening times go away with the semester.
+    """
+    users = User.objects.filter(username__startswith=USERNAME_PREFIX)
+    semesters = Semester.objects.filter(pk__in=CourseInstance.objects.filter(
+        owner__user__username__startswith=USERNAME_PREFIX).values('semester_id'))
+    if semester is not None:
+        users = users.filter(username__startswith=f'{USERNAME_PREFIX}{semester.pk}_')
+        semesters = semesters.filter(pk=semester.pk)
+    semesters.delete()
+    users.delete()
+    CourseType.objects.filter(name=COURSE_TYPE_NAME, courseinformation__isnull=True).delete()
+    AuthGroup.objects.filter(name=ROLE_NAME, user__isnull=True).delete()
+
+
+def format_report(report: StormReport) -> List[str]:
+    """Renders the report as lines of text."""
+    lines = [
+        f"Requests: {report.num_requests} in {report.duration:.2f}s "
+        f"({report.throughput:.1f} req/s)",
+        f"Latency p50: {report.percentile(50) * 1000:.1f}ms, "
+        f"p99: {report.percentile(99) * 1000:.1f}ms",
+        "Responses: " + ", ".join(
+            f"{code}: {count}" for code, count in sorted(report.status_codes.items())),
+        f"Transaction retries in fill_group: {report.transaction_retries}",
+        f"Lock waits: {report.lock_waits}, total wait time: {report.lock_wait_time:.2f}s",
+    ]
+    if report.violations:
+        lines.append(f"Invariant violations: {len(report.violations)}")
+        lines.extend(f"   {violation}" for violation in report.violations)
+    else:
+        lines.append("Invariants hold.")
+    return lines
@@ -0,0 +1,191 @@
+"""Query-plan checks for the queries reading the `Record` table.
+
+The `Record` table is the largest one in the system and it is read on every
+step of the enrollment. Its hot queries must be served by the indexes defined
+in `Record.Meta`. This module runs the functions of `records.py`, `queues.py`
+and the views of the timetable and statistics against a synthetic semester
+(see `loadgen.py`), captures the SQL they execute, and runs `EXPLAIN` on every
+SELECT touching the records. A plan containing a sequential scan of the table
+is reported as a regression.
+
+The checks are driven by `manage.py record_query_plans` on a large dataset
+with the actual planner and, at a small scale, by `test_query_plans.py`. On a
+small table the planner prefers sequential scans anyway, so the test turns
+them off (`enable_seqscan`): a sequential scan is then chosen only if no index
+can serve the query at all.
+"""
+import json
+import random
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Callable, Dict, List
+
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from apps.enrollment.courses.models.course_instance import CourseInstance
+from apps.enrollment.records import queues
+from apps.enrollment.records.models import (GroupRecordCounts, Record, RecordStatus,
+                                            StudentSemesterPoints)
+from apps.enrollment.records.tests.loadgen import USERNAME_PREFIX, SyntheticSemester
+from apps.users.tests.factories import EmployeeFactory
+
+RECORD_TABLE = Record._meta.db_table
+
+
+@dataclass
+class PlannedQuery:
+    scenario: str
+    sql: str
+    plan: Dict
+    seq_scan: bool
+
+    @property
+    def duration(self) -> float:
+        """Execution time in milliseconds, if the query has been analyzed."""
+        return self.plan.get('Execution Time', 0.0)
+
+
+@dataclass
+class PlanReport:
+    queries: List[PlannedQuery] = field(default_factory=list)
+
+    @property
+    def regressions(self) -> List[PlannedQuery]:
+        return [q for q in self.queries if q.seq_scan]
+
+
+def generate_records(synthetic: SyntheticSemester, per_student: int = 10, seed: int = 0):
+    """Fills the synthetic semester with records in all possible statuses.
+
+    The records are created with a bulk insert, so they need not respect the
+    limits. The materialized counters are recomputed, as they would be kept
+    up to date in production, and the queue index is invalidated.
+    """
+    rng = random.Random(seed)
+    statuses = [RecordStatus.QUEUED, RecordStatus.ENROLLED, RecordStatus.REMOVED]
+    now = synthetic.semester.records_opening
+    Record.objects.bulk_create([
+        Record(student=student, group=group, status=rng.choice(statuses),
+               priority=rng.randrange(1, 11), created=now + timedelta(seconds=rng.randrange(3600)))
+        for student in synthetic.students
+        for group in rng.sample(synthetic.groups, min(per_student, len(synthetic.groups)))
+    ], batch_size=5000)
+    group_ids = [g.pk for g in synthetic.groups + synthetic.auto_groups]
+    GroupRecordCounts.refresh(group_ids)
+    StudentSemesterPoints.refresh([s.pk for s in synthetic.students], synthetic.semester.pk)
+    queues.unload_groups(group_ids)
+    with connection.cursor() as cursor:
+        cursor.execute(f'ANALYZE {RECORD_TABLE}')
+
+
+def _scenarios(synthetic: SyntheticSemester) -> Dict[str, Callable[[], object]]:
+    """The operations whose queries are checked, by name."""
+    semester = synthetic.semester
+    student = synthetic.students[0]
+    group = Record.objects.filter(group__in=synthetic.groups, status=RecordStatus.QUEUED).first().group
+    groups = synthetic.groups[:20]
+    courses = CourseInstance.objects.filter(semester=semester)
+    queued = Record.objects.filter(group=group, status=RecordStatus.QUEUED).first()
+
+    student_client = Client(raise_request_exception=False)
+    student_client.force_login(student.user)
+    # The statistics require a permission, which is easiest to get this way.
+    employee = EmployeeFactory(user__pref_username=f'{USERNAME_PREFIX}{semester.pk}_stats',
+                               user__is_superuser=True)
+    employee_client = Client(raise_request_exception=False)
+    employee_client.force_login(employee.user)
+
+    def in_rolled_back_transaction(function):
+        def run():
+            with transaction.atomic():
+                function()
+                transaction.set_rollback(True)
+        return run
+
+    def ensure_loaded():
+        queues.unload_groups([group.pk])
+        queues.ensure_loaded(group.pk)
+
+    return {
+        'is_recorded_in_groups': lambda: Record.is_recorded_in_groups(student, groups),
+        'can_enroll': lambda: Record.can_enroll(student, group),
+        'free_spots_by_role_in_groups': lambda: Record.free_spots_by_role_in_groups(groups),
+        'queue_positions': lambda: Record.queue_positions(queued.student, semester),
+        'list_waiting_students': lambda: Record.list_waiting_students(courses),
+        'group_counts': lambda: GroupRecordCounts.compute(g.pk for g in groups),
+        'student_points': lambda: StudentSemesterPoints.compute([student.pk], semester.pk),
+        'queue_index_load': ensure_loaded,
+        'pull_records_into_group': in_rolled_back_transaction(
+            lambda: Record.pull_records_into_group(group.pk)),
+        'enroll_or_remove': in_rolled_back_transaction(lambda: queued.enroll_or_remove(group)),
+        'auto_enrollment_sync': in_rolled_back_transaction(
+            lambda: Record.update_records_in_auto_enrollment_group(synthetic.auto_groups[0].pk)),
+        'auto_enrollment_student_sync': in_rolled_back_transaction(
+            lambda: Record.update_students_in_auto_enrollment_groups(group.pk, [queued.student_id])),
+        'prototype_update_groups': lambda: student_client.post(
+            reverse('prototype-update'), json.dumps([g.pk for g in groups]),
+            content_type='application/json'),
+        'prototype_queue_positions': lambda: student_client.get(
+            reverse('prototype-queue-positions')),
+        # The calendar is streamed, so the queries run while it is read.
+        'calendar_export': lambda: b''.join(
+            student_client.get(reverse('calendar-export')).streaming_content),
+        'statistics_groups': lambda: employee_client.get(reverse('statistics:groups')),
+    }
+
+
+def _has_seq_scan(node: Dict, table: str) -> bool:
+    if node.get('Node Type') == 'Seq Scan' and node.get('Relation Name') == table:
+        return True
+    return any(_has_seq_scan(child, table) for child in node.get('Plans', []))
+
+
+def check_plans(synthetic: SyntheticSemester, analyze: bool = True,
+                disable_seqscan: bool = False) -> PlanReport:
+    """Explains every SELECT on the records executed by the scenarios.
+
+    Everything, including the changes made by the scenarios, is rolled back
+    afterwards.
+    """
+    report = PlanReport()
+    seen = set()
+    options = 'ANALYZE, FORMAT JSON' if analyze else 'FORMAT JSON'
+    with transaction.atomic():
+        if disable_seqscan:
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        for name, scenario in _scenarios(synthetic).items():
+            with CaptureQueriesContext(connection) as captured:
+                scenario()
+            for query in captured.captured_queries:
+                sql = query['sql']
+                # Compound queries (UNION, EXCEPT) start with a parenthesis.
+                if not sql.lstrip('(').startswith('SELECT') or f'"{RECORD_TABLE}"' not in sql or sql in seen:
+                    continue
+                seen.add(sql)
+                with connection.cursor() as cursor:
+                    cursor.execute(f'EXPLAIN ({options}) {sql}')
+                    plan = cursor.fetchone()[0]
+                    if isinstance(plan, str):
+                        plan = json.loads(plan)
+                plan = plan[0]
+                report.queries.append(PlannedQuery(
+                    name, sql, plan, _has_seq_scan(plan['Plan'], RECORD_TABLE)))
+        transaction.set_rollback(True)
+    return report
+
+
+def format_report(report: PlanReport) -> List[str]:
+    """Renders the report as lines of text."""
+    lines = []
+    for query in report.queries:
+        verdict = 'SEQ SCAN' if query.seq_scan else 'ok'
+        lines.append(f"{query.scenario:<30} {query.duration:>9.2f}ms  {verdict}")
+    lines.append(f"Queries: {len(report.queries)}, sequential scans of {RECORD_TABLE}: "
+                 f"{len(report.regressions)}")
+    for query in report.regressions:
+        lines.append(f"   [{query.scenario}] {query.sql}")
+    return lines
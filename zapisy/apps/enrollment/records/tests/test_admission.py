@@ -0,0 +1,81 @@
+"""Tests for the admission control of the enrollment actions."""
+import json
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from freezegun import freeze_time
+
+from apps.enrollment.courses.tests.factories import GroupFactory
+from apps.enrollment.records import admission
+from apps.users.tests.factories import StudentFactory
+
+
+@override_settings(ADMISSION_BUCKET_SIZE=2, ADMISSION_REFILL_RATE=0.5,
+                   ADMISSION_MAX_CONCURRENT=2)
+class LocalAdmissionBackendTest(SimpleTestCase):
+
+    def setUp(self):
+        self.backend = admission.LocalAdmissionBackend()
+
+    def test_token_bucket(self):
+        self.assertEqual(self.backend.take_token(1, now=100), 0)
+        self.assertEqual(self.backend.take_token(1, now=100), 0)
+        self.assertEqual(self.backend.take_token(1, now=100), 2)
+        # Other users have their own buckets.
+        self.assertEqual(self.backend.take_token(2, now=100), 0)
+        self.assertEqual(self.backend.take_token(1, now=101), 1)
+        self.assertEqual(self.backend.take_token(1, now=102), 0)
+
+    def test_concurrency_cap(self):
+        first = self.backend.acquire_slot(now=100)
+        self.assertIsNotNone(self.backend.acquire_slot(now=100))
+        self.assertIsNone(self.backend.acquire_slot(now=100))
+        self.backend.release_slot(first)
+        self.assertIsNotNone(self.backend.acquire_slot(now=100))
+        # Abandoned slots are freed eventually.
+        self.assertIsNotNone(self.backend.acquire_slot(now=100 + admission.SLOT_TIMEOUT + 1))
+
+
+@override_settings(RUN_ASYNC=False, ADMISSION_BUCKET_SIZE=1, ADMISSION_REFILL_RATE=0.1)
+class AdmissionControlTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.group = GroupFactory()
+        cls.bolek = StudentFactory()
+
+    def setUp(self):
+        admission.get_admission_backend().flush()
+        self.client.force_login(self.bolek.user)
+
+    def pin(self):
+        return self.client.post(
+            reverse('prototype-action', args=(self.group.pk,)),
+            json.dumps({'action': 'pin'}), content_type='application/json')
+
+    @freeze_time()
+    def test_user_over_limit_is_asked_to_wait(self):
+        self.assertEqual(self.pin().status_code, 204)
+        response = self.pin()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json(), {'retry_after_ms': 10000})
+        self.assertEqual(response['Retry-After'], '10')
+
+    @override_settings(ADMISSION_MAX_CONCURRENT=0, ADMISSION_RETRY_MS=300)
+    def test_global_cap(self):
+        response = self.pin()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json(), {'retry_after_ms': 300})
+
+    @freeze_time()
+    def test_global_cap_keeps_the_token(self):
+        with self.settings(ADMISSION_MAX_CONCURRENT=0):
+            self.assertEqual(self.pin().status_code, 429)
+        self.assertEqual(self.pin().status_code, 204)
+
+    def test_form_gets_redirected(self):
+        self.pin()
+        response = self.client.post(reverse('records-enqueue'), {'group_id': self.group.pk},
+                                    HTTP_REFERER='/courses/')
+        self.assertRedirects(response, reverse('course-page', args=(self.group.course.slug,)),
+                             fetch_redirect_response=False)
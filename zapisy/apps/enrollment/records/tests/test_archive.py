@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from apps.enrollment.courses.tests.factories import GroupFactory
+from apps.enrollment.records.models import ArchivedRecord, Record, RecordStatus
+from apps.users.tests.factories import StudentFactory
+
+
+class ArchivedRecordTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.group = GroupFactory()
+        cls.semester = cls.group.course.semester
+        cls.bolek = StudentFactory()
+        cls.lolek = StudentFactory()
+        cls.enrolled = Record.objects.create(
+            group=cls.group, student=cls.bolek, status=RecordStatus.ENROLLED)
+        cls.removed = [
+            Record.objects.create(group=cls.group, student=student, status=RecordStatus.REMOVED)
+            for student in [cls.bolek, cls.lolek, cls.lolek]
+        ]
+        cls.other_semester_removed = Record.objects.create(
+            group=GroupFactory(), student=cls.lolek, status=RecordStatus.REMOVED)
+
+    def close_semester(self):
+        self.semester.records_closing = datetime.now() - timedelta(days=1)
+        self.semester.save()
+
+    def test_archive_semester(self):
+        self.close_semester()
+        self.assertEqual(ArchivedRecord.archive_semester(self.semester, batch_size=2), 3)
+
+        self.assertEqual(list(Record.objects.filter(group=self.group)), [self.enrolled])
+        self.assertTrue(Record.objects.filter(pk=self.other_semester_removed.pk).exists())
+        archived = ArchivedRecord.objects.order_by('pk')
+        self.assertEqual([r.pk for r in archived], [r.pk for r in self.removed])
+        self.assertEqual(archived[0].student_id, self.bolek.pk)
+        self.assertEqual(archived[0].created, self.removed[0].created)
+        self.assertEqual(ArchivedRecord.archive_semester(self.semester), 0)
+
+    def test_open_semester_is_not_archived(self):
+        self.semester.records_closing = datetime.now() + timedelta(days=1)
+        self.semester.save()
+        with self.assertRaises(CommandError):
+            call_command('archive_records', semester=self.semester.pk, stdout=StringIO())
+        self.assertFalse(ArchivedRecord.objects.exists())
@@ -1,12 +1,15 @@
 """Tests for the logic of auto-enrollment groups."""
 import functools
 from datetime import timedelta
+from io import StringIO
 
 import freezegun
+from django.core.management import call_command
 from django.test import TestCase, override_settings
 
 from apps.enrollment.courses.tests.factories import (CourseInstanceFactory, GroupFactory, GroupType)
-from apps.enrollment.records.models import (GroupOpeningTimes, Record, RecordStatus, T0Times)
+from apps.enrollment.records.models import (GroupOpeningTimes, GroupRecordCounts, Record,
+                                            RecordStatus, StudentSemesterPoints, T0Times)
 from apps.users.tests.factories import StudentFactory
 
 
@@ -343,3 +346,41 @@ class AutoEnrollmentGroupTest(TestCase):
                     'status': RecordStatus.QUEUED
                 },
             ])
+
+    @enrollment_time
+    def test_only_changed_students_are_synced(self):
+        """The incremental sync leaves other students to the periodic one."""
+        self.assertTrue(Record.enqueue_student(self.bolek, self.exercise_1))
+        # Lolek's record is put in by hand, so no sync follows.
+        Record.objects.bulk_create([
+            Record(student=self.lolek, group=self.exercise_2, status=RecordStatus.ENROLLED)
+        ])
+        self.assertFalse(Record.is_recorded(self.lolek, self.lecture))
+
+        Record.update_students_in_auto_enrollment_groups(self.exercise_1.pk, [self.bolek.pk])
+        self.assertFalse(Record.is_recorded(self.lolek, self.lecture))
+        Record.update_students_in_auto_enrollment_groups(self.exercise_2.pk, [self.lolek.pk])
+        self.assertTrue(Record.is_enrolled(self.lolek, self.lecture))
+        self.assertEqual(
+            GroupRecordCounts.get_counts([self.lecture.pk])[self.lecture.pk]['num_enrolled'], 2)
+        semester = self.lecture.course.semester
+        self.assertEqual(
+            StudentSemesterPoints.get_points(self.lolek.pk, semester.pk),
+            StudentSemesterPoints.compute([self.lolek.pk], semester.pk)[self.lolek.pk])
+
+        # The student leaves the lecture with his last group.
+        Record.objects.filter(student=self.lolek, group=self.exercise_2).update(
+            status=RecordStatus.REMOVED)
+        Record.update_students_in_auto_enrollment_groups(self.exercise_2.pk, [self.lolek.pk])
+        self.assertFalse(Record.is_recorded(self.lolek, self.lecture))
+
+    @enrollment_time
+    def test_periodic_sync(self):
+        self.assertTrue(Record.enqueue_student(self.bolek, self.exercise_1))
+        Record.objects.filter(student=self.bolek, group=self.lecture).update(
+            status=RecordStatus.REMOVED)
+
+        out = StringIO()
+        call_command('sync_auto_enrollment', semester=self.lecture.course.semester_id, stdout=out)
+        self.assertIn("1 auto-enrollment groups synced", out.getvalue())
+        self.assertTrue(Record.is_enrolled(self.bolek, self.lecture))
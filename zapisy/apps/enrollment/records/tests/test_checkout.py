@@ -0,0 +1,88 @@
+"""Tests for enqueuing into many groups at once."""
+import json
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from freezegun import freeze_time
+
+from apps.enrollment.courses.tests.factories import (CourseInstanceFactory, GroupFactory, GroupType)
+from apps.enrollment.records import admission
+from apps.enrollment.records.models import (EventSource, GroupRecordCounts, Record, RecordEvent,
+                                            RecordStatus, T0Times)
+from apps.users.tests.factories import StudentFactory
+
+
+@override_settings(RUN_ASYNC=False)
+class CheckoutTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cooking = CourseInstanceFactory()
+        cls.semester = cls.cooking.semester
+        cls.cooking_lecture = GroupFactory(
+            course=cls.cooking, type=GroupType.LECTURE, auto_enrollment=True)
+        cls.exercises_1 = GroupFactory(course=cls.cooking, limit=1)
+        cls.exercises_2 = GroupFactory(course=cls.cooking, limit=1)
+        cls.bolek = StudentFactory()
+        T0Times.populate_t0(cls.semester)
+        cls.opening_time = cls.semester.records_opening
+
+    def setUp(self):
+        admission.get_admission_backend().flush()
+
+    def test_enqueue_student_into_groups(self):
+        groups = [self.exercises_1, self.exercises_2, self.cooking_lecture]
+        with freeze_time(self.opening_time + timedelta(minutes=1)):
+            results = Record.enqueue_student_into_groups(
+                self.bolek, groups, {self.exercises_1.pk: 7})
+        self.assertEqual(results, {
+            self.exercises_1.pk: True,
+            self.exercises_2.pk: True,
+            self.cooking_lecture.pk: False,
+        })
+        # Bolek is pulled into the group of higher priority and leaves the
+        # other queue.
+        record = Record.objects.get(student=self.bolek, group=self.exercises_1)
+        self.assertEqual((record.status, record.priority), (RecordStatus.ENROLLED, 7))
+        self.assertEqual(
+            Record.objects.get(student=self.bolek, group=self.exercises_2).status,
+            RecordStatus.REMOVED)
+        self.assertTrue(Record.is_enrolled(self.bolek, self.cooking_lecture))
+        self.assertEqual(
+            GroupRecordCounts.get_counts([self.exercises_1.pk])[self.exercises_1.pk],
+            {'num_enrolled': 1, 'num_enqueued': 0})
+        self.assertEqual(RecordEvent.objects.filter(source=EventSource.CHECKOUT).count(), 2)
+
+        # Groups the student is already in are left alone.
+        with freeze_time(self.opening_time + timedelta(minutes=2)):
+            results = Record.enqueue_student_into_groups(self.bolek, [self.exercises_1])
+        self.assertEqual(results, {self.exercises_1.pk: True})
+        self.assertEqual(Record.objects.filter(student=self.bolek, group=self.exercises_1).count(), 1)
+
+    def test_enrollment_not_open(self):
+        # Bolek's T0 comes two hours before the opening of the records.
+        with freeze_time(self.opening_time - timedelta(hours=3)):
+            results = Record.enqueue_student_into_groups(self.bolek, [self.exercises_1])
+        self.assertEqual(results, {self.exercises_1.pk: False})
+        self.assertFalse(Record.objects.exists())
+
+    def test_checkout_view(self):
+        url = reverse('prototype-checkout')
+        with freeze_time(self.opening_time + timedelta(minutes=1)):
+            # The session must not expire before the frozen date.
+            self.client.force_login(self.bolek.user)
+            response = self.client.post(
+                url, json.dumps([{'id': self.exercises_1.pk, 'priority': 3},
+                                 {'id': self.cooking_lecture.pk}]),
+                content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), [
+                {'group_id': self.exercises_1.pk, 'enqueued': True},
+                {'group_id': self.cooking_lecture.pk, 'enqueued': False},
+            ])
+            response = self.client.post(
+                url, json.dumps([{'id': self.exercises_2.pk, 'priority': 11}]),
+                content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(Record.objects.filter(group=self.exercises_2).exists())
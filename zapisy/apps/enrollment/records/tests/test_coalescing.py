@@ -0,0 +1,52 @@
+"""Tests for coalescing of asynchronous jobs."""
+import django_rq
+from django.test import SimpleTestCase
+
+from apps.enrollment.records.coalescing import JobCoalescer
+
+
+class JobCoalescerTest(SimpleTestCase):
+
+    def setUp(self):
+        self.coalescer = JobCoalescer('test-coalescing')
+        redis_client = django_rq.get_connection()
+        for key in redis_client.scan_iter('coalescing:test-coalescing:*'):
+            redis_client.delete(key)
+        self.enqueued = []
+
+    def trigger(self, key):
+        return self.coalescer.trigger(key, lambda: self.enqueued.append(key))
+
+    def test_triggers_are_merged(self):
+        self.assertTrue(self.trigger(1))
+        self.assertFalse(self.trigger(1))
+        self.assertFalse(self.trigger(1))
+        self.assertTrue(self.trigger(2))
+        self.assertEqual(self.enqueued, [1, 2])
+
+        runs = []
+        self.coalescer.run(1, lambda: runs.append(1))
+        self.assertEqual(runs, [1])
+        # After the job has finished, a new trigger schedules a new job.
+        self.assertTrue(self.trigger(1))
+        self.assertEqual(self.enqueued, [1, 2, 1])
+
+        stats = self.coalescer.stats()
+        self.assertEqual(stats['triggers'], 5)
+        self.assertEqual(stats['merged'], 2)
+        self.assertEqual(self.coalescer.merged_by_key(), {1: 2})
+
+    def test_change_during_run(self):
+        """A trigger arriving while the job is running causes a re-run."""
+        self.trigger(1)
+        runs = []
+
+        def work():
+            runs.append(1)
+            if len(runs) == 1:
+                self.assertFalse(self.trigger(1))
+
+        self.coalescer.run(1, work)
+        self.assertEqual(runs, [1, 1])
+        self.assertEqual(self.enqueued, [1])
+        self.assertEqual(self.coalescer.stats()['reruns'], 1)
@@ -5,7 +5,7 @@ from unittest.mock import patch
 from django.test import TestCase, override_settings
 
 from apps.enrollment.courses.models import Group, Semester
-from apps.enrollment.records.models import GroupOpeningTimes, Record, RecordStatus
+from apps.enrollment.records.models import GroupOpeningTimes, Record, RecordStatus, waiting
 from apps.users.models import Student
 
 
@@ -273,3 +273,22 @@ class EnrollmentTest(TestCase):
             self.assertDictEqual(
                 Record.list_waiting_students([self.cooking_exercise_group_1.course]),
                 expected_waiting)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_waiting_students_cached(self):
+        """The cached numbers follow the changes of records."""
+        course = self.cooking_exercise_group_1.course
+        group_type = self.cooking_exercise_group_1.type
+        with patch(RECORDS_DATETIME, mock_datetime(2011, 10, 8, 12)):
+            self.cooking_exercise_group_1.limit = 1
+            self.cooking_exercise_group_1.save()
+            Record.enqueue_student(self.bolek, self.cooking_exercise_group_1)
+            Record.enqueue_student(self.tola, self.cooking_exercise_group_1)
+            self.assertEqual(waiting.get_semester_counts(self.semester.pk)[course.id],
+                             {group_type: 1})
+            self.assertEqual(waiting.waiting_students_by_type([course]),
+                             {course.id: {group_type: [self.tola]}})
+
+            # Tola takes Bolek's place.
+            Record.remove_from_group(self.bolek, self.cooking_exercise_group_1)
+            self.assertNotIn(course.id, waiting.get_semester_counts(self.semester.pk))
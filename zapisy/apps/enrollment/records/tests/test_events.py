@@ -0,0 +1,84 @@
+"""Tests for the record event log."""
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from freezegun import freeze_time
+
+from apps.enrollment.courses.tests.factories import (CourseInstanceFactory, GroupFactory, GroupType)
+from apps.enrollment.records.models import (EventSource, Record, RecordEvent, RecordStatus,
+                                            T0Times)
+from apps.users.tests.factories import StudentFactory
+
+
+@override_settings(RUN_ASYNC=False)
+class RecordEventTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cooking = CourseInstanceFactory()
+        cls.semester = cls.cooking.semester
+        cls.cooking_lecture = GroupFactory(
+            course=cls.cooking, type=GroupType.LECTURE, auto_enrollment=True)
+        cls.exercises_1 = GroupFactory(course=cls.cooking, limit=1)
+        cls.exercises_2 = GroupFactory(course=cls.cooking, limit=1)
+        cls.bolek = StudentFactory()
+        cls.lolek = StudentFactory()
+        T0Times.populate_t0(cls.semester)
+        cls.opening_time = cls.semester.records_opening
+
+    def enroll_and_leave(self):
+        """Lolek waits a minute in the queue of the first group for Bolek to leave."""
+        with freeze_time(self.opening_time + timedelta(minutes=1)):
+            Record.enqueue_student(self.bolek, self.exercises_1)
+            Record.enqueue_student(self.lolek, self.exercises_1)
+            Record.enqueue_student(self.lolek, self.exercises_2)
+        with freeze_time(self.opening_time + timedelta(minutes=2)):
+            Record.remove_from_group(self.bolek, self.exercises_1)
+
+    def test_every_transition_is_logged(self):
+        self.enroll_and_leave()
+        for record in Record.objects.all():
+            last_event = RecordEvent.objects.filter(record_id=record.pk).latest('id')
+            self.assertEqual(last_event.status, record.status)
+            self.assertEqual(last_event.group_id, record.group_id)
+        lolek_exercises_2 = Record.objects.get(student=self.lolek, group=self.exercises_2)
+        self.assertEqual(
+            list(RecordEvent.objects.filter(record_id=lolek_exercises_2.pk).order_by('id').values_list(
+                'status', 'source')),
+            [(RecordStatus.QUEUED, EventSource.SAVE), (RecordStatus.ENROLLED, EventSource.PULL),
+             (RecordStatus.REMOVED, EventSource.PULL)])
+        self.assertTrue(RecordEvent.objects.filter(
+            group_id=self.cooking_lecture.pk, source=EventSource.AUTO_SYNC).exists())
+
+    def test_priority_change_is_logged(self):
+        with freeze_time(self.opening_time + timedelta(minutes=1)):
+            Record.enqueue_student(self.bolek, self.exercises_1)
+            Record.enqueue_student(self.lolek, self.exercises_1)
+            self.assertTrue(Record.set_queue_priority(self.lolek, self.exercises_1, 7))
+        event = RecordEvent.objects.latest('id')
+        self.assertEqual((event.student_id, event.priority, event.source),
+                         (self.lolek.pk, 7, EventSource.PRIORITY))
+
+    def test_replay_group(self):
+        self.enroll_and_leave()
+        state = RecordEvent.replay_group(
+            self.exercises_1.pk, self.opening_time + timedelta(minutes=1, seconds=30))
+        self.assertEqual(state.enrolled, [self.bolek.pk])
+        self.assertEqual(state.queued, [self.lolek.pk])
+        state = RecordEvent.replay_group(self.exercises_1.pk, self.opening_time + timedelta(minutes=3))
+        self.assertEqual(state.enrolled, [self.lolek.pk])
+        self.assertEqual(state.queued, [])
+        state = RecordEvent.replay_group(self.exercises_1.pk, self.opening_time)
+        self.assertEqual((state.enrolled, state.queued), ([], []))
+
+    def test_enrollment_delays(self):
+        self.enroll_and_leave()
+        delays = RecordEvent.enrollment_delays([self.exercises_1.pk, self.exercises_2.pk])
+        self.assertEqual(sorted(delays[self.exercises_1.pk]), [0.0, 60.0])
+        self.assertEqual(delays[self.exercises_2.pk], [0.0])
+
+        out = StringIO()
+        call_command('enrollment_delays', group=[self.exercises_1.pk], stdout=out)
+        self.assertIn("2 enrolled from the queue", out.getvalue())
@@ -0,0 +1,88 @@
+"""Tests for the materialized numbers of students in groups."""
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from freezegun import freeze_time
+
+from apps.enrollment.courses.tests.factories import (CourseInstanceFactory, GroupFactory, GroupType)
+from apps.enrollment.records.models import GroupRecordCounts, Record, T0Times
+from apps.users.tests.factories import StudentFactory
+
+
+@override_settings(RUN_ASYNC=False)
+class GroupRecordCountsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cooking = CourseInstanceFactory()
+        cls.semester = cls.cooking.semester
+        cls.cooking_lecture = GroupFactory(
+            course=cls.cooking, type=GroupType.LECTURE, auto_enrollment=True)
+        cls.exercises_1 = GroupFactory(course=cls.cooking, limit=1)
+        cls.exercises_2 = GroupFactory(course=cls.cooking, limit=1)
+        cls.bolek = StudentFactory()
+        cls.lolek = StudentFactory()
+        T0Times.populate_t0(cls.semester)
+        cls.opening_time = cls.semester.records_opening
+
+    def counts(self, group):
+        counts = GroupRecordCounts.get_counts([group.pk])[group.pk]
+        self.assertEqual(counts, GroupRecordCounts.compute([group.pk])[group.pk])
+        return counts['num_enrolled'], counts['num_enqueued']
+
+    def test_counters_follow_records(self):
+        with freeze_time(self.opening_time + timedelta(minutes=1)):
+            Record.enqueue_student(self.bolek, self.exercises_1)
+            Record.enqueue_student(self.lolek, self.exercises_1)
+            Record.enqueue_student(self.lolek, self.exercises_2)
+        self.assertEqual(self.counts(self.exercises_1), (1, 1))
+        self.assertEqual(self.counts(self.exercises_2), (1, 0))
+        self.assertEqual(self.counts(self.cooking_lecture), (2, 0))
+
+        # Lolek is pulled into the first group and leaves the second one.
+        with freeze_time(self.opening_time + timedelta(minutes=2)):
+            Record.remove_from_group(self.bolek, self.exercises_1)
+        self.assertTrue(Record.is_enrolled(self.lolek, self.exercises_1))
+        self.assertEqual(self.counts(self.exercises_1), (1, 0))
+        self.assertEqual(self.counts(self.exercises_2), (0, 0))
+        self.assertEqual(self.counts(self.cooking_lecture), (1, 0))
+        self.assertEqual(
+            Record.groups_stats([self.exercises_1])[self.exercises_1.pk],
+            {'num_enrolled': 1, 'num_enqueued': 0})
+
+    def test_counters_follow_single_pulls(self):
+        with freeze_time(self.opening_time + timedelta(minutes=1)):
+            Record.enqueue_student(self.bolek, self.exercises_1)
+            Record.enqueue_student(self.lolek, self.exercises_1)
+            Record.enqueue_student(self.lolek, self.exercises_2)
+            # Bolek's departure is not followed by the batched pull here.
+            Record.objects.filter(student=self.bolek).delete()
+            Record.fill_group(self.exercises_1.pk, batch=False)
+        self.assertEqual(self.counts(self.exercises_1), (1, 0))
+        self.assertEqual(self.counts(self.exercises_2), (0, 0))
+
+    def test_single_saves_apply_deltas(self):
+        with freeze_time(self.opening_time + timedelta(minutes=1)):
+            Record.enqueue_student(self.bolek, self.exercises_1)
+            # The records are not counted again, so the offset stays.
+            GroupRecordCounts.objects.filter(group=self.exercises_1).update(num_enqueued=3)
+            Record.enqueue_student(self.lolek, self.exercises_1)
+            record = Record.objects.get(student=self.lolek, group=self.exercises_1)
+            record.priority = 7
+            record.save()
+        counter = GroupRecordCounts.objects.get(group=self.exercises_1)
+        self.assertEqual((counter.num_enrolled, counter.num_enqueued), (1, 4))
+
+    def test_check_command(self):
+        with freeze_time(self.opening_time + timedelta(minutes=1)):
+            Record.enqueue_student(self.bolek, self.exercises_1)
+        GroupRecordCounts.objects.filter(group=self.exercises_1).update(num_enqueued=3)
+
+        out = StringIO()
+        call_command('check_group_counters', semester=self.semester.pk, stdout=out)
+        self.assertIn("1 inconsistent", out.getvalue())
+
+        call_command('check_group_counters', semester=self.semester.pk, fix=True, stdout=out)
+        self.assertEqual(self.counts(self.exercises_1), (1, 0))
@@ -5,7 +5,7 @@ from django.contrib.auth.models import Group as AuthGroup
 from django.test import TestCase, override_settings
 from freezegun import freeze_time
 
-from apps.enrollment.courses.models.group import GuaranteedSpots
+from apps.enrollment.courses.models.group import Group, GuaranteedSpots
 from apps.enrollment.courses.tests.factories import GroupFactory
 from apps.enrollment.records.models import Record, T0Times
 from apps.users.tests.factories import StudentFactory
@@ -157,3 +157,45 @@ class GuaranteedSpotsEnrollmentTest(TestCase):
         self.assertTrue(Record.is_enrolled(self.uszatek, self.group))
         self.assertTrue(Record.is_enrolled(self.tola, self.group))
         self.assertFalse(Record.is_enrolled(self.lolek, self.group))
+
+    def test_limit_raised(self):
+        """When the limit is raised, all the vacancies are filled at once."""
+        with freeze_time(self.opening_time + timedelta(seconds=5)):
+            Record.enqueue_student(self.bolek, self.group)
+        with freeze_time(self.opening_time + timedelta(seconds=10)):
+            Record.enqueue_student(self.uszatek, self.group)
+        with freeze_time(self.opening_time + timedelta(seconds=15)):
+            Record.enqueue_student(self.lolek, self.group)
+        with freeze_time(self.opening_time + timedelta(seconds=20)):
+            Record.enqueue_student(self.reksio, self.group)
+        with freeze_time(self.opening_time + timedelta(seconds=25)):
+            Record.enqueue_student(self.tola, self.group)
+        # Uszatek took the ISIM spot, so Bolek and Lolek fit into the regular
+        # ones.
+        self.assertTrue(Record.is_enrolled(self.bolek, self.group))
+        self.assertTrue(Record.is_enrolled(self.uszatek, self.group))
+        self.assertTrue(Record.is_enrolled(self.lolek, self.group))
+        self.assertFalse(Record.is_enrolled(self.reksio, self.group))
+        self.assertFalse(Record.is_enrolled(self.tola, self.group))
+
+        group = Group.objects.get(pk=self.group.pk)
+        group.limit = 4
+        with freeze_time(self.opening_time + timedelta(minutes=1)):
+            group.save()
+        self.assertTrue(Record.is_enrolled(self.reksio, self.group))
+        self.assertTrue(Record.is_enrolled(self.tola, self.group))
+        self.assertEqual(Record.free_spots_by_role(group), {'-': 0, 'isim': 0})
+
+    def test_free_spots_in_many_groups(self):
+        """Free spots are counted for several groups at once."""
+        other_group = GroupFactory(course=self.group.course, limit=3)
+        with freeze_time(self.opening_time + timedelta(seconds=5)):
+            Record.enqueue_student(self.tola, self.group)
+            Record.enqueue_student(self.uszatek, self.group)
+            Record.enqueue_student(self.bolek, other_group)
+        with self.assertNumQueries(3):
+            self.assertEqual(
+                Record.free_spots_by_role_in_groups([self.group, other_group]), {
+                    self.group.pk: {'-': 1, 'isim': 0},
+                    other_group.pk: {'-': 2},
+                })
@@ -0,0 +1,24 @@
+from django.test import TransactionTestCase
+
+from apps.enrollment.records.models import Record
+from apps.enrollment.records.tests import loadgen
+
+
+class LoadTest(TransactionTestCase):
+    """Runs the load-test harness at a small scale.
+
+    The storm is concurrent, so the test only checks properties that must hold
+    regardless of the interleaving.
+    """
+    # The violations are shown in full when the test fails.
+    maxDiff = None
+
+    def test_storm_keeps_invariants(self):
+        synthetic = loadgen.generate_semester(num_students=40, num_courses=4, groups_per_course=2)
+        report = loadgen.run_storm(synthetic, num_actions=200, num_threads=4)
+
+        self.assertEqual(report.violations, [])
+        self.assertEqual(len(report.latencies), 200)
+        self.assertTrue(Record.objects.exists())
+        self.assertGreater(report.percentile(99), 0)
+        self.assertGreaterEqual(report.percentile(99), report.percentile(50))
@@ -0,0 +1,63 @@
+"""Tests for the advisory locks serializing the changes of records."""
+import threading
+
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+
+from apps.enrollment.records import locks
+
+
+@override_settings(RUN_ASYNC=False)
+class TransactionLocksTest(TestCase):
+
+    def setUp(self):
+        locks.get_lock_stats().reset()
+
+    def hold_in_thread(self, take, held: threading.Event, release: threading.Event):
+        """Takes locks in another connection and holds them until released."""
+        def run():
+            try:
+                with transaction.atomic():
+                    take(locks.TransactionLocks())
+                    held.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+        thread = threading.Thread(target=run)
+        thread.start()
+        held.wait(10)
+        return thread
+
+    def test_student_locks_out_of_order_do_not_wait(self):
+        held, release = threading.Event(), threading.Event()
+        thread = self.hold_in_thread(lambda held_locks: held_locks.lock_student(5), held, release)
+        try:
+            with transaction.atomic():
+                held_locks = locks.TransactionLocks()
+                held_locks.lock_group(1)
+                self.assertTrue(held_locks.lock_student(7))
+                # Waiting for a smaller id while holding 7 could deadlock.
+                self.assertFalse(held_locks.lock_student(5))
+                self.assertTrue(held_locks.conflict)
+                self.assertTrue(held_locks.lock_student(8))
+        finally:
+            release.set()
+            thread.join()
+        self.assertEqual(locks.get_lock_stats().stats(), {})
+
+    def test_waits_are_counted(self):
+        held, release = threading.Event(), threading.Event()
+        thread = self.hold_in_thread(lambda held_locks: held_locks.lock_group(3), held, release)
+        # The lock is released shortly after we start waiting for it.
+        timer = threading.Timer(0.2, release.set)
+        timer.start()
+        try:
+            with transaction.atomic():
+                locks.TransactionLocks().lock_group(3)
+        finally:
+            release.set()
+            thread.join()
+            timer.cancel()
+        waits, wait_time = locks.get_lock_stats().stats()[3]
+        self.assertEqual(waits, 1)
+        self.assertGreater(wait_time, 0.1)
@@ -5,12 +5,16 @@ functions. This tests will verify, that the functions use the data correctly.
 """
 from datetime import timedelta
 
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 
 from apps.enrollment.courses.models import Group, Semester
+from apps.enrollment.courses.tests.factories import SemesterFactory
 from apps.enrollment.records.models import GroupOpeningTimes, T0Times
+from apps.grade.ticket_create.models.student_graded import StudentGraded
 from apps.offer.vote.models.single_vote import SingleVote
 from apps.users.models import Student
+from apps.users.tests.factories import StudentFactory
 
 
 class OpeningTimesTest(TestCase):
@@ -121,3 +125,134 @@ class OpeningTimesTest(TestCase):
                 self.bolek, [self.washing_up_seminar_group],
                 self.washing_up_seminar_group.course.records_start +
                 timedelta(seconds=1))[self.washing_up_seminar_group.id])
+
+    def test_many_students(self):
+        """`open_for_students` agrees with `are_groups_open_for_student`."""
+        bolek_t0 = T0Times.objects.get(student=self.bolek, semester=self.semester).time
+        students = {s.pk: s for s in (self.bolek, self.lolek)}
+        groups = {g.pk: g for g in (self.knitting_lecture_group, self.washing_up_seminar_group)}
+        pairs = [(s, g) for s in students for g in groups]
+        for time in (bolek_t0 - timedelta(days=1), bolek_t0 + timedelta(seconds=5),
+                     self.washing_up_seminar_group.course.records_start + timedelta(seconds=1)):
+            expected = {
+                (s, g) for s, student in students.items()
+                for g, is_open in GroupOpeningTimes.are_groups_open_for_student(
+                    student, list(groups.values()), time).items() if is_open
+            }
+            with self.assertNumQueries(2):
+                self.assertEqual(
+                    GroupOpeningTimes.open_for_students(students, groups, pairs, time), expected)
+
+    def test_incremental_populate(self):
+        """Only the opening times of Bolek, who changed his vote, are rewritten."""
+        lolek_openings = dict(
+            GroupOpeningTimes.objects.filter(student=self.lolek).values_list('id', 'time'))
+        bolek_vote = SingleVote.objects.get(
+            student=self.bolek, proposal=self.knitting_lecture_group.course.offer_id)
+        bolek_vote.correction += 1
+        bolek_vote.save()
+
+        num_written = GroupOpeningTimes.populate_opening_times(self.semester, incremental=True)
+
+        self.assertEqual(num_written,
+                         GroupOpeningTimes.objects.filter(student=self.bolek).count())
+        self.assertEqual(
+            dict(GroupOpeningTimes.objects.filter(student=self.lolek).values_list('id', 'time')),
+            lolek_openings)
+        bolek_t0 = T0Times.objects.get(student=self.bolek, semester=self.semester).time
+        self.assertEqual(
+            GroupOpeningTimes.objects.get(student=self.bolek, group=self.knitting_lecture_group).time,
+            bolek_t0 - timedelta(days=bolek_vote.correction))
+        # Nothing has changed since.
+        self.assertEqual(
+            GroupOpeningTimes.populate_opening_times(self.semester, incremental=True), 0)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class OpeningTimesCacheTest(TestCase):
+    fixtures = ['new_semester.yaml']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.semester = Semester.objects.get(pk=1)
+        cls.bolek = Student.objects.get(pk=1)
+        cls.knitting_lecture_group = Group.objects.select_related(
+            'course', 'course__semester').get(pk=11)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_no_queries_when_cached(self):
+        GroupOpeningTimes.populate_opening_times(self.semester)
+        t0 = T0Times.objects.get(student=self.bolek, semester=self.semester).time
+        self.assertFalse(GroupOpeningTimes.is_group_open_for_student(
+            self.bolek, self.knitting_lecture_group, t0 - timedelta(days=30)))
+        with self.assertNumQueries(0):
+            self.assertTrue(GroupOpeningTimes.is_group_open_for_student(
+                self.bolek, self.knitting_lecture_group, t0))
+
+    def test_invalidated_on_regeneration(self):
+        GroupOpeningTimes.objects.filter(group__course__semester=self.semester).delete()
+        t0 = T0Times.objects.get(student=self.bolek, semester=self.semester).time
+        self.assertFalse(GroupOpeningTimes.is_group_open_for_student(
+            self.bolek, self.knitting_lecture_group, t0 - timedelta(minutes=1)))
+        # The votes give Bolek an earlier opening time.
+        GroupOpeningTimes.populate_opening_times(self.semester)
+        self.assertTrue(GroupOpeningTimes.is_group_open_for_student(
+            self.bolek, self.knitting_lecture_group, t0 - timedelta(minutes=1)))
+
+        # Moving the T0 by hand works as well.
+        T0Times.objects.filter(student=self.bolek, semester=self.semester).get().delete()
+        self.assertFalse(T0Times.is_after_t0(self.bolek, self.semester, t0))
+
+
+@override_settings(ECTS_BONUS=5)
+class PopulateT0Test(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.previous_semester = SemesterFactory()
+        cls.semester = SemesterFactory(first_grade_semester=cls.previous_semester)
+        cls.bolek = StudentFactory(ects=150, records_opening_bonus_minutes=30)
+        cls.lolek = StudentFactory(ects=7)
+        cls.tola = StudentFactory(ects=0)
+        cls.reksio = StudentFactory(is_active=False)
+        StudentGraded.objects.create(student=cls.bolek, semester=cls.previous_semester)
+        StudentGraded.objects.create(student=cls.reksio, semester=cls.previous_semester)
+
+    def t0(self, student):
+        return T0Times.objects.get(student=student, semester=self.semester).time
+
+    def test_populate_t0(self):
+        T0Times.populate_t0(self.semester)
+        opening = self.semester.records_opening
+        # 150 ECTS give 750 minutes, which spans the night (another 720).
+        self.assertEqual(
+            self.t0(self.bolek),
+            opening - timedelta(minutes=720 + 750 + 30, days=1, hours=2))
+        self.assertEqual(self.t0(self.lolek), opening - timedelta(minutes=35, hours=2))
+        self.assertEqual(self.t0(self.tola), opening - timedelta(hours=2))
+        self.assertFalse(T0Times.objects.filter(student=self.reksio).exists())
+
+    def test_diff_mode(self):
+        T0Times.populate_t0(self.semester)
+        t0_ids = dict(T0Times.objects.values_list('student_id', 'id'))
+
+        self.lolek.ects = 8
+        self.lolek.save()
+        self.tola.is_active = False
+        self.tola.save()
+        self.reksio.is_active = True
+        self.reksio.save()
+        self.assertEqual(T0Times.populate_t0(self.semester, diff=True), 3)
+
+        opening = self.semester.records_opening
+        self.assertEqual(self.t0(self.lolek), opening - timedelta(minutes=40, hours=2))
+        self.assertEqual(self.t0(self.reksio), opening - timedelta(days=1, hours=2))
+        self.assertFalse(T0Times.objects.filter(student=self.tola).exists())
+        # The unchanged rows have not been rewritten.
+        self.assertEqual(
+            T0Times.objects.get(student=self.bolek).id, t0_ids[self.bolek.pk])
+        self.assertEqual(
+            T0Times.objects.get(student=self.lolek).id, t0_ids[self.lolek.pk])
+        self.assertEqual(T0Times.populate_t0(self.semester, diff=True), 0)
@@ -0,0 +1,93 @@
+"""Tests for the materialized ECTS totals of students."""
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from freezegun import freeze_time
+
+from apps.enrollment.courses.tests.factories import (CourseInstanceFactory, GroupFactory, GroupType)
+from apps.enrollment.records.models import (Record, RecordStatus, StudentSemesterPoints,
+                                            T0Times)
+from apps.users.tests.factories import StudentFactory
+
+
+@override_settings(RUN_ASYNC=False)
+class StudentSemesterPointsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cooking = CourseInstanceFactory(points=5)
+        cls.semester = cls.cooking.semester
+        cls.knitting = CourseInstanceFactory(semester=cls.semester, points=8)
+        cls.cooking_lecture = GroupFactory(
+            course=cls.cooking, type=GroupType.LECTURE, auto_enrollment=True)
+        cls.cooking_exercises = GroupFactory(course=cls.cooking, limit=1)
+        cls.knitting_exercises = GroupFactory(course=cls.knitting)
+        cls.bolek = StudentFactory()
+        cls.lolek = StudentFactory()
+        T0Times.populate_t0(cls.semester)
+        cls.opening_time = cls.semester.records_opening
+
+    def points(self, student):
+        return StudentSemesterPoints.get_points(student.pk, self.semester.pk)
+
+    def test_counter_follows_enrollment(self):
+        with freeze_time(self.opening_time + timedelta(minutes=1)):
+            Record.enqueue_student(self.bolek, self.cooking_exercises)
+            Record.enqueue_student(self.bolek, self.knitting_exercises)
+        # The auto-enrollment lecture must not count the course again.
+        self.assertTrue(Record.is_enrolled(self.bolek, self.cooking_lecture))
+        self.assertEqual(self.points(self.bolek), 13)
+        self.assertEqual(Record.student_points_in_semester(self.bolek, self.semester), 13)
+        self.assertEqual(
+            Record.student_points_in_semester(self.bolek, self.semester, [self.cooking]), 13)
+
+        with freeze_time(self.opening_time + timedelta(minutes=2)):
+            Record.remove_from_group(self.bolek, self.cooking_exercises)
+        self.assertFalse(Record.is_enrolled(self.bolek, self.cooking_lecture))
+        self.assertEqual(self.points(self.bolek), 8)
+
+    def test_counter_follows_pulling_from_queue(self):
+        with freeze_time(self.opening_time + timedelta(minutes=1)):
+            Record.enqueue_student(self.bolek, self.cooking_exercises)
+            Record.enqueue_student(self.lolek, self.cooking_exercises)
+        self.assertEqual(self.points(self.lolek), 0)
+        with freeze_time(self.opening_time + timedelta(minutes=2)):
+            Record.remove_from_group(self.bolek, self.cooking_exercises)
+        self.assertTrue(Record.is_enrolled(self.lolek, self.cooking_exercises))
+        self.assertEqual(self.points(self.lolek), 5)
+        self.assertEqual(self.points(self.bolek), 0)
+
+    def test_only_enrollment_changes_refresh(self):
+        with freeze_time(self.opening_time + timedelta(minutes=1)):
+            Record.enqueue_student(self.bolek, self.knitting_exercises)
+        StudentSemesterPoints.objects.filter(student=self.bolek).update(points=1)
+        record = Record.objects.get(student=self.bolek, group=self.knitting_exercises)
+        record.priority = 7
+        record.save()
+        self.assertEqual(self.points(self.bolek), 1)
+
+        record.status = RecordStatus.REMOVED
+        record.save()
+        self.assertEqual(self.points(self.bolek), 0)
+
+    def test_course_points_change(self):
+        with freeze_time(self.opening_time + timedelta(minutes=1)):
+            Record.enqueue_student(self.bolek, self.knitting_exercises)
+        self.knitting.points = 10
+        self.knitting.save()
+        self.assertEqual(Record.student_points_in_semester(self.bolek, self.semester), 10)
+
+    def test_check_command(self):
+        with freeze_time(self.opening_time + timedelta(minutes=1)):
+            Record.enqueue_student(self.bolek, self.knitting_exercises)
+        StudentSemesterPoints.objects.filter(student=self.bolek).update(points=1)
+
+        out = StringIO()
+        call_command('check_ects_counters', semester=self.semester.pk, stdout=out)
+        self.assertIn("1 inconsistent", out.getvalue())
+        self.assertEqual(self.points(self.bolek), 1)
+
+        call_command('check_ects_counters', semester=self.semester.pk, fix=True, stdout=out)
+        self.assertEqual(self.points(self.bolek), 8)
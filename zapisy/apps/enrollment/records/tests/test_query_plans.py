@@ -0,0 +1,18 @@
+from django.test import TestCase
+
+from apps.enrollment.records.tests import loadgen, query_plans
+
+
+class RecordQueryPlansTest(TestCase):
+    """Every hot query on the records must be able to use an index."""
+
+    def test_no_sequential_scans(self):
+        synthetic = loadgen.generate_semester(num_students=30, num_courses=4, groups_per_course=3)
+        query_plans.generate_records(synthetic, per_student=5)
+
+        report = query_plans.check_plans(synthetic, analyze=False, disable_seqscan=True)
+
+        self.assertGreater(len(report.queries), 10)
+        self.assertEqual(query_plans.format_report(report)[-1:], [
+            f"Queries: {len(report.queries)}, sequential scans of records_record: 0"
+        ])
@@ -0,0 +1,141 @@
+"""Tests for the queue index used to pick the first students in line."""
+from datetime import datetime, timedelta
+
+from django.contrib.auth.models import Group as AuthGroup
+from django.test import SimpleTestCase, TestCase, override_settings
+from freezegun import freeze_time
+
+from apps.enrollment.courses.models.group import GuaranteedSpots
+from apps.enrollment.courses.tests.factories import GroupFactory
+from apps.enrollment.records import queues
+from apps.enrollment.records.models import Record, RecordStatus, T0Times
+from apps.users.tests.factories import StudentFactory
+
+
+class LocalQueueBackendTest(SimpleTestCase):
+
+    def setUp(self):
+        self.backend = queues.LocalQueueBackend()
+        self.t = datetime(2020, 2, 1, 12)
+
+    def test_order_and_roles(self):
+        self.backend.add(1, queues.QueueEntry(3, self.t + timedelta(seconds=2)))
+        self.backend.add(1, queues.QueueEntry(5, self.t, frozenset({'isim'})))
+        self.backend.add(1, queues.QueueEntry(4, self.t + timedelta(seconds=2), frozenset({'isim'})))
+        self.assertEqual(self.backend.head(1, queues.ALL, num=5), [5, 3, 4])
+        self.assertEqual(self.backend.head(1, 'isim', num=5), [5, 4])
+        self.assertEqual(self.backend.head(1, queues.ALL, start=1, num=1), [3])
+        self.assertEqual(self.backend.head(2, queues.ALL), [])
+
+    def test_discard(self):
+        self.backend.load(1, [
+            queues.QueueEntry(1, self.t, frozenset({'isim'})),
+            queues.QueueEntry(2, self.t + timedelta(seconds=1), frozenset({'isim'})),
+        ])
+        self.assertTrue(self.backend.is_loaded(1))
+        self.backend.discard(1, [1], role='isim')
+        self.assertEqual(self.backend.head(1, 'isim', num=5), [2])
+        self.assertEqual(self.backend.head(1, queues.ALL, num=5), [1, 2])
+        self.backend.discard(1, [1, 2, 7])
+        self.assertEqual(self.backend.head(1, queues.ALL, num=5), [])
+        self.assertEqual(self.backend.head(1, 'isim', num=5), [])
+
+    def test_load_merges(self):
+        self.backend.add(1, queues.QueueEntry(2, self.t))
+        self.assertFalse(self.backend.is_loaded(1))
+        self.backend.load(1, [queues.QueueEntry(1, self.t), queues.QueueEntry(2, self.t)])
+        self.assertEqual(self.backend.head(1, queues.ALL, num=5), [1, 2])
+
+
+class RedisQueueBackendTest(SimpleTestCase):
+
+    def test_score_keeps_microseconds(self):
+        t = datetime(2020, 2, 1, 12)
+        score = queues.RedisQueueBackend._score(t)
+        self.assertIsInstance(score, int)
+        self.assertEqual(queues.RedisQueueBackend._score(t + timedelta(microseconds=1)), score + 1)
+
+
+@override_settings(RUN_ASYNC=False)
+class QueueIndexConsistencyTest(TestCase):
+    """The index may contain stale entries, but it never hides a student."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.group = GroupFactory(limit=1)
+        cls.bolek = StudentFactory()
+        cls.lolek = StudentFactory()
+        cls.tola = StudentFactory()
+        T0Times.populate_t0(cls.group.course.semester)
+        cls.opening_time = cls.group.course.semester.records_opening
+
+    def test_stale_entries_are_skipped(self):
+        with freeze_time(self.opening_time + timedelta(seconds=5)):
+            Record.enqueue_student(self.bolek, self.group)
+        with freeze_time(self.opening_time + timedelta(seconds=10)):
+            Record.enqueue_student(self.lolek, self.group)
+        with freeze_time(self.opening_time + timedelta(seconds=15)):
+            Record.enqueue_student(self.tola, self.group)
+        self.assertTrue(Record.is_enrolled(self.bolek, self.group))
+
+        # Lolek's record leaves the queue with a bulk update, which bypasses the
+        # index. He must not be pulled anyway.
+        Record.objects.filter(student=self.lolek, group=self.group).update(
+            status=RecordStatus.REMOVED)
+        with freeze_time(self.opening_time + timedelta(minutes=1)):
+            Record.remove_from_group(self.bolek, self.group)
+
+        self.assertFalse(Record.is_recorded(self.lolek, self.group))
+        self.assertTrue(Record.is_enrolled(self.tola, self.group))
+
+    def test_role_gained_after_enqueuing(self):
+        isim = AuthGroup.objects.create(name='isim')
+        GuaranteedSpots.objects.create(group=self.group, role=isim, limit=1)
+        with freeze_time(self.opening_time + timedelta(seconds=5)):
+            Record.enqueue_student(self.bolek, self.group)
+            Record.enqueue_student(self.lolek, self.group)
+        self.assertTrue(Record.is_enrolled(self.bolek, self.group))
+        self.assertFalse(Record.is_enrolled(self.lolek, self.group))
+
+        # Lolek becomes an ISIM student and should take the guaranteed spot.
+        self.lolek.user.groups.add(isim)
+        with freeze_time(self.opening_time + timedelta(minutes=1)):
+            Record.fill_group(self.group.pk)
+        self.assertTrue(Record.is_enrolled(self.lolek, self.group))
+
+
+@override_settings(RUN_ASYNC=False)
+class QueuePositionTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.group = GroupFactory(limit=1)
+        cls.semester = cls.group.course.semester
+        cls.bolek = StudentFactory()
+        cls.lolek = StudentFactory()
+        cls.tola = StudentFactory()
+        T0Times.populate_t0(cls.semester)
+        cls.opening_time = cls.semester.records_opening
+
+    def test_positions(self):
+        isim = AuthGroup.objects.create(name='isim')
+        self.tola.user.groups.add(isim)
+        with freeze_time(self.opening_time + timedelta(seconds=5)):
+            Record.enqueue_student(self.bolek, self.group)
+        with freeze_time(self.opening_time + timedelta(seconds=10)):
+            Record.enqueue_student(self.lolek, self.group)
+            Record.enqueue_student(self.tola, self.group)
+        # The role has no spots of its own.
+        GuaranteedSpots.objects.create(group=self.group, role=isim, limit=0)
+
+        self.assertEqual(Record.queue_positions(self.bolek, self.semester), {})
+        self.assertEqual(Record.queue_positions(self.lolek, self.semester), {
+            self.group.pk: {'position': 1, 'free_spots': 0, 'roles': {}}
+        })
+        self.assertEqual(Record.queue_positions(self.tola, self.semester), {
+            self.group.pk: {
+                'position': 2,
+                'free_spots': 0,
+                'roles': {'isim': {'position': 1, 'free_spots': 0}},
+            }
+        })
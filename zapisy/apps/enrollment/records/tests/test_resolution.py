@@ -0,0 +1,132 @@
+"""Tests for resolving all the queues of a semester at once."""
+from datetime import datetime, timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from freezegun import freeze_time
+
+from apps.enrollment.courses.tests.factories import CourseInstanceFactory, GroupFactory
+from apps.enrollment.records import matching, queues
+from apps.enrollment.records.models import (EventSource, GroupRecordCounts, QueueResolution,
+                                            Record, RecordEvent, RecordStatus, T0Times)
+from apps.users.tests.factories import StudentFactory
+
+
+class MatchTest(SimpleTestCase):
+    T = datetime(2021, 2, 15, 10)
+
+    def record(self, record_id, student_id, group_id, priority=5, minutes=0):
+        return matching.QueuedRecord(record_id, student_id, group_id, priority,
+                                     self.T + timedelta(minutes=minutes))
+
+    def test_first_in_queue_keeps_the_place(self):
+        groups = {
+            1: matching.GroupInfo((1, 2), {queues.ALL: 1}, [], 5),
+            2: matching.GroupInfo((1, 2), {queues.ALL: 1}, [], 5),
+        }
+        records = [
+            self.record(1, student_id=1, group_id=1, minutes=0),
+            # Student 2 prefers group 1, but student 1 was there first.
+            self.record(2, student_id=2, group_id=1, priority=10, minutes=1),
+            self.record(3, student_id=2, group_id=2, priority=1, minutes=1),
+        ]
+        result = matching.match(records, groups, {}, {}, set(), 45)
+        self.assertEqual(result.enrolled, {1, 3})
+        self.assertEqual(result.over_limit, set())
+
+    def test_guaranteed_spots(self):
+        groups = {1: matching.GroupInfo((1, 2), {queues.ALL: 1, 'isim': 1}, ['isim'], 5)}
+        records = [
+            self.record(1, student_id=1, group_id=1, minutes=0),
+            self.record(2, student_id=2, group_id=1, minutes=1),
+            self.record(3, student_id=3, group_id=1, minutes=2),
+        ]
+        result = matching.match(records, groups, {2: frozenset({'isim'})}, {}, set(), 45)
+        self.assertEqual(result.enrolled, {1, 2})
+
+    def test_ects_limit(self):
+        groups = {
+            1: matching.GroupInfo((1, 2), {queues.ALL: 1}, [], 6),
+            2: matching.GroupInfo((2, 2), {queues.ALL: 1}, [], 6),
+            3: matching.GroupInfo((3, 2), {queues.ALL: 1}, [], 6),
+        }
+        records = [
+            self.record(1, student_id=1, group_id=1, minutes=0),
+            self.record(2, student_id=1, group_id=2, minutes=1),
+            # Course 3 is already counted in the points of student 1.
+            self.record(3, student_id=1, group_id=3, minutes=2),
+            self.record(4, student_id=2, group_id=2, minutes=3),
+        ]
+        result = matching.match(records, groups, {}, {1: 6}, {(1, 3)}, 12)
+        # Student 1 would exceed the limit with course 2, so the place goes to
+        # student 2.
+        self.assertEqual(result.enrolled, {1, 3, 4})
+        self.assertEqual(result.over_limit, {2})
+        self.assertEqual(result.rounds, 2)
+
+
+@override_settings(RUN_ASYNC=False)
+class QueueResolutionTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cooking = CourseInstanceFactory()
+        cls.semester = cls.cooking.semester
+        cls.exercises_1 = GroupFactory(course=cls.cooking, limit=1)
+        cls.exercises_2 = GroupFactory(course=cls.cooking, limit=1)
+        cls.bolek = StudentFactory()
+        cls.lolek = StudentFactory()
+        T0Times.populate_t0(cls.semester)
+        cls.opening_time = cls.semester.records_opening
+
+    def test_resolution(self):
+        resolution = QueueResolution.objects.create(
+            semester=self.semester, time=self.opening_time + timedelta(minutes=10))
+        with freeze_time(self.opening_time + timedelta(minutes=1)):
+            Record.enqueue_student(self.bolek, self.exercises_1)
+        with freeze_time(self.opening_time + timedelta(minutes=2)):
+            Record.enqueue_student_into_groups(
+                self.lolek, [self.exercises_1, self.exercises_2],
+                {self.exercises_1.pk: 10, self.exercises_2.pk: 5})
+        # The pullers wait for the resolution.
+        self.assertFalse(Record.is_enrolled(self.bolek, self.exercises_1))
+        self.assertFalse(Record.is_enrolled(self.lolek, self.exercises_1))
+        self.assertFalse(Record.is_enrolled(self.lolek, self.exercises_2))
+
+        # Nothing is due yet.
+        self.assertEqual(QueueResolution.resolve_due(self.opening_time + timedelta(minutes=5)), {})
+        with freeze_time(self.opening_time + timedelta(minutes=10)):
+            reports = QueueResolution.resolve_due()
+        report = reports[self.semester]
+        self.assertEqual((report.num_queued, report.num_enrolled), (3, 2))
+
+        self.assertTrue(Record.is_enrolled(self.bolek, self.exercises_1))
+        self.assertTrue(Record.is_enrolled(self.lolek, self.exercises_2))
+        # Lolek still waits for the group he prefers.
+        self.assertEqual(
+            Record.objects.get(student=self.lolek, group=self.exercises_1).status,
+            RecordStatus.QUEUED)
+        self.assertEqual(
+            GroupRecordCounts.get_counts([self.exercises_1.pk])[self.exercises_1.pk],
+            {'num_enrolled': 1, 'num_enqueued': 1})
+        self.assertEqual(RecordEvent.objects.filter(source=EventSource.RESOLUTION).count(), 2)
+
+        resolution.refresh_from_db()
+        self.assertIsNotNone(resolution.resolved_at)
+        self.assertFalse(QueueResolution.is_pending(self.semester.pk))
+        with self.assertRaises(ValueError):
+            resolution.resolve()
+
+    def test_command_schedules(self):
+        out = StringIO()
+        call_command('resolve_queues', semester=self.semester.pk,
+                     schedule=self.opening_time + timedelta(hours=1), stdout=out)
+        self.assertTrue(QueueResolution.is_pending(self.semester.pk))
+        with freeze_time(self.opening_time + timedelta(minutes=1)):
+            Record.enqueue_student(self.bolek, self.exercises_1)
+        self.assertFalse(Record.is_enrolled(self.bolek, self.exercises_1))
+
+        with freeze_time(self.opening_time + timedelta(minutes=2)):
+            call_command('resolve_queues', semester=self.semester.pk, now=True, stdout=out)
+        self.assertTrue(Record.is_enrolled(self.bolek, self.exercises_1))
@@ -0,0 +1,55 @@
+"""Tests for pushing the changes of groups to the prototype."""
+import itertools
+import json
+from datetime import timedelta
+
+from django.test import TransactionTestCase, override_settings
+from freezegun import freeze_time
+
+from apps.enrollment.courses.tests.factories import GroupFactory
+from apps.enrollment.records import updates
+from apps.enrollment.records.models import Record, T0Times
+from apps.users.tests.factories import StudentFactory
+
+
+def parse(message: str):
+    """Returns the type and the data of a Server-Sent Event."""
+    fields = dict(line.split(': ', 1) for line in message.strip().split('\n'))
+    return fields['event'], json.loads(fields['data'])
+
+
+# The changes are published after the transactions commit, so the test cannot
+# be wrapped in a transaction.
+@override_settings(RUN_ASYNC=False)
+class UpdatesTest(TransactionTestCase):
+
+    def setUp(self):
+        self.group = GroupFactory(limit=1)
+        self.bolek = StudentFactory()
+        self.lolek = StudentFactory()
+        T0Times.populate_t0(self.group.course.semester)
+        self.opening_time = self.group.course.semester.records_opening
+
+    def test_stream(self):
+        backend = updates.get_updates_backend()
+        _, last_id = backend.read(None, 0)
+        with freeze_time(self.opening_time + timedelta(minutes=1)):
+            Record.enqueue_student(self.bolek, self.group)
+            Record.enqueue_student(self.lolek, self.group)
+
+        # Lolek's stream gets the counters and learns that his records have
+        # changed.
+        retry, counts, records = itertools.islice(updates.stream(self.lolek.pk, last_id, 10), 3)
+        self.assertEqual(retry, 'retry: 1000\n\n')
+        self.assertEqual(parse(counts), ('counts', {
+            str(self.group.pk): {'num_enrolled': 1, 'num_enqueued': 1}
+        }))
+        self.assertEqual(parse(records), ('records', {}))
+
+    def test_keep_alive(self):
+        _, last_id = updates.get_updates_backend().read(None, 0)
+        with self.settings(UPDATES_KEEPALIVE=0.01):
+            messages = list(updates.stream(self.bolek.pk, last_id, 0.05))
+        self.assertEqual(messages[0], 'retry: 1000\n\n')
+        self.assertTrue(messages[1:])
+        self.assertTrue(all(m == ': keep-alive\n\n' for m in messages[1:]))
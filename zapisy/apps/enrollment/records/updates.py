@@ -0,0 +1,199 @@
+"""Module updates pushes the changes of groups to the open prototypes.
+
+The timetable prototype used to poll `prototype_update_groups` for every group
+in view, which recomputed the student's flags for all of them. Instead, every
+change is now published to a feed, and the prototype listens to it through
+Server-Sent Events (see `stream`):
+
+  * When the counters of groups change (see `GroupRecordCounts.refresh`), the
+    new numbers of enrolled and enqueued students are published after the
+    transaction commits. They are read again at that moment, so that the last
+    published numbers are the committed ones even if the transactions commit
+    in a different order than they had changed the counters.
+  * When the records of students change (`STUDENTS_CHANGE_SIGNAL`), their ids
+    are published. The stream of a student only tells him that his records
+    have changed, so that the prototype re-fetches his flags.
+
+Every event of the feed has an id. A client reconnecting after the stream
+ends sends the id of the last event it has seen (`Last-Event-ID`) and gets the
+events it has missed, as long as they are still kept in the feed.
+
+The same as with the queue index (see `queues.py`), when tasks run
+asynchronously (RUN_ASYNC) the feed is stored in Redis (a stream), shared by
+the web servers and the workers. Otherwise a local in-memory backend is used.
+"""
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import django_rq
+from django.conf import settings
+from django.db import transaction
+from django.dispatch import receiver
+
+from apps.enrollment.records.signals import STUDENTS_CHANGE_SIGNAL
+
+# How many events are kept for the clients catching up.
+FEED_LENGTH = 10000
+
+# An event is a dict with keys `groups` (a dict mapping group ids to pairs
+# `[num_enrolled, num_enqueued]`) and `students` (a list of student ids).
+Event = Dict[str, object]
+
+
+class UpdatesBackend(ABC):
+
+    @abstractmethod
+    def publish(self, event: Event) -> None:
+        pass
+
+    @abstractmethod
+    def read(self, last_id: Optional[str], timeout: float) -> Tuple[List[Tuple[str, Event]], str]:
+        """Waits for the events published after `last_id`.
+
+        If `last_id` is None, only the events published from now on are
+        returned. Returns the events (possibly none, if the timeout passes)
+        and the id to continue reading from.
+        """
+        pass
+
+
+class LocalUpdatesBackend(UpdatesBackend):
+    """Keeps the feed in the memory of the process."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._last_id = 0
+        self._events: Deque[Tuple[int, Event]] = deque(maxlen=FEED_LENGTH)
+
+    def publish(self, event: Event) -> None:
+        with self._condition:
+            self._last_id += 1
+            self._events.append((self._last_id, event))
+            self._condition.notify_all()
+
+    def read(self, last_id: Optional[str], timeout: float) -> Tuple[List[Tuple[str, Event]], str]:
+        with self._condition:
+            after = self._last_id if last_id is None else int(last_id)
+            # The ids start over when the process restarts.
+            after = min(after, self._last_id)
+            self._condition.wait_for(lambda: self._last_id > after, timeout)
+            events = [(str(i), event) for i, event in self._events if i > after]
+            return events, str(max(after, self._last_id))
+
+    def flush(self):
+        with self._condition:
+            self._events.clear()
+
+
+class RedisUpdatesBackend(UpdatesBackend):
+    """Keeps the feed in a Redis stream, so it is shared by all the processes."""
+    STREAM_KEY = 'enrollment:updates'
+
+    def __init__(self, connection=None):
+        self.redis_client = connection or django_rq.get_connection()
+
+    def publish(self, event: Event) -> None:
+        self.redis_client.xadd(self.STREAM_KEY, {'event': json.dumps(event)},
+                               maxlen=FEED_LENGTH, approximate=True)
+
+    def read(self, last_id: Optional[str], timeout: float) -> Tuple[List[Tuple[str, Event]], str]:
+        if last_id is None:
+            # Reading from the last entry rather than from '$', so that the
+            # next read does not miss the events published in the meantime.
+            last_stream_entry = self.redis_client.xrevrange(self.STREAM_KEY, count=1)
+            last_id = last_stream_entry[0][0].decode() if last_stream_entry else '0-0'
+        # Zero would block forever.
+        block = max(1, int(timeout * 1000))
+        response = self.redis_client.xread({self.STREAM_KEY: last_id}, block=block)
+        events = []
+        for _, entries in response or []:
+            for entry_id, fields in entries:
+                entry_id = entry_id.decode()
+                events.append((entry_id, json.loads(fields[b'event'])))
+                last_id = entry_id
+        return events, last_id
+
+
+_local_backend = LocalUpdatesBackend()
+
+
+def get_updates_backend() -> UpdatesBackend:
+    """Returns the backend appropriate for the current setting of RUN_ASYNC."""
+    if not settings.RUN_ASYNC:
+        return _local_backend
+    return RedisUpdatesBackend()
+
+
+def publish_groups(group_ids: Iterable[int]):
+    """Publishes the counters of the groups once the transaction commits."""
+    from apps.enrollment.records.models.group_counts import GroupRecordCounts
+    group_ids = list(group_ids)
+    if not group_ids:
+        return
+
+    def publish():
+        counters = GroupRecordCounts.objects.filter(group_id__in=group_ids).values_list(
+            'group_id', 'num_enrolled', 'num_enqueued')
+        groups = {group_id: [num_enrolled, num_enqueued]
+                  for group_id, num_enrolled, num_enqueued in counters}
+        if groups:
+            get_updates_backend().publish({'groups': groups, 'students': []})
+
+    transaction.on_commit(publish)
+
+
+def publish_students(student_ids: Iterable[int]):
+    """Tells the students that their records have changed."""
+    student_ids = list(student_ids)
+    if student_ids:
+        transaction.on_commit(
+            lambda: get_updates_backend().publish({'groups': {}, 'students': student_ids}))
+
+
+@receiver(STUDENTS_CHANGE_SIGNAL)
+def publish_on_students_change(sender, **kwargs):
+    publish_students(kwargs['student_ids'])
+
+
+def _format(event_id: str, event_type: str, data) -> str:
+    return f'id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n'
+
+
+def stream(student_id: int, last_id: Optional[str], duration: float) -> Iterator[str]:
+    """Produces the Server-Sent Events for the prototype of the student.
+
+    The events of type `counts` carry the new counters of groups (a dict
+    mapping group ids to objects with fields `num_enrolled` and `num_enqueued`).
+    An event of type `records` tells the student to re-fetch his flags. The
+    stream ends after `duration` seconds; the browser reconnects by itself.
+    """
+    backend = get_updates_backend()
+    deadline = time.monotonic() + duration
+    # Tells the browser to reconnect right away once the stream ends.
+    yield 'retry: 1000\n\n'
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        events, last_id = backend.read(last_id, min(remaining, settings.UPDATES_KEEPALIVE))
+        if not events:
+            # Keeps the proxies from closing an idle connection.
+            yield ': keep-alive\n\n'
+            continue
+        counts = {}
+        records_changed = False
+        for _, event in events:
+            counts.update({
+                group_id: {'num_enrolled': num_enrolled, 'num_enqueued': num_enqueued}
+                for group_id, (num_enrolled, num_enqueued) in event['groups'].items()
+            })
+            records_changed = records_changed or student_id in event['students']
+        # The events read at once are sent as one, under the id of the last.
+        if counts:
+            yield _format(last_id, 'counts', counts)
+        if records_changed:
+            yield _format(last_id, 'records', {})
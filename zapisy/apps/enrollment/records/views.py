@@ -4,6 +4,7 @@ from django.shortcuts import redirect
 from django.views.decorators.http import require_POST
 
 from apps.enrollment.courses.models import Group
+from apps.enrollment.records.admission import admission_control
 from apps.enrollment.records.models.records import Record
 from apps.users.decorators import student_required
 from apps.users.models import Student
@@ -11,6 +12,7 @@ from apps.users.models import Student
 
 @student_required
 @require_POST
+@admission_control
 def enqueue(request):
     """Puts the student into the group queue."""
     student: Student = request.user.student
@@ -41,6 +43,7 @@ def enqueue(request):
 
 @student_required
 @require_POST
+@admission_control
 def dequeue(request):
     """Removes the student from the group or its queue."""
     student: Student = request.user.student
@@ -60,6 +63,7 @@ def dequeue(request):
 
 @student_required
 @require_POST
+@admission_control
 def queue_set_priority(request):
     """Sets the queue priority."""
     student: Student = request.user.student
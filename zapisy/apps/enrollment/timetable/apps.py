@@ -0,0 +1,14 @@
+"""Django app config for enrollment.timetable.
+
+(See https://docs.djangoproject.com/en/2.0/ref/applications/).
+"""
+
+from django.apps import AppConfig
+
+
+class TimetableConfig(AppConfig):
+    name = 'apps.enrollment.timetable'
+
+    def ready(self):
+        from apps.enrollment.timetable import ical
+        ical.connect_receivers()
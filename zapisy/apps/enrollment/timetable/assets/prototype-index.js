@@ -2,10 +2,11 @@
 //
 // It will put the prototype component in the DOM element with id #timetable.
 // Two sets of data is read — the description of all the courses, and the
-// description of groups the student is enqueued/enrolled into. Two <script
-// type="application/json"></script> elements are used for this, one with id
-// #courses-list, the other with id #timetable-data. For details look into
-// `store/{groups.ts, courses.ts}`.
+// description of groups the student is enqueued/enrolled into. The latter is
+// read from a <script type="application/json"></script> element with id
+// #timetable-data. The former (together with the filter data) is downloaded
+// from the URL stored in the #prototype-catalog-url input. For details look
+// into `store/{groups.ts, courses.ts}`.
 
 import Vue from "vue";
 
@@ -3,7 +3,7 @@
 import axios from "axios";
 import { values, flatten, sortBy } from "lodash";
 import { ActionContext } from "vuex";
-import { GroupJSON } from "../models";
+import { FilterDataJSON, GroupJSON } from "../models";
 
 // Sets header for all POST requests to enable CSRF protection.
 axios.defaults.xsrfHeaderName = "X-CSRFTOKEN";
@@ -26,10 +26,12 @@ export interface CourseInfo {
 interface State {
   courses: { [id: number]: CourseInfo };
   selection: number[];
+  filterData: FilterDataJSON | null;
 }
 const state: State = {
   courses: {},
   selection: [],
+  filterData: null,
 };
 
 const getters = {
@@ -86,12 +88,23 @@ const actions = {
     commit("groups/updateGroupSelection", selectedGroupIDs, { root: true });
   },
 
-  // initFromJSONTag will be called at the start to populate the courses list.
-  initFromJSONTag({ commit }: ActionContext<State, any>) {
-    const coursesDump = JSON.parse(
-      document.getElementById("courses-list")!.innerHTML
-    ) as CourseInfo;
-    commit("setCourses", coursesDump);
+  // fetchCatalog will be called at the start to populate the courses list and
+  // the filters. The catalog is cached by the browser until the courses change.
+  fetchCatalog({ commit }: ActionContext<State, any>) {
+    const catalogURL = (document.getElementById(
+      "prototype-catalog-url"
+    ) as HTMLInputElement).value;
+    axios
+      .get(catalogURL)
+      .then((response) => {
+        const catalog = response.data as {
+          courses: CourseInfo[];
+          filters: FilterDataJSON;
+        };
+        commit("setCourses", catalog.courses);
+        commit("setFilterData", catalog.filters);
+      })
+      .catch();
   },
 };
 
@@ -100,9 +113,16 @@ const mutations = {
     state.courses[c].groups = ids;
   },
   setCourses(state: State, courses: CourseInfo[]) {
+    const coursesByID = { ...state.courses };
     courses.forEach((c) => {
-      state.courses[c.id] = c;
+      coursesByID[c.id] = c;
     });
+    // The courses arrive after the components are created. Replacing the
+    // object makes the new entries reactive.
+    state.courses = coursesByID;
+  },
+  setFilterData(state: State, filterData: FilterDataJSON) {
+    state.filterData = filterData;
   },
   setSelection(state: State, ids: number[]) {
     state.selection = ids;
@@ -2,7 +2,7 @@
 // groups should be presented on the timetable. It will maintain a store of
 // groups data at hand and will download new data if necessary.
 import axios from "axios";
-import { keys, values, isEmpty, xor, find, isNil } from "lodash";
+import { keys, values, isEmpty, xor, find, isNil, flatten } from "lodash";
 import Vue from "vue";
 import { ActionContext } from "vuex";
 
@@ -14,6 +14,62 @@ axios.defaults.xsrfCookieName = "csrftoken";
 
 type GroupById = { [id: number]: Group };
 
+// GroupCounts is sent over the stream of updates (see `listenToUpdates`).
+type GroupCounts = {
+  [id: string]: { num_enrolled: number; num_enqueued: number };
+};
+
+// Timetable is found by the server (see `prototype_solve`).
+type Timetable = { groups: number[]; chance: number };
+
+// How many times an action is retried when the server is busy.
+const MAX_BUSY_RETRIES = 5;
+
+// postAction sends the action to the server. When the server is overloaded, it
+// responds with status 429 and tells how long to wait before retrying.
+function postAction(url: string, action: string, attempt = 0): Promise<any> {
+  return axios.post(url, { action }).catch((error) => {
+    const response = error.response;
+    if (
+      response === undefined ||
+      response.status !== 429 ||
+      attempt >= MAX_BUSY_RETRIES
+    ) {
+      throw error;
+    }
+    // The jitter spreads the retries of all the waiting students.
+    const delay = response.data.retry_after_ms * (1 + Math.random());
+    return new Promise((resolve) => setTimeout(resolve, delay)).then(() =>
+      postAction(url, action, attempt + 1)
+    );
+  });
+}
+
+// postCheckout sends the groups to enqueue into in a single request. It is
+// retried the same way as postAction.
+function postCheckout(
+  url: string,
+  groupIDs: number[],
+  attempt = 0
+): Promise<any> {
+  return axios
+    .post(url, groupIDs.map((id) => ({ id })))
+    .catch((error) => {
+      const response = error.response;
+      if (
+        response === undefined ||
+        response.status !== 429 ||
+        attempt >= MAX_BUSY_RETRIES
+      ) {
+        throw error;
+      }
+      const delay = response.data.retry_after_ms * (1 + Math.random());
+      return new Promise((resolve) => setTimeout(resolve, delay)).then(() =>
+        postCheckout(url, groupIDs, attempt + 1)
+      );
+    });
+}
+
 // Coalesce is a useful function that returns first defined value in the
 // argument list, or undefined if there is none.
 function coalesce(...args: Array<any | null | undefined>) {
@@ -92,6 +148,16 @@ const mutations = {
     }
     Vue.set(state.store, group.id.toString(), group);
   },
+  // Updates the numbers of students in the groups we know of.
+  updateGroupCounts(state: State, counts: GroupCounts) {
+    keys(counts)
+      .filter((id) => id in state.store)
+      .forEach((id) => {
+        let group: Group = state.store[Number(id)];
+        group.numEnrolled = counts[id].num_enrolled;
+        Vue.set(state.store, id, group);
+      });
+  },
   // Flips the selection flag for the group whose selection changed.
   updateGroupSelection(state: State, ids: number[]) {
     const currentSelection = values(state.store)
@@ -110,10 +176,7 @@ const mutations = {
 const actions = {
   // These functions perform actions on a single group.
   pin({ commit }: ActionContext<State, any>, group: Group) {
-    axios
-      .post(group.actionURL, {
-        action: "pin",
-      })
+    postAction(group.actionURL, "pin")
       .then((_) => {
         commit("setPinned", { g: group.id });
       })
@@ -122,10 +185,7 @@ const actions = {
       });
   },
   unpin({ commit }: ActionContext<State, any>, group: Group) {
-    axios
-      .post(group.actionURL, {
-        action: "unpin",
-      })
+    postAction(group.actionURL, "unpin")
       .then((_) => {
         commit("unsetPinned", { g: group.id });
       })
@@ -136,10 +196,7 @@ const actions = {
   // When enqueue request is successful, the server will give back the list of
   // enqueued groups.
   enqueue({ commit }: ActionContext<State, any>, group: Group) {
-    axios
-      .post(group.actionURL, {
-        action: "enqueue",
-      })
+    postAction(group.actionURL, "enqueue")
       .then((_) => {
         commit("setEnqueued", { g: group.id });
       })
@@ -150,10 +207,7 @@ const actions = {
   // When dequeue request is successful, the server will give back the list of
   // groups' ids, that we are removed from.
   dequeue({ commit }: ActionContext<State, any>, group: Group) {
-    axios
-      .post(group.actionURL, {
-        action: "dequeue",
-      })
+    postAction(group.actionURL, "dequeue")
       .then((_) => {
         commit("unsetEnrolled", { g: group.id });
         commit("unsetEnqueued", { g: group.id });
@@ -163,6 +217,73 @@ const actions = {
       });
   },
 
+  // Enqueues into all the pinned groups at once. The server tells for every
+  // group whether the student is now in its queue.
+  enqueuePinned({ state, commit }: ActionContext<State, any>) {
+    const groupIDs = values(state.store)
+      .filter(
+        (g) => g.isPinned && g.canEnqueue && !g.isEnrolled && !g.isEnqueued
+      )
+      .map((g) => g.id);
+    if (isEmpty(groupIDs)) {
+      return;
+    }
+    const checkoutURL: string = (
+      document.getElementById("prototype-checkout-url") as HTMLInputElement
+    ).value;
+    postCheckout(checkoutURL, groupIDs)
+      .then((response) => {
+        response.data.forEach(
+          (result: { group_id: number; enqueued: boolean }) => {
+            if (result.enqueued) {
+              commit("setEnqueued", { g: result.group_id });
+            }
+          }
+        );
+      })
+      .catch((reason) => {
+        console.log("Enqueuing failed: ", reason);
+      });
+  },
+
+  // Asks the server for the most promising timetable of the selected courses
+  // without collisions (see `timetable/solver.py`). Its groups get pinned and
+  // the other groups of these courses get unpinned. Resolves to false if there
+  // is no such timetable.
+  solveTimetable(
+    { state, dispatch, rootState }: ActionContext<State, any>,
+    freeDays: string[]
+  ): Promise<boolean> {
+    const courseIDs: number[] = rootState.courses.selection;
+    const solveURL: string = (
+      document.getElementById("prototype-solve-url") as HTMLInputElement
+    ).value;
+    return axios
+      .post(solveURL, { courses: courseIDs, free_days: freeDays, limit: 1 })
+      .then((response) => {
+        const timetables = response.data as Timetable[];
+        if (isEmpty(timetables)) {
+          return false;
+        }
+        const chosen = timetables[0].groups;
+        const courseGroupIDs: number[] = flatten(
+          courseIDs.map((c) => rootState.courses.courses[c].groups || [])
+        );
+        courseGroupIDs.forEach((id) => {
+          const group = state.store[id];
+          if (group === undefined) {
+            return;
+          }
+          if (chosen.includes(id) && !group.isPinned && !group.isEnrolled) {
+            dispatch("pin", group);
+          } else if (!chosen.includes(id) && group.isPinned) {
+            dispatch("unpin", group);
+          }
+        });
+        return true;
+      });
+  },
+
   // initFromJSONTag will be called at the beginning to set up the groups from
   // data provided in the JSON dump in DOM.
   initFromJSONTag({ commit }: ActionContext<State, any>) {
@@ -174,6 +295,28 @@ const actions = {
     });
   },
 
+  // listenToUpdates subscribes to the stream of changes of the groups (see
+  // `records/updates.py`). The numbers of students are updated in place. The
+  // groups' flags are re-fetched only when the student's own records change.
+  // The stream is only offered when the server can hold it open (see
+  // UPDATES_STREAM_ENABLED). Resolves to whether the prototype listens.
+  listenToUpdates({ commit, dispatch }: ActionContext<State, any>): boolean {
+    const updatesInput = document.getElementById(
+      "prototype-updates-url"
+    ) as HTMLInputElement | null;
+    if (updatesInput === null) {
+      return false;
+    }
+    const source = new EventSource(updatesInput.value);
+    source.addEventListener("counts", (event) => {
+      const counts = JSON.parse((event as MessageEvent).data) as GroupCounts;
+      commit("updateGroupCounts", counts);
+    });
+    source.addEventListener("records", () => {
+      dispatch("queryUpdatedGroupsStatus");
+    });
+    return true;
+  },
   queryUpdatedGroupsStatus({ state, commit }: ActionContext<State, any>) {
     if (isEmpty(state.store)) {
       return;
@@ -0,0 +1,128 @@
+"""Module group_list serializes groups for the timetables and the prototype.
+
+The timetables and the prototype need the same description of every group:
+its course, teacher, terms with classrooms, guaranteed spots and the number of
+enrolled students. Building it from model instances required the callers to
+prefetch the right relations, and a missed prefetch silently turned into a few
+queries per group.
+
+Here the needed columns are read with `values_list` in a fixed number of
+queries (groups with their courses and teachers, terms, classrooms, guaranteed
+spots and the group counters), regardless of the number of groups. The URLs
+are built by substituting ids into prefixes reversed once per call. The
+resulting dicts only hold plain types, so they are encoded by the C
+accelerated JSON encoder without any fallback to `default`.
+
+The benchmark `manage.py benchmark_group_list` shows the cost for various
+numbers of groups.
+"""
+from collections import defaultdict
+from typing import Callable, DefaultDict, Dict, Iterable, List, Optional
+
+from django.urls import reverse
+
+from apps.enrollment.courses.models.group import Group, GuaranteedSpots
+from apps.enrollment.courses.models.term import Term
+from apps.enrollment.courses.templatetags.course_types import decode_class_type_singular
+from apps.enrollment.records.models import GroupRecordCounts
+
+# Flags describing the relation of the viewer to the group. They are set by the
+# callers, None means unknown.
+FLAGS = ('is_enrolled', 'is_enqueued', 'is_pinned', 'can_enqueue', 'can_dequeue')
+
+# An argument that cannot appear in any URL on its own.
+_PLACEHOLDER = '7355608'
+
+
+def _url_builder(name: str) -> Callable[[object], str]:
+    """Reverses the URL once. The returned function substitutes the argument."""
+    prefix, suffix = reverse(name, args=(_PLACEHOLDER,)).rsplit(_PLACEHOLDER, 1)
+    return lambda arg: f'{prefix}{arg}{suffix}'
+
+
+def _format_time(t) -> str:
+    # The same format that `DjangoJSONEncoder` uses.
+    return t.isoformat()[:12] if t.microsecond else t.isoformat()
+
+
+def serialize_groups(group_ids: Iterable[int],
+                     flags: Optional[Dict[int, Dict[str, Optional[bool]]]] = None) -> List[Dict]:
+    """Describes the groups with serializable dicts.
+
+    Args:
+        group_ids: The groups are described in this order. Ids of groups that
+            do not exist are skipped.
+        flags: Flags (see `FLAGS`) of the groups, by group id.
+    """
+    group_ids = list(dict.fromkeys(group_ids))
+    flags = flags or {}
+    if not group_ids:
+        return []
+    course_url = _url_builder('course-page')
+    group_url = _url_builder('group-view')
+    employee_url = _url_builder('employee-profile')
+    action_url = _url_builder('prototype-action')
+
+    groups = {
+        row[0]: row
+        for row in Group.objects.filter(pk__in=group_ids).values_list(
+            'id', 'limit', 'extra', 'auto_enrollment', 'type', 'course__slug', 'course__name',
+            'course__short_name', 'teacher_id', 'teacher__user_id', 'teacher__user__first_name',
+            'teacher__user__last_name')
+    }
+    terms = list(
+        Term.objects.filter(group_id__in=group_ids).order_by('dayOfWeek', 'pk').values_list(
+            'id', 'group_id', 'dayOfWeek', 'start_time', 'end_time'))
+    classrooms: DefaultDict[int, List[str]] = defaultdict(list)
+    for term_id, number in Term.classrooms.through.objects.filter(
+            term_id__in=[term[0] for term in terms]).order_by(
+                'classroom__floor', 'classroom__number').values_list(
+                    'term_id', 'classroom__number'):
+        classrooms[term_id].append(number)
+    term_dicts: DefaultDict[int, List[Dict]] = defaultdict(list)
+    for term_id, group_id, day_of_week, start_time, end_time in terms:
+        term_dicts[group_id].append({
+            'dayOfWeek': day_of_week,
+            'start_time': _format_time(start_time),
+            'end_time': _format_time(end_time),
+            'classrooms': ', '.join(classrooms[term_id]),
+        })
+    guaranteed_spots: DefaultDict[int, List[Dict]] = defaultdict(list)
+    for group_id, role_name, limit in GuaranteedSpots.objects.filter(
+            group_id__in=group_ids).order_by('pk').values_list('group_id', 'role__name', 'limit'):
+        guaranteed_spots[group_id].append({'role': role_name, 'limit': limit})
+    counts = GroupRecordCounts.get_counts(groups)
+
+    group_dicts = []
+    for group_id in group_ids:
+        if group_id not in groups:
+            continue
+        (_, limit, extra, auto_enrollment, group_type, course_slug, course_name, course_short_name,
+         teacher_id, teacher_user_id, first_name, last_name) = groups[group_id]
+        group_flags = flags.get(group_id, {})
+        group_dict = {
+            'id': group_id,
+            'limit': limit,
+            'extra': extra,
+            'auto_enrollment': auto_enrollment,
+            'course': {
+                'url': course_url(course_slug),
+                'name': course_name,
+                'shortName': course_short_name,
+            },
+            'type': decode_class_type_singular(group_type),
+            'url': group_url(group_id),
+            'teacher': {
+                'id': teacher_id,
+                'url': employee_url(teacher_user_id) if teacher_id is not None else '',
+                # The same as `User.get_full_name`.
+                'name': f'{first_name or ""} {last_name or ""}'.strip(),
+            },
+            'num_enrolled': counts[group_id]['num_enrolled'],
+            'term': term_dicts[group_id],
+            'guaranteed_spots': guaranteed_spots[group_id],
+            'action_url': action_url(group_id),
+        }
+        group_dict.update({flag: group_flags.get(flag) for flag in FLAGS})
+        group_dicts.append(group_dict)
+    return group_dicts
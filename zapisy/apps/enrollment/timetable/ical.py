@@ -0,0 +1,198 @@
+"""Module ical exports the timetables as iCalendar feeds.
+
+A term of a course group repeats every week of the lectures, so it is
+exported as a single event with a weekly recurrence rule (RRULE). The days
+off (`Freeday`) and the days following the schedule of another day of the
+week (`ChangedDay`) are the exceptions: the dates lost by the term are listed
+in EXDATE and the dates it gains in RDATE. The size of a calendar thus depends
+on the number of terms rather than on the number of meetings.
+
+The calendar only depends on the set of groups, so it is cached under a hash
+of their ids — a change of the user's records leads to another key. The cached
+calendars are invalidated together, by changing the version which is a part of
+their keys, whenever a term, a group or the days off change. A calendar missing
+from the cache is streamed while it is generated and stored once it is done.
+"""
+import hashlib
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import DefaultDict, Iterable, Iterator, List, Optional, Set
+
+import pytz
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from apps.common import cache_versions
+from apps.enrollment.courses.models import CourseInstance, Group, Semester
+from apps.enrollment.courses.models.classroom import Classroom
+from apps.enrollment.courses.models.semester import ChangedDay, Freeday
+from apps.enrollment.courses.models.term import Term
+from apps.enrollment.records.models import RecordStatus
+
+VERSION_KEY = 'calendar-version'
+
+PRODID = '-//Instytut Informatyki UWr//System Zapisow//PL'
+LOCATION = "Instytut Informatyki Uniwersytetu Wrocławskiego"
+REMOTE = "Zajęcia zdalne"
+
+# The rules of the time zone of the timetables (TIME_ZONE), so that the
+# calendar apps do not have to know its name.
+VTIMEZONE = (
+    'BEGIN:VTIMEZONE',
+    'TZID:Europe/Warsaw',
+    'BEGIN:DAYLIGHT',
+    'TZOFFSETFROM:+0100',
+    'TZOFFSETTO:+0200',
+    'TZNAME:CEST',
+    'DTSTART:19700329T020000',
+    'RRULE:FREQ=YEARLY;BYMONTH=3;BYDAY=-1SU',
+    'END:DAYLIGHT',
+    'BEGIN:STANDARD',
+    'TZOFFSETFROM:+0200',
+    'TZOFFSETTO:+0100',
+    'TZNAME:CET',
+    'DTSTART:19701025T030000',
+    'RRULE:FREQ=YEARLY;BYMONTH=10;BYDAY=-1SU',
+    'END:STANDARD',
+    'END:VTIMEZONE',
+)
+
+
+def _escape(text: str) -> str:
+    """Escapes a TEXT value (RFC 5545, section 3.3.11)."""
+    return (text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def _fold(line: str) -> str:
+    """Splits the content line into lines of at most 75 octets, ending with CRLF.
+
+    The line is only split between characters, never inside a multi-byte one.
+    """
+    chunks = []
+    chunk = ''
+    size = 0
+    for char in line:
+        char_size = len(char.encode())
+        if size + char_size > 75:
+            chunks.append(chunk)
+            # The continuation lines start with a space.
+            chunk, size = ' ', 1
+        chunk += char
+        size += char_size
+    chunks.append(chunk)
+    return '\r\n'.join(chunks) + '\r\n'
+
+
+def _local(day: date, t: time) -> str:
+    return f'TZID={settings.TIME_ZONE}:{datetime.combine(day, t):%Y%m%dT%H%M%S}'
+
+
+def _utc(day: date, t: time) -> str:
+    moment = pytz.timezone(settings.TIME_ZONE).localize(datetime.combine(day, t))
+    return f'{moment.astimezone(pytz.utc):%Y%m%dT%H%M%SZ}'
+
+
+def user_groups(user: User, semester: Optional[Semester]) -> List[int]:
+    """Returns the ids of groups the user teaches or is enrolled into."""
+    groups = Group.objects.filter(course__semester=semester).filter(
+        Q(teacher__user=user) | Q(record__student__user=user, record__status=RecordStatus.ENROLLED))
+    return list(groups.distinct().order_by('pk').values_list('pk', flat=True))
+
+
+def generate(semester: Semester, group_ids: Iterable[int]) -> Iterator[str]:
+    """Produces the calendar of the groups piece by piece, bypassing the cache."""
+    first_day = semester.lectures_beginning or semester.semester_beginning
+    last_day = semester.lectures_ending or semester.semester_ending
+    free_days = set(
+        Freeday.objects.filter(day__range=(first_day, last_day)).values_list('day', flat=True))
+    # Dates lost and gained by the days of the week, as in `Semester.get_all_days_of_week`.
+    lost: DefaultDict[int, Set[date]] = defaultdict(set)
+    gained: DefaultDict[int, Set[date]] = defaultdict(set)
+    for day, weekday in ChangedDay.objects.filter(
+            day__range=(first_day, last_day)).values_list('day', 'weekday'):
+        lost[day.weekday()].add(day)
+        if day not in free_days:
+            gained[Term.get_python_day_of_week(weekday)].add(day)
+    for day in free_days:
+        lost[day.weekday()].add(day)
+    stamp = f'{datetime.now(pytz.utc):%Y%m%dT%H%M%SZ}'
+
+    yield ''.join(map(_fold, (
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:{PRODID}',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{_escape(f"Plan zajęć {semester.get_name()}")}',
+        f'X-WR-TIMEZONE:{settings.TIME_ZONE}',
+    ) + VTIMEZONE))
+    terms = Term.objects.filter(group_id__in=group_ids).select_related(
+        'group__course', 'group__teacher__user').prefetch_related('classrooms').order_by('pk')
+    for term in terms:
+        weekday = Term.get_python_day_of_week(term.dayOfWeek)
+        start = first_day + timedelta(days=(weekday - first_day.weekday()) % 7)
+        group = term.group
+        classrooms = ', '.join(c.number for c in term.classrooms.all())
+        location = f"Sala {classrooms}, {LOCATION}" if classrooms else f"{REMOTE}, {LOCATION}"
+        lines = [
+            'BEGIN:VEVENT',
+            f'UID:term-{term.pk}-{semester.pk}@zapisy',
+            f'DTSTAMP:{stamp}',
+            f'DTSTART;{_local(start, term.start_time)}',
+            f'DTEND;{_local(start, term.end_time)}',
+            f'RRULE:FREQ=WEEKLY;UNTIL={_utc(last_day, term.end_time)}',
+        ]
+        lines.extend(f'EXDATE;{_local(day, term.start_time)}' for day in sorted(lost[weekday]))
+        lines.extend(f'RDATE;{_local(day, term.start_time)}' for day in sorted(gained[weekday]))
+        lines.extend([
+            f'SUMMARY:{_escape(f"{group.course.name} - {group.get_type_display()}")}',
+            f'LOCATION:{_escape(location)}',
+            f'DESCRIPTION:{_escape(f"Prowadzący: {group.get_teacher_full_name()}")}',
+            'END:VEVENT',
+        ])
+        yield ''.join(map(_fold, lines))
+    yield _fold('END:VCALENDAR')
+
+
+def user_calendar(user: User) -> Iterator[str]:
+    """Produces the calendar of the user's groups in the upcoming semester.
+
+    The calendar is taken from the cache, if possible. Otherwise it is stored
+    there once it has been generated completely.
+    """
+    semester = Semester.get_upcoming_semester()
+    if semester is None:
+        yield ''.join(map(_fold, ('BEGIN:VCALENDAR', 'VERSION:2.0', f'PRODID:{PRODID}', 'END:VCALENDAR')))
+        return
+    group_ids = user_groups(user, semester)
+    digest = hashlib.sha1(','.join(map(str, group_ids)).encode()).hexdigest()
+    key = f'calendar:{semester.pk}:{cache_versions.get(VERSION_KEY)}:{digest}'
+    calendar = cache.get(key)
+    if calendar is not None:
+        yield calendar
+        return
+    chunks = []
+    for chunk in generate(semester, group_ids):
+        chunks.append(chunk)
+        yield chunk
+    cache.set(key, ''.join(chunks), settings.CALENDAR_CACHE_TIMEOUT)
+
+
+def invalidate(**kwargs):
+    """Drops the cached calendars."""
+    cache_versions.bump(VERSION_KEY)
+
+
+def connect_receivers():
+    """Invalidates the calendars whenever their data changes.
+
+    Called when the app is ready (see `TimetableConfig`).
+    """
+    for model in (Term, Group, CourseInstance, Classroom, Semester, Freeday, ChangedDay):
+        post_save.connect(invalidate, sender=model, dispatch_uid=f'calendar-save-{model.__name__}')
+        post_delete.connect(invalidate, sender=model, dispatch_uid=f'calendar-delete-{model.__name__}')
+    m2m_changed.connect(invalidate, sender=Term.classrooms.through, dispatch_uid='calendar-classrooms')
@@ -0,0 +1,76 @@
+import json
+import math
+import statistics
+import time
+from datetime import time as day_time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from apps.enrollment.courses.models.classroom import Classroom
+from apps.enrollment.courses.models.term import Term
+from apps.enrollment.timetable import group_list
+
+CLASSROOM_PREFIX = 'bench-'
+
+
+class Command(BaseCommand):
+    help = ("Builds a synthetic semester and measures serializing groups for the timetables "
+            "(`group_list.serialize_groups`) for various numbers of groups.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[1, 50, 500])
+        parser.add_argument("--repeat", type=int, default=20,
+                            help="Number of measurements for every size")
+        parser.add_argument("--force", action="store_true",
+                            help="Run even if DEBUG is off")
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options["force"]:
+            raise CommandError("The benchmark creates hundreds of groups. "
+                               "Run it on a development database or pass --force.")
+        # The harness is built on the test factories, which are only installed
+        # in development environments.
+        from apps.enrollment.records.tests import loadgen
+
+        sizes = options["sizes"]
+        self.stdout.write("Generating the semester...")
+        synthetic = loadgen.generate_semester(
+            num_students=10, num_courses=math.ceil(max(sizes) / 4), groups_per_course=4)
+        try:
+            group_ids = [group.pk for group in synthetic.groups + synthetic.auto_groups]
+            self._add_terms(group_ids)
+            # Creates the group counters.
+            group_list.serialize_groups(group_ids)
+            for size in sizes:
+                ids = group_ids[:size]
+                with CaptureQueriesContext(connection) as queries:
+                    group_list.serialize_groups(ids)
+                timings = []
+                for _ in range(options["repeat"]):
+                    start = time.perf_counter()
+                    json.dumps(group_list.serialize_groups(ids))
+                    timings.append(time.perf_counter() - start)
+                self.stdout.write(
+                    f"{len(ids):5} groups: {len(queries.captured_queries)} queries, "
+                    f"median {statistics.median(timings) * 1000:.2f} ms, "
+                    f"max {max(timings) * 1000:.2f} ms")
+        finally:
+            loadgen.cleanup(synthetic.semester)
+            Classroom.objects.filter(number__startswith=CLASSROOM_PREFIX).delete()
+
+    @staticmethod
+    def _add_terms(group_ids):
+        """Gives every group two terms, each in a classroom."""
+        classrooms = [Classroom.objects.create(number=f'{CLASSROOM_PREFIX}{i}') for i in range(10)]
+        terms = Term.objects.bulk_create([
+            Term(group_id=group_id, dayOfWeek=str(day), start_time=day_time(8 + 2 * (i % 5)),
+                 end_time=day_time(10 + 2 * (i % 5)))
+            for i, group_id in enumerate(group_ids) for day in (1, 3)
+        ])
+        Term.classrooms.through.objects.bulk_create([
+            Term.classrooms.through(term_id=term.pk, classroom_id=classrooms[i % 10].pk)
+            for i, term in enumerate(terms)
+        ])
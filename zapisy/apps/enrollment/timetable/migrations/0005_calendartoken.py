@@ -0,0 +1,25 @@
+# Generated by Django 3.1.14 on 2026-10-18 09:00
+
+import apps.enrollment.timetable.models
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('timetable', '0004_auto_20190822_1346'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CalendarToken',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(default=apps.enrollment.timetable.models.new_calendar_token, max_length=43, unique=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -1,6 +1,8 @@
-"""Models for the timetable prototype."""
+"""Models for the timetable and its prototype."""
+import secrets
 from typing import Iterable
 
+from django.contrib.auth.models import User
 from django.db import models
 
 from apps.enrollment.courses.models import Group, Semester
@@ -31,3 +33,30 @@ class Pin(models.Model):
             group__course__semester_id=semester.pk, student_id=student.pk).select_related(
                 'group__course', 'group__teacher', 'group__teacher__user')
         return map(lambda p: p.group, pins)
+
+
+def new_calendar_token() -> str:
+    return secrets.token_urlsafe(32)
+
+
+class CalendarToken(models.Model):
+    """Secret token in the URL of the user's calendar feed.
+
+    Calendar apps subscribe to the feed without logging in, so the token is
+    the only credential. Changing it revokes the old URL.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='+')
+    token = models.CharField(max_length=43, unique=True, default=new_calendar_token)
+
+    @classmethod
+    def for_user(cls, user: User) -> 'CalendarToken':
+        """Returns the user's token, creating it on the first use.
+
+        The timetable page shows the feed URL on every view, so the token is
+        only read, unless it is missing.
+        """
+        calendar_token = cls.objects.filter(user=user).first()
+        if calendar_token is None:
+            # Another request might have created it in the meantime.
+            calendar_token, _ = cls.objects.get_or_create(user=user)
+        return calendar_token
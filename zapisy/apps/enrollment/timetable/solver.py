@@ -0,0 +1,208 @@
+"""Module solver composes conflict-free timetables for the prototype.
+
+A student planning the semester chooses the courses and then looks for a
+combination of their groups — one group of every group type of every course,
+e.g. one lecture and one exercise group of Cooking — whose terms do not
+overlap. Trying the combinations by hand in the prototype takes a pin and an
+unpin for every attempt, so `find_timetables` searches for them instead.
+
+The terms of every group are encoded as a bitmap (see `term_mask`): every day
+of the week takes `QUANTA_PER_DAY` consecutive bits, one for every `QUANTUM`
+minutes, so that two groups collide exactly if their bitmaps intersect. Days
+the student wants to keep free, and the terms of his groups in other courses,
+are marked as taken from the start.
+
+Every group is scored with the chance of getting a place in it (see `chance`),
+and a timetable with the product of the chances of its groups. The best
+timetables are found with a depth-first branch-and-bound search (see `solve`):
+
+  * The group types with the fewest groups are decided first, and their groups
+    are tried from the most promising one.
+  * After every choice, each undecided group type must still have a group that
+    fits (otherwise the branch is dropped), and the best of these groups bound
+    the score that the branch may reach. Branches that cannot beat the
+    timetables found so far are dropped.
+"""
+import heapq
+import math
+from collections import defaultdict
+from datetime import time
+from typing import DefaultDict, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from apps.enrollment.courses.models import Group, Semester
+from apps.enrollment.courses.models.term import Term
+from apps.enrollment.records.models import GroupRecordCounts, Record, RecordStatus
+from apps.users.models import Student
+
+QUANTUM = 5
+QUANTA_PER_DAY = 24 * 60 // QUANTUM
+DAY_MASK = (1 << QUANTA_PER_DAY) - 1
+
+# The search stops after visiting this many partial timetables and returns the
+# best ones found until then.
+MAX_NODES = 100000
+
+# A group type of a course: (course_id, group_type).
+Slot = Tuple[int, int]
+
+
+class Option(NamedTuple):
+    group_id: int
+    # The terms of the group (see `term_mask`).
+    mask: int
+    chance: float
+
+
+class Timetable(NamedTuple):
+    group_ids: List[int]
+    chance: float
+
+
+def _quantum(t: time) -> int:
+    return (t.hour * 60 + t.minute) // QUANTUM
+
+
+def term_mask(day_of_week: str, start_time: time, end_time: time) -> int:
+    """Encodes the term as bits of the quanta it takes.
+
+    The quanta are rounded outwards, so terms sharing a quantum collide, but a
+    term ending exactly when the next one starts does not.
+    """
+    offset = Term.get_python_day_of_week(day_of_week) * QUANTA_PER_DAY
+    start = _quantum(start_time)
+    end = -(-(end_time.hour * 60 + end_time.minute) // QUANTUM)
+    return ((1 << (end - start)) - 1) << (offset + start)
+
+
+def day_mask(day_of_week: str) -> int:
+    """Encodes the whole day of the week."""
+    return DAY_MASK << (Term.get_python_day_of_week(day_of_week) * QUANTA_PER_DAY)
+
+
+def chance(limit: int, num_enrolled: int, num_enqueued: int) -> float:
+    """Estimates the chance of getting a place in the group.
+
+    The share of the free spots among the free spots and the students already
+    waiting for them, smoothed so that it never reaches zero or one (Laplace's
+    rule of succession). A full group with nobody in the queue gives one half.
+    """
+    free = max(limit - num_enrolled, 0)
+    return (free + 1) / (free + num_enqueued + 2)
+
+
+def solve(slots: Dict[Slot, List[Option]], taken: int = 0, limit: int = 5,
+          max_nodes: int = MAX_NODES) -> List[Timetable]:
+    """Finds the best timetables taking one group of every slot.
+
+    Args:
+        slots: The groups to choose from in every slot.
+        taken: The bitmap of the time that must stay free.
+        limit: How many timetables to return.
+        max_nodes: See `MAX_NODES`.
+
+    Returns:
+        At most `limit` timetables without collisions, the most likely first.
+        The group ids of a timetable are sorted.
+    """
+    # Scores are sums of logarithms of the chances.
+    options = [
+        sorted(((-math.log(o.chance), o.group_id, o.mask) for o in slot_options))
+        for slot_options in sorted(slots.values(), key=len)
+    ]
+    if not all(options):
+        return []
+    # `best[i]` is the lowest cost of slots from i on, ignoring the collisions.
+    best = [0.0] * (len(options) + 1)
+    for i in reversed(range(len(options))):
+        best[i] = best[i + 1] + options[i][0][0]
+    # The timetables found, the worst on top: pairs (-cost, group ids).
+    found: List[Tuple[float, Tuple[int, ...]]] = []
+    chosen: List[int] = []
+    nodes = 0
+
+    def bound(i: int, occupied: int) -> Optional[float]:
+        """The lowest cost of slots from i on, or None if any of them cannot fit."""
+        total = 0.0
+        for slot_options in options[i:]:
+            for cost, _, mask in slot_options:
+                if not mask & occupied:
+                    total += cost
+                    break
+            else:
+                return None
+        return total
+
+    def search(i: int, occupied: int, cost: float):
+        nonlocal nodes
+        if i == len(options):
+            entry = (-cost, tuple(sorted(chosen)))
+            if len(found) < limit:
+                heapq.heappush(found, entry)
+            else:
+                heapq.heappushpop(found, entry)
+            return
+        for option_cost, group_id, mask in options[i]:
+            # The options are sorted by cost, so the following ones are even worse.
+            if len(found) == limit and cost + option_cost + best[i + 1] >= -found[0][0]:
+                return
+            if nodes >= max_nodes:
+                return
+            if mask & occupied:
+                continue
+            rest = bound(i + 1, occupied | mask)
+            if rest is None or (len(found) == limit and cost + option_cost + rest >= -found[0][0]):
+                continue
+            nodes += 1
+            chosen.append(group_id)
+            search(i + 1, occupied | mask, cost + option_cost)
+            chosen.pop()
+
+    search(0, taken, 0.0)
+    return [
+        Timetable(list(group_ids), math.exp(score))
+        for score, group_ids in sorted(found, reverse=True)
+    ]
+
+
+def find_timetables(student: Student, course_ids: Iterable[int], free_days: Iterable[str] = (),
+                    limit: int = 5) -> List[Timetable]:
+    """Finds the best timetables of the courses for the student.
+
+    Args:
+        student: The terms of his groups in the other courses are avoided. The
+            groups he is already enrolled into are sure for him.
+        course_ids: The courses of the upcoming semester to take.
+        free_days: The days of the week (see `DAYS_OF_WEEK`) to keep free.
+        limit: How many timetables to return.
+    """
+    semester = Semester.get_upcoming_semester()
+    course_ids = set(course_ids)
+    groups = {
+        group_id: (course_id, group_type, group_limit)
+        for group_id, course_id, group_type, group_limit in Group.objects.filter(
+            course_id__in=course_ids, course__semester=semester).exclude(
+                extra='hidden').values_list('id', 'course_id', 'type', 'limit')
+    }
+    enrolled = dict(
+        Record.objects.filter(
+            student=student, status=RecordStatus.ENROLLED,
+            group__course__semester=semester).values_list('group_id', 'group__course_id'))
+    masks: DefaultDict[int, int] = defaultdict(int)
+    for group_id, day_of_week, start_time, end_time in Term.objects.filter(
+            group_id__in=set(groups) | set(enrolled)).values_list(
+                'group_id', 'dayOfWeek', 'start_time', 'end_time'):
+        masks[group_id] |= term_mask(day_of_week, start_time, end_time)
+
+    taken = 0
+    for day_of_week in free_days:
+        taken |= day_mask(day_of_week)
+    for group_id, course_id in enrolled.items():
+        if course_id not in course_ids:
+            taken |= masks[group_id]
+    counts = GroupRecordCounts.get_counts(groups)
+    slots: DefaultDict[Slot, List[Option]] = defaultdict(list)
+    for group_id, (course_id, group_type, group_limit) in groups.items():
+        group_chance = 1.0 if group_id in enrolled else chance(
+            group_limit, counts[group_id]['num_enrolled'], counts[group_id]['num_enqueued'])
+        slots[course_id, group_type].append(Option(group_id, masks[group_id], group_chance))
+    return solve(slots, taken, limit)
@@ -0,0 +1,64 @@
+from datetime import time
+
+from django.contrib.auth.models import Group as AuthGroup
+from django.test import TestCase
+from django.urls import reverse
+
+from apps.enrollment.courses.models.group import GuaranteedSpots
+from apps.enrollment.courses.tests.factories import ClassroomFactory, GroupFactory, TermFactory
+from apps.enrollment.records.models import GroupRecordCounts
+from apps.enrollment.timetable import group_list
+
+
+class SerializeGroupsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.groups = [GroupFactory() for _ in range(3)]
+        cls.group = cls.groups[0]
+        term = TermFactory(group=cls.group, dayOfWeek='3', start_time=time(12, 15),
+                           end_time=time(14))
+        term.classrooms.add(ClassroomFactory(number='25'), ClassroomFactory(number='103'))
+        role = AuthGroup.objects.create(name='isim')
+        GuaranteedSpots.objects.create(group=cls.group, role=role, limit=2)
+
+    def test_group_dict(self):
+        [group_dict] = group_list.serialize_groups([self.group.pk], {self.group.pk: {
+            'is_enrolled': True,
+        }})
+        course = self.group.course
+        teacher = self.group.teacher
+        self.assertEqual(group_dict['course'], {
+            'url': reverse('course-page', args=(course.slug,)),
+            'name': course.name,
+            'shortName': course.short_name,
+        })
+        self.assertEqual(group_dict['teacher'], {
+            'id': teacher.pk,
+            'url': reverse('employee-profile', args=(teacher.user_id,)),
+            'name': teacher.user.get_full_name(),
+        })
+        self.assertEqual(group_dict['url'], reverse('group-view', args=(self.group.pk,)))
+        self.assertEqual(group_dict['action_url'],
+                         reverse('prototype-action', args=(self.group.pk,)))
+        self.assertEqual(group_dict['type'], "Ćwiczenia")
+        self.assertEqual(group_dict['term'], [{
+            'dayOfWeek': '3',
+            'start_time': '12:15:00',
+            'end_time': '14:00:00',
+            # The classrooms are ordered by floor and number.
+            'classrooms': '103, 25',
+        }])
+        self.assertEqual(group_dict['guaranteed_spots'], [{'role': 'isim', 'limit': 2}])
+        self.assertEqual(group_dict['num_enrolled'], 0)
+        self.assertTrue(group_dict['is_enrolled'])
+        self.assertIsNone(group_dict['can_enqueue'])
+
+    def test_fixed_number_of_queries(self):
+        ids = [g.pk for g in self.groups]
+        GroupRecordCounts.get_counts(ids)
+        with self.assertNumQueries(5):
+            group_list.serialize_groups(ids[:1])
+        with self.assertNumQueries(5):
+            group_dicts = group_list.serialize_groups(reversed(ids))
+        self.assertEqual([g['id'] for g in group_dicts], ids[::-1])
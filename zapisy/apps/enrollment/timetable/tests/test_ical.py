@@ -0,0 +1,97 @@
+from datetime import date, datetime, time
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from freezegun import freeze_time
+
+from apps.enrollment.courses.models.semester import ChangedDay, Freeday
+from apps.enrollment.courses.tests.factories import (ClassroomFactory, GroupFactory,
+                                                     SemesterFactory, TermFactory)
+from apps.enrollment.records.tests.factories import RecordFactory
+from apps.enrollment.timetable import ical
+from apps.enrollment.timetable.models import CalendarToken
+from apps.users.tests.factories import StudentFactory
+
+
+def _unfold(calendar: str):
+    return calendar.replace('\r\n ', '').split('\r\n')
+
+
+@freeze_time(datetime(2020, 9, 1))
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CalendarTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.semester = SemesterFactory(
+            records_opening=datetime(2020, 9, 20), records_closing=datetime(2020, 10, 31),
+            lectures_beginning=date(2020, 10, 1), lectures_ending=date(2021, 1, 31),
+            semester_beginning=date(2020, 10, 1), semester_ending=date(2021, 2, 22))
+        cls.group = GroupFactory(course__semester=cls.semester, course__name="Gotowanie")
+        # Tuesdays.
+        cls.term = TermFactory(group=cls.group, dayOfWeek='2', start_time=time(10),
+                               end_time=time(12))
+        cls.term.classrooms.add(ClassroomFactory(number='25'))
+        cls.student = StudentFactory()
+        RecordFactory(student=cls.student, group=cls.group)
+        Freeday.objects.create(day=date(2020, 11, 10))
+        # A Thursday following the schedule of Tuesdays.
+        ChangedDay.objects.create(day=date(2020, 11, 12), weekday='2')
+
+    def setUp(self):
+        cache.clear()
+
+    def calendar(self, user) -> str:
+        return ''.join(ical.user_calendar(user))
+
+    def test_one_event_per_term(self):
+        lines = _unfold(self.calendar(self.student.user))
+        self.assertEqual(lines.count('BEGIN:VEVENT'), 1)
+        self.assertIn('DTSTART;TZID=Europe/Warsaw:20201006T100000', lines)
+        self.assertIn('DTEND;TZID=Europe/Warsaw:20201006T120000', lines)
+        # The last lecture day is in winter time.
+        self.assertIn('RRULE:FREQ=WEEKLY;UNTIL=20210131T110000Z', lines)
+        self.assertIn('EXDATE;TZID=Europe/Warsaw:20201110T100000', lines)
+        self.assertIn('RDATE;TZID=Europe/Warsaw:20201112T100000', lines)
+        self.assertIn('SUMMARY:Gotowanie - ćwiczenia', lines)
+        self.assertIn(
+            'LOCATION:Sala 25\\, Instytut Informatyki Uniwersytetu Wrocławskiego', lines)
+
+    def test_thursday_loses_changed_day(self):
+        TermFactory(group=self.group, dayOfWeek='4', start_time=time(8), end_time=time(10))
+        lines = _unfold(self.calendar(self.student.user))
+        self.assertIn('EXDATE;TZID=Europe/Warsaw:20201112T080000', lines)
+        self.assertNotIn('RDATE;TZID=Europe/Warsaw:20201112T080000', lines)
+
+    def test_lines_are_folded(self):
+        # The name fits in the field, but not in a single line.
+        self.group.course.name = "Bardzo długa nazwa przedmiotu " * 3
+        self.group.course.save()
+        lines = self.calendar(self.student.user).split('\r\n')
+        for line in lines:
+            self.assertLessEqual(len(line.encode()), 75)
+        self.assertTrue(any(line.startswith(' ') for line in lines))
+
+    def test_cached_until_records_change(self):
+        first = self.calendar(self.student.user)
+        with self.assertNumQueries(2):
+            # The upcoming semester and the groups of the user.
+            self.assertEqual(self.calendar(self.student.user), first)
+
+        other = GroupFactory(course__semester=self.semester, course__name="Pranie")
+        TermFactory(group=other)
+        RecordFactory(student=self.student, group=other)
+        self.assertIn('SUMMARY:Pranie - ćwiczenia', _unfold(self.calendar(self.student.user)))
+
+    def test_feed_by_token(self):
+        token = CalendarToken.for_user(self.student.user).token
+        with self.assertNumQueries(1):
+            self.assertEqual(CalendarToken.for_user(self.student.user).token, token)
+        response = self.client.get(reverse('calendar-feed', args=(token,)))
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        self.assertEqual(b''.join(response.streaming_content).decode(),
+                         self.calendar(self.student.user))
+
+        response = self.client.get(reverse('calendar-feed', args=('wrong' + token,)))
+        self.assertEqual(response.status_code, 404)
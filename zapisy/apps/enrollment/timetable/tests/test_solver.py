@@ -0,0 +1,115 @@
+import itertools
+import json
+import random
+from datetime import datetime, time
+
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from freezegun import freeze_time
+
+from apps.enrollment.courses.models.group import GroupType
+from apps.enrollment.courses.tests.factories import (CourseInstanceFactory, GroupFactory,
+                                                     SemesterFactory, TermFactory)
+from apps.enrollment.records.tests.factories import RecordFactory
+from apps.enrollment.timetable import solver
+from apps.users.tests.factories import StudentFactory
+
+
+def _option(group_id, day, hour, chance=0.5):
+    return solver.Option(group_id, solver.term_mask(day, time(hour), time(hour + 2)), chance)
+
+
+class SolveTest(SimpleTestCase):
+
+    def test_term_mask(self):
+        ten_to_twelve = solver.term_mask('1', time(10), time(12))
+        self.assertFalse(ten_to_twelve & solver.term_mask('1', time(12), time(14)))
+        self.assertTrue(ten_to_twelve & solver.term_mask('1', time(11, 45), time(13)))
+        self.assertFalse(ten_to_twelve & solver.term_mask('2', time(10), time(12)))
+        self.assertTrue(ten_to_twelve & solver.day_mask('1'))
+
+    def test_avoids_collisions(self):
+        slots = {
+            (1, GroupType.LECTURE): [_option(1, '1', 10)],
+            # Group 2 is more likely, but collides with the lecture.
+            (1, GroupType.EXERCISES): [_option(2, '1', 10, 0.9), _option(3, '2', 10, 0.4)],
+        }
+        [timetable] = solver.solve(slots)
+        self.assertEqual(timetable.group_ids, [1, 3])
+        self.assertAlmostEqual(timetable.chance, 0.2)
+
+    def test_free_days(self):
+        slots = {(1, GroupType.EXERCISES): [_option(1, '5', 10, 0.9), _option(2, '2', 10, 0.4)]}
+        self.assertEqual(
+            [t.group_ids for t in solver.solve(slots, taken=solver.day_mask('5'))], [[2]])
+        self.assertEqual(solver.solve(slots, taken=solver.day_mask('5') | solver.day_mask('2')), [])
+
+    def test_same_as_exhaustive_search(self):
+        rng = random.Random(0)
+        slots = {
+            (course, group_type): [
+                _option(course * 100 + group_type * 10 + i, str(rng.randint(1, 5)),
+                        rng.choice([8, 10, 12, 14, 16]), rng.uniform(0.01, 0.99))
+                for i in range(rng.randint(1, 4))
+            ]
+            for course in range(5) for group_type in (GroupType.LECTURE, GroupType.EXERCISES)
+        }
+        expected = []
+        for combination in itertools.product(*slots.values()):
+            mask = 0
+            chance = 1.0
+            for option in combination:
+                if option.mask & mask:
+                    break
+                mask |= option.mask
+                chance *= option.chance
+            else:
+                expected.append((chance, sorted(o.group_id for o in combination)))
+        expected.sort(reverse=True)
+        self.assertEqual([t.group_ids for t in solver.solve(slots, limit=3)],
+                         [group_ids for _, group_ids in expected[:3]])
+
+
+@freeze_time(datetime(2020, 9, 1))
+class PrototypeSolveTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        semester = SemesterFactory(records_closing=datetime(2020, 10, 31))
+        cls.course = CourseInstanceFactory(semester=semester)
+        lecture = GroupFactory(course=cls.course, type=GroupType.LECTURE)
+        TermFactory(group=lecture, dayOfWeek='1', start_time=time(10), end_time=time(12))
+        cls.full = GroupFactory(course=cls.course, limit=1)
+        TermFactory(group=cls.full, dayOfWeek='3', start_time=time(10), end_time=time(12))
+        cls.empty = GroupFactory(course=cls.course, limit=10)
+        TermFactory(group=cls.empty, dayOfWeek='4', start_time=time(10), end_time=time(12))
+        cls.lecture = lecture
+        RecordFactory(group=cls.full)
+        cls.student = StudentFactory()
+
+        # The student's group of another course takes Thursday morning.
+        other = GroupFactory(course=CourseInstanceFactory(semester=semester))
+        TermFactory(group=other, dayOfWeek='4', start_time=time(11), end_time=time(13))
+        cls.other = other
+
+    def solve(self, **data):
+        self.client.force_login(self.student.user)
+        return self.client.post(reverse('prototype-solve'), json.dumps(data),
+                                content_type='application/json')
+
+    def test_prefers_empty_groups(self):
+        response = self.solve(courses=[self.course.pk])
+        self.assertEqual([t['groups'] for t in response.json()], [
+            sorted([self.lecture.pk, self.empty.pk]),
+            sorted([self.lecture.pk, self.full.pk]),
+        ])
+
+    def test_avoids_own_groups(self):
+        RecordFactory(student=self.student, group=self.other)
+        response = self.solve(courses=[self.course.pk], free_days=['3'])
+        self.assertEqual(response.json(), [])
+
+    def test_invalid_body(self):
+        self.assertEqual(self.solve(courses=[self.course.pk], free_days=['8']).status_code, 400)
+        self.assertEqual(self.solve(free_days=['1']).status_code, 400)
+        self.assertEqual(self.solve(courses=[self.course.pk], limit=0).status_code, 400)
@@ -6,7 +6,14 @@ urlpatterns = [
     path('', views.my_timetable, name='my-timetable'),
     path('prototype/', views.my_prototype, name='my-prototype'),
     path('prototype/action/<int:group_id>/', views.prototype_action, name='prototype-action'),
+    path('prototype/checkout/', views.prototype_checkout, name='prototype-checkout'),
+    path('prototype/catalog/', views.prototype_catalog, name='prototype-catalog'),
     path('prototype/course/<int:course_id>/', views.prototype_get_course, name='prototype-get-course'),
     path('prototype/update/', views.prototype_update_groups, name='prototype-update'),
-    path('calendar-export/', views.calendar_export, name='calendar-export')
+    path('prototype/updates/', views.prototype_updates, name='prototype-updates'),
+    path('prototype/solve/', views.prototype_solve, name='prototype-solve'),
+    path('prototype/queue-positions/', views.prototype_queue_positions,
+         name='prototype-queue-positions'),
+    path('calendar-export/', views.calendar_export, name='calendar-export'),
+    path('calendar/<str:token>.ics', views.calendar_feed, name='calendar-feed'),
 ]
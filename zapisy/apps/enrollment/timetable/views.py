@@ -1,87 +1,51 @@
 """Views for timetable and prototype."""
 import collections
-import csv
+import gzip
 import json
-from typing import List
+import re
+from typing import Iterable, List
 
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count, Q
-from django.forms.models import model_to_dict
-from django.http import JsonResponse
-from django.shortcuts import Http404, HttpResponse, render
+from django.db import connection
+from django.db.models import Q
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import Http404, HttpResponse, get_object_or_404, render
 from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
 from django.views.decorators.http import require_POST
 
-from apps.enrollment.courses.models import CourseInstance, Group, Semester
-from apps.enrollment.courses.templatetags.course_types import decode_class_type_singular
+from apps.common.days_of_week import DAYS_OF_WEEK
+from apps.enrollment.courses.models import CourseInstance, Group, Semester, catalog
+from apps.enrollment.records import updates
+from apps.enrollment.records.admission import admission_control
 from apps.enrollment.records.models import Record, RecordStatus
-from apps.enrollment.timetable.models import Pin
-from apps.schedule.models.term import Term as SchTerm
+from apps.enrollment.timetable import group_list, ical, solver
+from apps.enrollment.timetable.models import CalendarToken, Pin
 from apps.users.decorators import student_required
 from apps.users.models import Employee, Student
 
+ACCEPTS_GZIP = re.compile(r'\bgzip\b')
+# The ids of the events of the local and Redis backends of `updates.py`.
+EVENT_ID = re.compile(r'\d+(-\d+)?')
+# The most timetables `prototype_solve` returns at once.
+MAX_TIMETABLES = 20
 
-def build_group_list(groups: List[Group]):
+
+def build_group_list(groups: Iterable[Group]):
     """Builds a serializable object containing relevant information about groups.
 
     The information must be sufficient to display information in the timetable
-    and perform actions (enqueuing/dequeuing).
-    """
-    stats = Record.groups_stats(groups)
-    group_dicts = []
-    group: Group
-    for group in groups:
-        group_dict = model_to_dict(group, fields=['id', 'limit', 'extra', 'auto_enrollment'])
-        term_dicts = []
-        for term in group.term.all():
-            term_dict = model_to_dict(term, fields=['dayOfWeek', 'start_time', 'end_time'])
-            term_dict['classrooms'] = term.numbers()
-            term_dicts.append(term_dict)
-        guaranteed_spots = [{
-            'role': gs.role.name,
-            'limit': gs.limit,
-        } for gs in group.guaranteed_spots.all()]
-        group_dict.update({
-            'course': {
-                'url': reverse('course-page', args=(group.course.slug, )),
-                'name': group.course.name,
-                'shortName': group.course.short_name,
-            },
-            'type': decode_class_type_singular(group.type),
-            'url': reverse('group-view', args=(group.pk, )),
-            'teacher': {
-                'id': group.teacher_id,
-                'url': reverse('employee-profile', args=(group.teacher.user_id, )),
-                'name': group.teacher.user.get_full_name(),
-            },
-            'num_enrolled': stats.get(group.pk).get('num_enrolled'),
-            'term': term_dicts,
-            'guaranteed_spots': guaranteed_spots,
-            'is_enrolled': getattr(group, 'is_enrolled', None),
-            'is_enqueued': getattr(group, 'is_enqueued', None),
-            'is_pinned': getattr(group, 'is_pinned', None),
-            'can_enqueue': getattr(group, 'can_enqueue', None),
-            'can_dequeue': getattr(group, 'can_dequeue', None),
-            'action_url': reverse('prototype-action', args=(group.pk, )),
-        })
-        group_dicts.append(group_dict)
-    return group_dicts
-
-
-def list_courses_in_semester(semester: Semester):
-    """Returns a JSON of all the course names in semester.
-
-    This list will be used in prototype.
+    and perform actions (enqueuing/dequeuing). Only the ids of the groups and
+    the flags set on them (see `group_list.FLAGS`) are read from the objects,
+    so the callers need not prefetch anything.
     """
-    qs = CourseInstance.objects.filter(semester=semester).prefetch_related('effects', 'tags')
-    courses = []
-    for course in qs:
-        course_dict = course.__json__()
-        course_dict.update({
-            'url': reverse('prototype-get-course', args=(course.id,)),
-        })
-        courses.append(course_dict)
-    return courses
+    groups = list(groups)
+    flags = {
+        group.pk: {flag: getattr(group, flag, None) for flag in group_list.FLAGS}
+        for group in groups
+    }
+    return group_list.serialize_groups((group.pk for group in groups), flags)
 
 
 def student_timetable_data(student: Student):
@@ -91,9 +55,8 @@ def student_timetable_data(student: Student):
     records = Record.objects.filter(
         student=student,
         group__course__semester=semester, status=RecordStatus.ENROLLED).select_related(
-            'group__teacher', 'group__teacher__user', 'group__course').prefetch_related(
-                'group__term', 'group__term__classrooms', 'group__guaranteed_spots',
-                'group__guaranteed_spots__role')
+            'group__course').prefetch_related('group__term', 'group__term__classrooms')
+    # The terms are only prefetched for the template.
     groups = [r.group for r in records]
     group_dicts = build_group_list(groups)
 
@@ -110,9 +73,7 @@ def student_timetable_data(student: Student):
 def employee_timetable_data(employee: Employee):
     """Collects the timetable data for an employee."""
     semester = Semester.get_current_semester()
-    groups = Group.objects.filter(teacher=employee, course__semester=semester).select_related(
-        'teacher', 'teacher__user', 'course').prefetch_related(
-            'term', 'term__classrooms', 'guaranteed_spots', 'guaranteed_spots__role')
+    groups = Group.objects.filter(teacher=employee, course__semester=semester)
     group_dicts = build_group_list(groups)
     data = {
         'groups_dicts': group_dicts,
@@ -130,6 +91,8 @@ def my_timetable(request):
         data.update(student_timetable_data(request.user.student))
     if request.user.employee:
         data.update(employee_timetable_data(request.user.employee))
+    data['calendar_feed_url'] = request.build_absolute_uri(
+        reverse('calendar-feed', args=(CalendarToken.for_user(request.user).token,)))
 
     return render(request, 'timetable/timetable.html', data)
 
@@ -144,10 +107,7 @@ def my_prototype(request):
     records = Record.objects.filter(
         student=student,
         group__course__semester=semester).exclude(status=RecordStatus.REMOVED).select_related(
-            'group__teacher', 'group__teacher__user',
-            'group__course', 'group__course__semester').prefetch_related(
-                'group__term', 'group__term__classrooms', 'group__guaranteed_spots',
-                'group__guaranteed_spots__role')
+            'group__course', 'group__course__semester')
     pinned = Pin.student_pins_in_semester(student, semester)
     pinned = list(pinned)
     all_groups_by_id = {r.group_id: r.group for r in records}
@@ -171,25 +131,51 @@ def my_prototype(request):
         group.can_dequeue = can_dequeue_dict.get(group.pk)
 
     group_dicts = build_group_list(all_groups)
-    filters_dict = CourseInstance.prepare_filter_data(
-        CourseInstance.objects.filter(semester=semester))
-    courses_json = list_courses_in_semester(semester)
+    # The courses and the filter data are fetched separately (see
+    # `prototype_catalog`), so that the browser may cache them.
     data = {
         'groups_json': group_dicts,
-        'filters_json': filters_dict,
-        'courses_json': courses_json,
+        'updates_stream_enabled': settings.UPDATES_STREAM_ENABLED,
     }
     return render(request, 'timetable/prototype.html', data)
 
 
+@student_required
+def prototype_catalog(request):
+    """Returns the courses of the prototype's semester and the filter data.
+
+    The payload is served from the cache already compressed. The response
+    carries an ETag and must be revalidated, so the browser downloads it again
+    only after the courses are edited.
+    """
+    semester = Semester.get_upcoming_semester()
+    courses = catalog.get_catalog(semester.pk if semester else None, catalog.PROTOTYPE)
+    response = get_conditional_response(request, etag=courses.etag)
+    if response is not None:
+        return response
+    if ACCEPTS_GZIP.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+        response = HttpResponse(courses.compressed, content_type='application/json')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(gzip.decompress(courses.compressed),
+                                content_type='application/json')
+    response['ETag'] = courses.etag
+    patch_vary_headers(response, ('Accept-Encoding',))
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
 @student_required
 @require_POST
+@admission_control
 def prototype_action(request, group_id):
     """Performs actions requested by timetable prototype.
 
     HTTP response 204 (successful with no content to send back) will be returned
     if the pin operation is performed with no obstacles. If the student is not
     allowed to perform an operation, 403 (forbidden) status shall be returned.
+    When the system is overloaded, 429 (too many requests) is returned with
+    the number of milliseconds to wait before retrying (see `admission.py`).
     """
     student = request.user.student
     group: Group
@@ -221,14 +207,45 @@ def prototype_action(request, group_id):
     return HttpResponse(status=400, content=action)
 
 
+@student_required
+@require_POST
+@admission_control
+def prototype_checkout(request):
+    """Enqueues the student into many groups at once.
+
+    The JSON body is a list of objects with a group `id` and an optional queue
+    `priority`. Instead of one `prototype_action` per group, all the checks are
+    made and all the records are created together (see
+    `Record.enqueue_student_into_groups`). The response lists for every group
+    whether the student is now in its queue (or already was). An invalid body
+    gets 400 (bad request).
+    """
+    student = request.user.student
+    # Axios sends POST data in json rather than _Form-Encoded_.
+    try:
+        data = json.loads(request.body.decode('utf-8'))
+        group_ids = [int(item['id']) for item in data]
+        priorities = {
+            int(item['id']): int(item['priority']) for item in data if 'priority' in item
+        }
+    except (ValueError, TypeError, KeyError):
+        return HttpResponse(status=400)
+    if not all(1 <= priority <= 10 for priority in priorities.values()):
+        return HttpResponse(status=400)
+    groups = Group.objects.filter(pk__in=group_ids).select_related('course', 'course__semester')
+    results = Record.enqueue_student_into_groups(student, list(groups), priorities)
+    return JsonResponse([{
+        'group_id': group_id,
+        'enqueued': results.get(group_id, False),
+    } for group_id in dict.fromkeys(group_ids)], safe=False)
+
+
 @student_required
 def prototype_get_course(request, course_id):
     """Retrieves the annotated groups of a single course."""
     student = request.user.student
     course = CourseInstance.objects.get(pk=course_id)
-    groups = course.groups.exclude(extra='hidden').select_related(
-        'course', 'teacher', 'course__semester', 'teacher__user'
-    ).prefetch_related('term', 'term__classrooms', 'guaranteed_spots', 'guaranteed_spots__role')
+    groups = course.groups.exclude(extra='hidden').select_related('course', 'course__semester')
     can_enqueue_dict = Record.can_enqueue_groups(student, groups)
     can_dequeue_dict = Record.can_dequeue_groups(student, groups)
     for group in groups:
@@ -249,60 +266,121 @@ def prototype_update_groups(request):
     semester = Semester.get_upcoming_semester()
     # Axios sends POST data in json rather than _Form-Encoded_.
     ids: List[int] = json.loads(request.body.decode('utf-8'))
-    num_enrolled = Count('record', filter=Q(record__status=RecordStatus.ENROLLED))
-    is_enrolled = Count(
-        'record',
-        filter=(Q(record__status=RecordStatus.ENROLLED, record__student_id=student.pk)))
-    is_enqueued = Count(
-        'record',
-        filter=(Q(record__status=RecordStatus.QUEUED, record__student_id=student.pk)))
-
-    groups_from_ids = Group.objects.filter(pk__in=ids)
-    groups_enrolled_or_enqueued = Group.objects.filter(
-        course__semester=semester,
-        record__status__in=[RecordStatus.QUEUED, RecordStatus.ENROLLED],
-        record__student=student)
-    groups_all = groups_from_ids | groups_enrolled_or_enqueued
-    groups = groups_all.annotate(num_enrolled=num_enrolled).annotate(
-        is_enrolled=is_enrolled).annotate(is_enqueued=is_enqueued).select_related(
-            'course', 'teacher', 'course__semester', 'teacher__user').prefetch_related(
-                'term', 'term__classrooms', 'guaranteed_spots', 'guaranteed_spots__role')
+
+    # The student's groups are found with a subquery rather than a join, so
+    # that the records are read using the index on the student.
+    groups_enrolled_or_enqueued = Record.objects.filter(
+        student=student, status__in=[RecordStatus.QUEUED, RecordStatus.ENROLLED],
+        group__course__semester=semester).values('group_id')
+    groups_all = Group.objects.filter(Q(pk__in=ids) | Q(pk__in=groups_enrolled_or_enqueued))
+    groups = groups_all.select_related('course', 'course__semester')
+    # The numbers of enrolled students come from the group counters (see
+    # `Record.groups_stats`), so the records need not be aggregated here.
+    groups = Record.is_recorded_in_groups(student, groups)
 
     can_enqueue_dict = Record.can_enqueue_groups(student, groups)
     can_dequeue_dict = Record.can_dequeue_groups(student, groups)
     for group in groups:
         group.can_enqueue = can_enqueue_dict.get(group.pk)
         group.can_dequeue = can_dequeue_dict.get(group.pk)
-        group.is_enqueued = bool(group.is_enqueued)
-        group.is_enrolled = bool(group.is_enrolled)
+        group.is_enqueued = getattr(group, 'is_enqueued', False)
+        group.is_enrolled = getattr(group, 'is_enrolled', False)
     group_dicts = build_group_list(groups)
     return JsonResponse(group_dicts, safe=False)
 
 
+@student_required
+def prototype_updates(request):
+    """Streams the changes of groups to the prototype as Server-Sent Events.
+
+    The numbers of students in all the changed groups are sent, and the
+    student is told when his own records change (see `updates.stream`). The
+    stream ends after UPDATES_STREAM_DURATION seconds and the browser
+    reconnects, sending the id of the last event it has seen. Unless
+    UPDATES_STREAM_ENABLED is set, the stream is not served at all.
+    """
+    if not settings.UPDATES_STREAM_ENABLED:
+        raise Http404
+    last_id = request.headers.get('Last-Event-ID')
+    if last_id is not None and not EVENT_ID.fullmatch(last_id):
+        last_id = None
+    response = StreamingHttpResponse(
+        updates.stream(request.user.student.pk, last_id, settings.UPDATES_STREAM_DURATION),
+        content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Tells nginx not to buffer the events.
+    response['X-Accel-Buffering'] = 'no'
+    # The stream does not need the database. The connection would otherwise
+    # be held until the stream ends.
+    if not connection.in_atomic_block:
+        connection.close()
+    return response
+
+
+@student_required
+def prototype_queue_positions(request):
+    """Tells the student where he stands in the queues he is waiting in.
+
+    This is meant to be polled during the enrollment instead of reloading
+    course pages. For every group of the upcoming semester the student is
+    enqueued into, his position in the queue and the free spots in the group
+    are returned (see `Record.queue_positions`).
+    """
+    semester = Semester.get_upcoming_semester()
+    positions = Record.queue_positions(request.user.student, semester)
+    return JsonResponse([{
+        'group_id': group_id,
+        **position
+    } for group_id, position in positions.items()], safe=False)
+
+
+@student_required
+@require_POST
+def prototype_solve(request):
+    """Finds timetables of the chosen courses without collisions.
+
+    The JSON body is an object with the ids of the `courses`, and optionally
+    the days of the week to keep free (`free_days`, see `DAYS_OF_WEEK`) and
+    the number of timetables to return (`limit`). The response lists the best
+    timetables (see `solver.find_timetables`), each with its group ids and the
+    estimated chance of getting into all of them. An invalid body gets 400.
+    """
+    try:
+        data = json.loads(request.body.decode('utf-8'))
+        course_ids = [int(course_id) for course_id in data['courses']]
+        free_days = [str(day) for day in data.get('free_days', [])]
+        limit = int(data.get('limit', 5))
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return HttpResponse(status=400)
+    if not set(free_days) <= {day for day, _ in DAYS_OF_WEEK} or not 1 <= limit <= MAX_TIMETABLES:
+        return HttpResponse(status=400)
+    timetables = solver.find_timetables(request.user.student, course_ids, free_days, limit)
+    return JsonResponse([{
+        'groups': timetable.group_ids,
+        'chance': timetable.chance,
+    } for timetable in timetables], safe=False)
+
+
+def _calendar_response(user) -> StreamingHttpResponse:
+    response = StreamingHttpResponse(
+        ical.user_calendar(user), content_type='text/calendar; charset=utf-8')
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
 @login_required
 def calendar_export(request):
     """Exports user's timetable for import in Google Calendar."""
-    semester = Semester.get_upcoming_semester()
-    groups = Group.objects.filter(course__semester=semester).filter(
-        Q(teacher__user=request.user) | Q(record__student__user=request.user, record__status=RecordStatus.ENROLLED))
-    terms = SchTerm.objects.filter(event__group__in=groups).select_related(
-        'event__group', 'event__group__course', 'event__group__teacher',
-        'event__group__teacher__user', 'room')
-
-    response = HttpResponse(content_type='text/csv')
-    response['Content-disposition'] = 'attachment; filename="calendar.csv"'
-    writer = csv.writer(response)
-    writer.writerow(
-        ['Subject', 'Start Date', 'Start Time', 'End Date', 'End Time', 'Location', 'Description'])
-    for term in terms:
-        group = term.event.group
-        if not term.room:
-            classroom = "Zajęcia zdalne"
-        else:
-            classroom = f"Sala {term.room}"
-
-        name = f"{group.course.name} - {group.get_type_display()}"
-        location = f"{classroom}, Instytut Informatyki Uniwersytetu Wrocławskiego"
-        description = f"Prowadzący: {group.get_teacher_full_name()}"
-        writer.writerow([name, term.day, term.start, term.day, term.end, location, description])
+    response = _calendar_response(request.user)
+    response['Content-Disposition'] = 'attachment; filename="plan.ics"'
     return response
+
+
+def calendar_feed(request, token):
+    """Serves user's timetable to the calendar apps subscribed to it.
+
+    The calendar apps do not log in, so the user is identified by the secret
+    token in the URL (see `CalendarToken`).
+    """
+    calendar_token = get_object_or_404(CalendarToken.objects.select_related('user'), token=token)
+    return _calendar_response(calendar_token.user)
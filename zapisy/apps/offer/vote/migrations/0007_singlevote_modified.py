@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-18 09:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vote', '0006_auto_20190812_1025'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='singlevote',
+            name='modified',
+            field=models.DateTimeField(auto_now=True, verbose_name='ostatnia zmiana'),
+        ),
+    ]
@@ -48,6 +48,9 @@ class SingleVote(models.Model):
     value = models.PositiveSmallIntegerField("przyznane punkty", choices=VALUE_CHOICES, default=0)
     correction = models.PositiveSmallIntegerField(
         "punkty przyznane w korekcie", choices=VALUE_CHOICES, default=0)
+    # Lets the enrollment recompute only the opening times affected by changed
+    # votes.
+    modified = models.DateTimeField("ostatnia zmiana", auto_now=True)
 
     objects = SingleVoteQuerySet.as_manager()
 
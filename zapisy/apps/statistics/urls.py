@@ -5,4 +5,5 @@ from . import views
 urlpatterns = [
     path('students/', views.students, name='students'),
     path('groups/', views.groups, name='groups'),
+    path('waiting/<int:course_id>/', views.waiting_students, name='waiting-students'),
 ]
@@ -1,11 +1,11 @@
 from django.contrib.auth.decorators import permission_required
 from django.db import models
-from django.shortcuts import render
+from django.shortcuts import get_object_or_404, render
 
 from apps.enrollment.courses.models.course_instance import CourseInstance
 from apps.enrollment.courses.models.group import Group
 from apps.enrollment.courses.models.semester import Semester
-from apps.enrollment.records.models import RecordStatus
+from apps.enrollment.records.models import waiting
 from apps.enrollment.records.models.records import Record
 from apps.users.models import Student
 
@@ -28,20 +28,36 @@ def students(request):
 @permission_required('courses.view_stats')
 def groups(request):
     semester = Semester.get_upcoming_semester()
-    enrolled_agg = models.Count(
-        'record', filter=models.Q(record__status=RecordStatus.ENROLLED), distinct=True)
-    queued_agg = models.Count(
-        'record', filter=models.Q(record__status=RecordStatus.QUEUED), distinct=True)
-    pinned_agg = models.Count('pin', distinct=True)
+    pinned_agg = models.Count('pin')
 
     groups = Group.objects.filter(course__semester=semester).select_related(
         'course', 'teacher', 'teacher__user').order_by('course', 'type').only(
             'course__name', 'teacher__user__first_name', 'teacher__user__last_name', 'limit',
-            'type').prefetch_related('guaranteed_spots', 'guaranteed_spots__role').annotate(
-                enrolled=enrolled_agg).annotate(queued=queued_agg).annotate(pinned=pinned_agg)
-    waiting_students = Record.list_waiting_students(
-        CourseInstance.objects.filter(semester=semester))
+            'type').prefetch_related('guaranteed_spots', 'guaranteed_spots__role').annotate(pinned=pinned_agg)
+    # Occupancy of guaranteed spots is computed for all the groups at once.
+    groups = list(groups)
+    free_spots = Record.free_spots_by_role_in_groups(groups)
+    stats = Record.groups_stats(groups)
+    for group in groups:
+        group.enrolled = stats[group.pk]['num_enrolled']
+        group.queued = stats[group.pk]['num_enqueued']
+        group.guaranteed_spots_taken = [
+            (gs, gs.limit - free_spots[group.pk][gs.role.name])
+            for gs in group.guaranteed_spots.all()
+        ]
+    waiting_students = waiting.get_semester_counts(semester.pk) if semester else {}
     return render(request, 'statistics/groups_list.html', {
         'groups': groups,
         'waiting_students': waiting_students,
     })
+
+
+@permission_required('courses.view_stats')
+def waiting_students(request, course_id):
+    """Lists the students waiting for places in the course by group type."""
+    course = get_object_or_404(CourseInstance, pk=course_id)
+    by_type = waiting.waiting_students_by_type([course]).get(course.pk, {})
+    return render(request, 'statistics/waiting_students.html', {
+        'course': course,
+        'waiting_students': sorted(by_type.items()),
+    })
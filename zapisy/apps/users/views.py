@@ -62,10 +62,7 @@ def students_view(request, user_id: int = None):
 
         records = Record.objects.filter(student=student,
                                         group__course__semester=semester,
-                                        status=RecordStatus.ENROLLED).select_related(
-                                            'group__teacher', 'group__teacher__user',
-                                            'group__course').prefetch_related(
-                                                'group__term', 'group__term__classrooms')
+                                        status=RecordStatus.ENROLLED).select_related('group')
         groups = [r.group for r in records]
 
         # Highlight groups shared with the viewer in green.
@@ -107,11 +104,7 @@ def employees_view(request, user_id: int = None):
             raise Http404
 
         semester = Semester.get_upcoming_semester()
-        groups = Group.objects.filter(course__semester_id=semester.pk,
-                                      teacher=employee).select_related(
-                                          'teacher', 'teacher__user', 'course').prefetch_related(
-                                              'term', 'term__classrooms')
-        groups = list(groups)
+        groups = list(Group.objects.filter(course__semester_id=semester.pk, teacher=employee))
 
         # Highlight groups shared with the viewer in green.
         viewer_groups = Record.common_groups(request.user, groups)
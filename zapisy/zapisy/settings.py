@@ -285,6 +285,41 @@ ECTS_BONUS = 2
 # Then, after abolition time, students can enroll into some additional courses.
 ECTS_INITIAL_LIMIT = 35
 ECTS_FINAL_LIMIT = 45
+# How long (in seconds) students' opening times are kept in the cache. They are
+# invalidated when recomputed anyway.
+OPENING_TIMES_CACHE_TIMEOUT = 60 * 60
+# How long (in seconds) the numbers of students waiting for places in courses
+# are kept in the cache. They are invalidated when any record changes anyway.
+WAITING_STUDENTS_CACHE_TIMEOUT = 60 * 60
+# How long (in seconds) the serialized course lists (see
+# apps/enrollment/courses/models/catalog.py) are kept in the cache. They are
+# invalidated when courses are edited anyway, except for the owners' names.
+COURSE_CATALOG_CACHE_TIMEOUT = 60 * 60
+# How long (in seconds) the iCalendar feeds of the timetables (see
+# apps/enrollment/timetable/ical.py) are kept in the cache. They are invalidated
+# when terms, groups or days off change anyway, except for the teachers' names.
+CALENDAR_CACHE_TIMEOUT = 60 * 60
+# Admission control of the enrollment actions (see
+# apps/enrollment/records/admission.py). Every user may perform a burst of
+# ADMISSION_BUCKET_SIZE actions, and then ADMISSION_REFILL_RATE actions per
+# second. At most ADMISSION_MAX_CONCURRENT actions are processed at the same
+# time, which must stay well below the number of database connections.
+ADMISSION_BUCKET_SIZE = env.int('ADMISSION_BUCKET_SIZE', default=10)
+ADMISSION_REFILL_RATE = env.float('ADMISSION_REFILL_RATE', default=2.0)
+ADMISSION_MAX_CONCURRENT = env.int('ADMISSION_MAX_CONCURRENT', default=40)
+# How long (in milliseconds) the client is asked to wait when all the slots
+# are taken.
+ADMISSION_RETRY_MS = 300
+# The prototype may listen to the changes of groups over a stream of Server-Sent
+# Events (see apps/enrollment/records/updates.py). Every open stream holds a
+# worker for UPDATES_STREAM_DURATION seconds, so it may only be enabled when
+# gunicorn runs an asynchronous worker class (e.g. gevent) with a timeout longer
+# than that. Otherwise the prototype polls for the changes every minute. The
+# browser reconnects when a stream ends. A comment is sent every
+# UPDATES_KEEPALIVE seconds, so that idle streams are not cut by proxies.
+UPDATES_STREAM_ENABLED = env.bool('UPDATES_STREAM_ENABLED', default=False)
+UPDATES_STREAM_DURATION = 55
+UPDATES_KEEPALIVE = 15
 
 VOTE_LIMIT = 60
 